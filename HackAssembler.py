@@ -1,48 +1,184 @@
 import argparse
+import glob
 import os
 import sys
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
 
-from hackassembler.assembler import Assembler
-from hackassembler.errors import AssemblerError
+from hackassembler import instructions, romio
+from hackassembler.assembler import Assembler, AssemblyContext
+from hackassembler.controlflow import ControlFlowOptimizer
+from hackassembler.objectfile import OBJECT_EXTENSION
+from hackassembler.parallel import assemble_parallel
+from hackassembler.peephole import PeepholeOptimizer
 
+OUTPUT_FORMATS = {"hack": romio.HACK_EXTENSION, "hackbin": romio.HACKBIN_EXTENSION, "hobj": OBJECT_EXTENSION}
+MANIFEST_COMMENT = "#"
 
-def assemble(input_file: str, output_file: str):
+
+def assemble(input_file: str, output_file: str, with_symbols: bool = False, parallel_workers: int = 0,
+             optimize: bool = False):
+    if not optimize and parallel_workers == 0:
+        # The lines are streamed from the open file
+        with open(input_file, 'r') as asm_file:
+            assemble_lines(asm_file, output_file, with_symbols)
+        return
+
+    if optimize:
+        lines = optimize_file(input_file)
+    else:
+        with open(input_file, 'r') as asm_file:
+            lines = asm_file.readlines()
+
+    if parallel_workers > 0:
+        commands, symbols = assemble_parallel(lines, max_workers=parallel_workers)
+        romio.write_rom(commands, output_file, symbols if with_symbols else None)
+        return
+
+    assemble_lines(lines, output_file, with_symbols)
+
+
+def assemble_lines(lines: Iterable[str], output_file: str, with_symbols: bool):
     asm = Assembler()
+    context = AssemblyContext()
+    if output_file.endswith(OBJECT_EXTENSION):
+        obj = asm.assemble_object(lines, context)
+        with open(output_file, 'w') as object_file:
+            obj.write(object_file)
+        return
+
+    commands = asm.assemble_to_array(lines, context)
+    symbols = romio.collect_symbols(context.symbol_manager) if with_symbols else None
+    romio.write_rom(commands, output_file, symbols)
+
+
+def optimize_file(input_file: str) -> list[str]:
     with open(input_file, 'r') as asm_file:
-        lines = asm_file.readlines()
+        program = instructions.parse_program(asm_file)
+
+    control_flow_optimizer = ControlFlowOptimizer()
+    program = control_flow_optimizer.optimize(program)
+    peephole_optimizer = PeepholeOptimizer()
+    program = peephole_optimizer.optimize(program)
+    print(f"Optimized {input_file}:\n{control_flow_optimizer.report()}\n{peephole_optimizer.report()}")
+    return instructions.format_program(program).splitlines()
+
+
+def assemble_job(input_file: str, output_file: str, with_symbols: bool, parallel_workers: int,
+                 optimize: bool) -> Optional[str]:
+    """
+    Assembles a single file of a batch.
 
+    :return: None on success, or the formatted error
+    """
     try:
-        output = asm.assemble(lines)
-    except AssemblerError:
-        traceback.print_exc()
-        sys.exit(1)
+        assemble(input_file, output_file, with_symbols, parallel_workers, optimize)
+    except Exception:
+        # A file that can't be read or assembled only fails itself, not the rest of the batch
+        return traceback.format_exc()
+    return None
+
+
+def collect_input_files(inputs: list[str], manifest: Optional[str]) -> list[str]:
+    input_paths = list(inputs)
+    if manifest is not None:
+        if not os.path.isfile(manifest):
+            print(f"Error: Manifest '{manifest}' does not exist.")
+            sys.exit(2)
+        input_paths.extend(read_manifest(manifest))
+
+    input_files = []
+    for input_path in input_paths:
+        if os.path.isdir(input_path):
+            found = sorted(glob.iglob("**/*.asm", root_dir=input_path, recursive=True))
+            if not found:
+                print(f"Error: Could not find any .asm files in '{input_path}'.")
+                sys.exit(2)
+            input_files.extend(os.path.join(input_path, file_name) for file_name in found)
+            continue
+
+        if not input_path.endswith(".asm"):
+            print(f"Error: Input file '{input_path}' must have a .asm extension.")
+            sys.exit(3)
+
+        if not os.path.isfile(input_path):
+            print(f"Error: File '{input_path}' does not exist.")
+            sys.exit(2)
 
-    with open(output_file, 'w') as hack_file:
-        hack_file.writelines(output)
+        input_files.append(input_path)
+    return input_files
 
-    print(f"Successfully assembled: {output_file}")
+
+def read_manifest(manifest: str) -> list[str]:
+    # One path per line, relative to the manifest's folder
+    base_dir = os.path.dirname(manifest)
+    paths = []
+    with open(manifest, 'r') as manifest_file:
+        for line in manifest_file:
+            line = line.split(MANIFEST_COMMENT, 1)[0].strip()
+            if line != "":
+                paths.append(os.path.join(base_dir, line))
+    return paths
 
 
 def main():
     parser = argparse.ArgumentParser(description="HackAssembler - Convert .asm to .hack binary.")
-    parser.add_argument("input", help="Input .asm file (Hack assembly code)")
+    parser.add_argument("inputs", nargs="*",
+                        help="Input .asm files (Hack assembly code) or directories containing .asm files")
+    parser.add_argument("--manifest", help="A file listing more inputs, one per line")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of processes assembling different files at once")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="hack",
+                        help="Output format: textual .hack, a raw 16-bit .hackbin ROM image "
+                             "or a relocatable .hobj object file for HackLinker.py")
+    parser.add_argument("--symbols", action="store_true",
+                        help="Add a symbol section with the labels and variables to a .hackbin output")
+    parser.add_argument("--parallel", type=int, default=0, metavar="WORKERS",
+                        help="Split each file into chunks and assemble them in a pool of WORKERS processes")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="Run the control flow and peephole optimizers on the assembly, "
+                             "and print what each of them changed")
     args = parser.parse_args()
 
-    input_path = args.input
+    if not args.inputs and args.manifest is None:
+        parser.error("No input files were given")
+
+    if args.symbols and args.format != "hackbin":
+        print("Error: --symbols only applies to the hackbin format.")
+        sys.exit(3)
 
-    if not input_path.endswith(".asm"):
-        print("Error: Input file must have a .asm extension.")
+    if args.parallel > 0 and (args.format == "hobj" or args.jobs > 1):
+        print("Error: --parallel cannot produce an object file, nor be combined with --jobs.")
         sys.exit(3)
 
-    if not os.path.isfile(input_path):
-        print(f"Error: File '{input_path}' does not exist.")
-        sys.exit(2)
+    input_files = collect_input_files(args.inputs, args.manifest)
+    # Derive output file names by replacing .asm with the format's extension
+    output_files = [os.path.splitext(input_file)[0] + OUTPUT_FORMATS[args.format] for input_file in input_files]
 
-    # Derive output file name by replacing .asm with .hack
-    output_path = input_path.replace(".asm", ".hack")
+    n_files = len(input_files)
+    job_args = (input_files, output_files, [args.symbols] * n_files, [args.parallel] * n_files,
+                [args.optimize] * n_files)
+    if args.jobs > 1 and len(input_files) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            errors = list(executor.map(assemble_job, *job_args))
+    else:
+        errors = list(map(assemble_job, *job_args))
 
-    assemble(input_path, output_path)
+    failed = 0
+    for input_file, output_file, error in zip(input_files, output_files, errors):
+        if error is None:
+            print(f"Successfully assembled: {output_file}")
+        else:
+            failed += 1
+            print(f"Failed to assemble: {input_file}")
+            print(error, file=sys.stderr)
+
+    if len(input_files) > 1:
+        print(f"Assembled {len(input_files) - failed} of {len(input_files)} files, {failed} failed.")
+
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import traceback
+
+from hackassembler import romio
+from hackassembler.disassembler import disassemble
+from hackassembler.errors import RomFormatError
+
+ROM_EXTENSIONS = (romio.HACK_EXTENSION, romio.HACKBIN_EXTENSION)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HackDisassembler - Convert a .hack or .hackbin ROM to assembly.")
+    parser.add_argument("input", help="Input .hack or .hackbin file")
+    parser.add_argument("-o", "--output", help="Output .asm file, prints to the screen if not given")
+    parser.add_argument("--symbols",
+                        help="A .hackbin file with a symbol section, used to restore labels and variable names. "
+                             "By default the symbols of a .hackbin input are used.")
+    args = parser.parse_args()
+
+    input_path = args.input
+    if not input_path.endswith(ROM_EXTENSIONS):
+        print("Error: Input file must have a .hack or .hackbin extension.")
+        sys.exit(3)
+
+    for path in (input_path, args.symbols):
+        if path is not None and not os.path.isfile(path):
+            print(f"Error: File '{path}' does not exist.")
+            sys.exit(2)
+
+    try:
+        words = romio.load_rom_array(input_path)
+        symbols = None
+        symbols_path = args.symbols or (input_path if input_path.endswith(romio.HACKBIN_EXTENSION) else None)
+        if symbols_path is not None:
+            with open(symbols_path, 'rb') as symbols_file:
+                _, symbols = romio.read_hackbin(symbols_file)
+    except RomFormatError:
+        traceback.print_exc()
+        sys.exit(1)
+
+    code = "\n".join(disassemble(words, symbols)) + "\n"
+    if args.output is None:
+        sys.stdout.write(code)
+    else:
+        with open(args.output, 'w') as asm_file:
+            asm_file.write(code)
+        print(f"Successfully disassembled: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import traceback
+
+from hackassembler import romio
+from hackassembler.assembler import Assembler
+from hackassembler.errors import AssemblerError, LinkerError, RomFormatError
+from hackassembler.linker import Linker
+from hackassembler.objectfile import ObjectFile, OBJECT_EXTENSION
+from vmtranslator.asmgenerator import AsmGenerator
+
+
+def link(input_files: list[str], output_file: str, with_bootstrap: bool, with_symbols: bool):
+    objects = []
+    try:
+        if with_bootstrap:
+            bootstrap = AsmGenerator().generate_init()
+            objects.append(Assembler().assemble_object(bootstrap.splitlines()))
+
+        for input_file in input_files:
+            with open(input_file, 'r') as object_file:
+                objects.append(ObjectFile.read(object_file))
+
+        linker = Linker()
+        code = linker.link(objects)
+    except (AssemblerError, LinkerError, RomFormatError):
+        traceback.print_exc()
+        sys.exit(1)
+
+    romio.write_rom(code, output_file, linker.symbols if with_symbols else None)
+    print(f"Successfully linked: {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HackLinker - Link .hobj object files into a ROM.")
+    parser.add_argument("inputs", nargs="+", help="Input .hobj files, placed in the ROM in the given order")
+    parser.add_argument("-o", "--output", required=True, help="Output .hack or .hackbin file")
+    parser.add_argument("--bootstrap", action="store_true",
+                        help="Place the VM translator bootstrap code, which calls Sys.init, first")
+    parser.add_argument("--symbols", action="store_true",
+                        help="Add a symbol section with the labels and variables to a .hackbin output")
+    args = parser.parse_args()
+
+    for input_path in args.inputs:
+        if not input_path.endswith(OBJECT_EXTENSION):
+            print(f"Error: Input file '{input_path}' must have a {OBJECT_EXTENSION} extension.")
+            sys.exit(3)
+
+        if not os.path.isfile(input_path):
+            print(f"Error: File '{input_path}' does not exist.")
+            sys.exit(2)
+
+    link(args.inputs, args.output, args.bootstrap, args.symbols)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ def main():
     parser = argparse.ArgumentParser(
         description="JackCompiler - Convert .jack file(s) to .vm output.")
     parser.add_argument("input", help="Input .jack file or a directory containing .jack files")
+    parser.add_argument("--binary", action="store_true",
+                        help="Write compact .vmb bytecode instead of .vm text, which VMTranslator loads directly")
     args = parser.parse_args()
 
     input_path = args.input
@@ -21,9 +23,9 @@ def main():
 
     try:
         if os.path.isdir(input_path):
-            analyze_folder(input_path)
+            analyze_folder(input_path, args.binary)
         elif input_path.endswith(".jack") and os.path.isfile(input_path):
-            analyze_file(input_path)
+            analyze_file(input_path, args.binary)
         else:
             print("Error: Input must be a .jack file or a directory containing .jack files.")
             sys.exit(3)
@@ -34,25 +36,25 @@ def main():
     print(f"Compilation ended successfully.")
 
 
-def analyze_folder(folder_path):
+def analyze_folder(folder_path, binary=False):
     translated_files = 0
     for file_name in glob.iglob("**/*.jack", root_dir=folder_path, recursive=True):
         translated_files += 1
         file_path = os.path.join(folder_path, file_name)
-        analyze_file(file_path)
+        analyze_file(file_path, binary)
 
     if translated_files == 0:
         print("Error: Could not find any .jack files in the folder.")
         exit(4)
 
 
-def analyze_file(file_path):
+def analyze_file(file_path, binary=False):
     print(f"Compiling {file_path}")
-    output_file = file_path.replace(".jack", ".vm")
+    output_file = os.path.splitext(file_path)[0] + (".vmb" if binary else ".vm")
 
     with open(file_path, 'r') as jack_file:
-        with open(output_file, 'w') as vm_file:
-            compiler = jackcompiler.JackCompiler(jack_file, vm_file)
+        with open(output_file, 'wb' if binary else 'w') as vm_file:
+            compiler = jackcompiler.JackCompiler(jack_file, vm_file, binary)
             compiler.compile()
 
 
@@ -1,37 +1,142 @@
 import argparse
+import json
 import os
 import sys
 import traceback
 
-from vmtranslator import vmtranslator
+from hackassembler.errors import AssemblerError
+from vmtranslator import codesize, hackbackend, inliner, vmtranslator
+from vmtranslator.deadcode import DeadFunctionEliminator
 from vmtranslator.errors import TranslatorError
+from vmtranslator.layout import ExecutionProfile, ProfileLayout
+from vmtranslator.optimizer import VMOptimizer
+from vmtranslator.translationcache import DEFAULT_CACHE_DIR, TranslationCache
 
 
 def main():
     parser = argparse.ArgumentParser(
-        description="VMTranslator - Convert .vm file(s) to .asm assembly output.")
-    parser.add_argument("input", help="Input .vm file or a directory containing .vm files")
+        description="VMTranslator - Convert .vm file(s) to .asm assembly output, or straight to machine code.")
+    parser.add_argument("input", help="Input .vm or .vmb file or a directory containing .vm and .vmb files")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="Fold constants and merge push/pop pairs before translating")
+    parser.add_argument("--report", action="store_true",
+                        help="Print how many VM commands each optimization removed (implies -O)")
+    parser.add_argument("--whole-program", action="store_true",
+                        help="Translate only the functions of a directory that Sys.init can reach, "
+                             "and print the functions that were removed")
+    parser.add_argument("--inline", action="store_true",
+                        help="Replace the calls to small functions of a directory with their code")
+    parser.add_argument("--inline-max-size", type=int, default=inliner.DEFAULT_MAX_SIZE,
+                        help="Only inline functions with at most this many commands")
+    parser.add_argument("--inline-budget", type=int, default=inliner.DEFAULT_MAX_GROWTH,
+                        help="Stop inlining when the program grew by this many commands")
+    parser.add_argument("--always-inline", action="append", default=[], metavar="FUNCTION",
+                        help="Inline this function whatever its size, can be given more than once")
+    parser.add_argument("--never-inline", action="append", default=[], metavar="FUNCTION",
+                        help="Never inline this function, can be given more than once")
+    parser.add_argument("--profile", metavar="PROFILE_JSON",
+                        help="Order the functions and blocks of a directory so the hot paths fall through, "
+                             "and prefer inlining the hot functions, by a profile of how often they ran")
+    parser.add_argument("--shared-routines", action="store_true",
+                        help="Generate call, return and comparison code once and jump to it, "
+                             "which makes the output smaller but slower")
+    parser.add_argument("--cache-top", action="store_true",
+                        help="Keep the top of the stack in the D register between commands")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of processes translating the files of a directory at once")
+    parser.add_argument("--threads", action="store_true",
+                        help="Translate the files of a directory in threads instead of processes, "
+                             "which run at once on a free-threaded Python")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Translate every file of a directory, instead of reusing the translations "
+                             "of files that didn't change")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Where the translations of the files of a directory are kept")
+    parser.add_argument("--format", choices=["asm", "hack", "hackbin"], default="asm",
+                        help="Output format. hack and hackbin are assembled in memory, without writing the assembly")
+    parser.add_argument("--asm", action="store_true",
+                        help="Also write the assembly when the output format is hack or hackbin")
+    parser.add_argument("--sizes", choices=codesize.GROUPS,
+                        help="Print how many words of ROM the code of every function, file or kind of command takes")
+    parser.add_argument("--sizes-sort", choices=codesize.SORT_KEYS, default="words",
+                        help="The order of the rows printed by --sizes")
+    parser.add_argument("--sizes-json", metavar="JSON_FILE",
+                        help="Write the words of ROM that every kind of command takes in every function to this file")
     args = parser.parse_args()
 
+    optimizer = VMOptimizer() if args.optimize or args.report else None
+    # The sizes cost little to count, so they are always counted to warn about code that won't fit in the ROM
+    stats = codesize.CodeSizeStats()
+    options = dict(optimizer=optimizer, shared_routines=args.shared_routines, cache_top=args.cache_top, stats=stats)
+    eliminator = DeadFunctionEliminator() if args.whole_program else None
+    profile = None
+    layout = None
+    if args.profile is not None:
+        try:
+            with open(args.profile) as f:
+                profile = ExecutionProfile.read(f)
+        except (OSError, TranslatorError) as e:
+            print(f"Error: Could not read the profile: {e}")
+            sys.exit(1)
+        layout = ProfileLayout(profile)
+    vm_inliner = None
+    if args.inline:
+        vm_inliner = inliner.VMInliner(args.inline_max_size, args.inline_budget,
+                                       args.always_inline, args.never_inline, profile)
+
     input_path = args.input
 
     if not os.path.exists(input_path):
         print(f"Error: '{input_path}' does not exist.")
         sys.exit(2)
 
+    if os.path.isdir(input_path):
+        input_path = os.path.normpath(input_path)
+        output_base = os.path.join(input_path, os.path.basename(input_path))
+    elif input_path.endswith((".vm", ".vmb")) and os.path.isfile(input_path):
+        output_base = os.path.splitext(input_path)[0]
+    else:
+        print("Error: Input must be a .vm or .vmb file or a directory containing .vm and .vmb files.")
+        sys.exit(3)
+
     try:
-        if os.path.isdir(input_path):
-            output_file = vmtranslator.translate_folder(input_path)
-        elif input_path.endswith(".vm") and os.path.isfile(input_path):
-            output_file = vmtranslator.translate_file(input_path)
+        if args.format == "asm":
+            if os.path.isdir(input_path):
+                cache = None if args.no_cache else TranslationCache(args.cache_dir)
+                output_file = vmtranslator.translate_folder(input_path, max_workers=args.jobs, threads=args.threads,
+                                                            cache=cache, eliminator=eliminator, inliner=vm_inliner,
+                                                            layout=layout, **options)
+            else:
+                output_file = vmtranslator.translate_file(input_path, **options)
         else:
-            print("Error: Input must be a .vm file or a directory containing .vm files.")
-            sys.exit(3)
-    except TranslatorError:
+            output_file = f"{output_base}.{args.format}"
+            asm_file = f"{output_base}.asm" if args.asm else None
+            if os.path.isdir(input_path):
+                hackbackend.build_folder(input_path, output_file, asm_file=asm_file, eliminator=eliminator,
+                                         inliner=vm_inliner, layout=layout, **options)
+            else:
+                hackbackend.build_file(input_path, output_file, asm_file=asm_file, **options)
+    except (TranslatorError, AssemblerError):
         traceback.print_exc()
         sys.exit(1)
 
     print(f"Successfully translated file: {output_file}")
+    if args.report:
+        print(optimizer.report())
+    if layout is not None and os.path.isdir(input_path):
+        print(layout.report())
+    if vm_inliner is not None and os.path.isdir(input_path):
+        print(vm_inliner.report())
+    if eliminator is not None and os.path.isdir(input_path):
+        print(eliminator.report())
+    if args.sizes is not None:
+        print(stats.report(args.sizes, args.sizes_sort))
+    if args.sizes_json is not None:
+        with open(args.sizes_json, 'w') as f:
+            json.dump(stats.to_json(), f, indent=1)
+    warning = stats.warning()
+    if warning is not None:
+        print(warning)
 
 
 if __name__ == "__main__":
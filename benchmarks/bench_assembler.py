@@ -0,0 +1,53 @@
+import argparse
+import time
+
+from benchmarks.generators import generate_asm_program
+from hackassembler import assembler, cparser
+from hackassembler.assembler import Assembler
+
+
+def time_assemble(programs: list[list[str]], repeat: int) -> float:
+    asm = Assembler()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for lines in programs:
+            asm.assemble(lines)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare Assembler.assemble with the C-instruction table and line cache "
+                    "against the plain regex parser.")
+    # A single program must fit in the 32K ROM, so several MiB of input means several programs
+    parser.add_argument("--programs", type=int, default=16, help="Number of generated programs")
+    parser.add_argument("--functions", type=int, default=24, help="Number of VM functions per program")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    programs = [generate_asm_program(args.functions, seed) for seed in range(args.programs)]
+    n_lines = sum(len(lines) for lines in programs)
+    size = sum(len(line) for lines in programs for line in lines)
+    print(f"Generated {args.programs} programs, {n_lines} lines ({size / 2 ** 20:.1f} MiB)")
+
+    fast = time_assemble(programs, args.repeat)
+
+    table_parser = cparser.parse_c_instruction
+    cache_size = assembler.LINE_CACHE_MAX_SIZE
+    cparser.parse_c_instruction = cparser._parse_c_instruction_slow
+    assembler.LINE_CACHE_MAX_SIZE = 0
+    try:
+        slow = time_assemble(programs, args.repeat)
+    finally:
+        cparser.parse_c_instruction = table_parser
+        assembler.LINE_CACHE_MAX_SIZE = cache_size
+
+    print(f"regex parser:  {slow:.3f}s ({n_lines / slow:,.0f} lines/s)")
+    print(f"table + cache: {fast:.3f}s ({n_lines / fast:,.0f} lines/s)")
+    print(f"speedup: {slow / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
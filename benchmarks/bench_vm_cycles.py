@@ -0,0 +1,113 @@
+import argparse
+import glob
+import io
+import os
+
+from benchmarks.generators import OS_PATH
+from benchmarks.hackcpu import HackCPU
+from compiler import jackcompiler
+from hackassembler.assembler import Assembler
+from vmtranslator.asmgenerator import AsmGenerator
+from vmtranslator.optimizer import VMOptimizer
+from vmtranslator.vmtranslator import VMTranslator
+
+# Sys.init calls Main.main after initializing the OS, and the program halts when it returns
+MAIN_PROGRAM = """
+class Main {
+    function void main() {
+        var int i, sum;
+        var Array a;
+        var String s;
+        let a = Array.new(30);
+        let i = 0;
+        while (i < 30) {
+            let a[i] = Math.multiply(i, i + 7) / 3;
+            let i = i + 1;
+        }
+        let sum = 0;
+        let i = 0;
+        while (i < 30) {
+            let sum = sum + Math.sqrt(a[i]);
+            let i = i + 1;
+        }
+        do a.dispose();
+        let s = String.new(6);
+        do s.setInt(sum);
+        do Output.printString(s);
+        do Output.println();
+        do Screen.drawRectangle(100, 100, 140, 120);
+        return;
+    }
+}
+"""
+
+# The static variables, the heap and the screen. The rest of the memory holds the stack and scratch registers,
+# whose stale contents are expected to differ between the modes.
+COMPARED_MEMORY = (slice(16, 256), slice(2048, 24576))
+
+# The whole OS only fits in the ROM with the shared routines, so every mode uses them
+MODES = {
+    "plain": dict(cache_top=False, optimize=False),
+    "cache-top": dict(cache_top=True, optimize=False),
+    "optimized": dict(cache_top=False, optimize=True),
+    "optimized + cache-top": dict(cache_top=True, optimize=True),
+}
+
+
+def compile_jack(code: str) -> str:
+    with io.StringIO(code) as jack_code, io.StringIO() as vm_code:
+        jackcompiler.JackCompiler(jack_code, vm_code).compile()
+        return vm_code.getvalue()
+
+
+def os_vm_files() -> dict[str, str]:
+    vm_files = {}
+    for file_name in sorted(glob.iglob("*.jack", root_dir=OS_PATH)):
+        with open(os.path.join(OS_PATH, file_name)) as jack_file:
+            vm_files[file_name.replace(".jack", ".vm")] = compile_jack(jack_file.read())
+    vm_files["Main.vm"] = compile_jack(MAIN_PROGRAM)
+    return vm_files
+
+
+def translate_program(vm_files: dict[str, str], cache_top: bool, optimize: bool) -> str:
+    asm_generator = AsmGenerator(shared_routines=True, cache_top=cache_top)
+    with io.StringIO() as output:
+        output.write(asm_generator.generate_init())
+        for file_name, code in vm_files.items():
+            asm_generator.set_source_file(file_name)
+            translator = VMTranslator(asm_generator, VMOptimizer() if optimize else None)
+            with io.StringIO(code) as source:
+                translator.translate(source, output)
+        return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the ROM size and the cycles it takes to run the OS with a small Main program, "
+                    "between the VM translator code generation modes.")
+    parser.add_argument("--max-cycles", type=int, default=50_000_000,
+                        help="Stop a run that didn't halt after this many cycles")
+    args = parser.parse_args()
+
+    vm_files = os_vm_files()
+    results = {}
+    print(f"{'mode':<24}{'ROM words':>12}{'cycles':>14}")
+    for name, options in MODES.items():
+        asm = translate_program(vm_files, **options)
+        words = Assembler().assemble_to_array(asm.splitlines())
+        cpu = HackCPU(words)
+        cycles = cpu.run(args.max_cycles)
+        if not cpu.halted:
+            print(f"{name} didn't halt after {cycles} cycles")
+        results[name] = ([cpu.ram[area] for area in COMPARED_MEMORY], cycles)
+        print(f"{name:<24}{len(words):>12}{cycles:>14}")
+
+    baseline_memory, baseline_cycles = results["plain"]
+    for name, (memory, cycles) in results.items():
+        if memory != baseline_memory:
+            print(f"Warning: the memory after running {name} differs from plain")
+        print(f"{name}: {cycles / baseline_cycles:.2f} of the plain cycles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import glob
+import io
+import os
+import random
+
+from vmtranslator import vmtranslator
+
+OS_PATH = os.path.abspath(os.path.join(__file__, "..", "..", "OS"))
+
+SEGMENTS = ["local", "argument", "this", "that", "temp", "pointer", "static"]
+ARITHMETIC = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]
+
+# Every generated program fits in the 32K ROM
+MAX_WORDS = 2 ** 15
+
+
+def generate_vm_program(n_functions: int, seed: int = 0) -> str:
+    rand = random.Random(seed)
+    lines = []
+    for func in range(n_functions):
+        func_name = f"Bench.f{func}"
+        lines.append(f"function {func_name} {rand.randint(0, 4)}")
+        for label_index in range(10):
+            lines.append(f"label {func_name}$L{label_index}")
+            for _ in range(8):
+                kind = rand.random()
+                if kind < 0.35:
+                    lines.append(f"push constant {rand.randint(0, 1000)}")
+                elif kind < 0.55:
+                    lines.append(_random_push_pop(rand, "push"))
+                elif kind < 0.75:
+                    lines.append(_random_push_pop(rand, "pop"))
+                elif kind < 0.95:
+                    lines.append(rand.choice(ARITHMETIC))
+                else:
+                    lines.append(f"call Bench.f{rand.randrange(n_functions)} {rand.randint(0, 3)}")
+            lines.append(f"if-goto {func_name}$L{rand.randrange(10)}")
+        lines.append("return")
+    return "\n".join(lines)
+
+
+def _random_push_pop(rand: random.Random, command: str) -> str:
+    segment = rand.choice(SEGMENTS)
+    if segment == "temp":
+        i = rand.randrange(8)
+    elif segment == "pointer":
+        i = rand.randrange(2)
+    else:
+        i = rand.randrange(10)
+    return f"{command} {segment} {i}"
+
+
+def generate_asm_program(n_functions: int, seed: int = 0) -> list[str]:
+    asm = vmtranslator.translate_text(generate_vm_program(n_functions, seed), "Bench.vm")
+    return asm.splitlines(keepends=True)
+
+
+def translated_programs() -> list[list[str]]:
+    # Synthetic VM code through the translator, so the mix of commands and comments is realistic
+    return [generate_asm_program(24, seed) for seed in range(4)]
+
+
+def label_heavy_programs(seed: int = 0) -> list[list[str]]:
+    # Short blocks, each with its own label and jumps forward and backward
+    rand = random.Random(seed)
+    n_labels = MAX_WORDS // 5
+    lines = []
+    for label in range(n_labels):
+        lines.append(f"(L{label})\n")
+        lines.append(f"@L{rand.randrange(n_labels)}\n")
+        lines.append("D;JGT\n")
+        lines.append(f"@L{min(label + 1, n_labels - 1)}\n")
+        lines.append("0;JMP\n")
+    return [lines]
+
+
+def variable_heavy_programs(seed: int = 0) -> list[list[str]]:
+    # Thousands of distinct variables, every reference is resolved at the end
+    rand = random.Random(seed)
+    n_variables = 10000
+    lines = []
+    for _ in range(MAX_WORDS // 3):
+        lines.append(f"@var{rand.randrange(n_variables)}\n")
+        lines.append("D=D+M\n")
+        lines.append("M=D\n")
+    return [lines]
+
+
+def os_programs() -> list[list[str]]:
+    """
+    The OS compiled and translated class by class. The whole OS doesn't fit in the ROM,
+    so every class is a separate program.
+    """
+    from compiler import jackcompiler
+
+    programs = []
+    for file_name in sorted(glob.iglob("*.jack", root_dir=OS_PATH)):
+        with open(os.path.join(OS_PATH, file_name)) as jack_file, io.StringIO() as vm_code:
+            jackcompiler.JackCompiler(jack_file, vm_code).compile()
+            vm_file_name = file_name.replace(".jack", ".vm")
+            asm = vmtranslator.translate_text(vm_code.getvalue(), vm_file_name)
+        programs.append(asm.splitlines(keepends=True))
+    return programs
+
+
+GENERATORS = {
+    "translated": translated_programs,
+    "label_heavy": label_heavy_programs,
+    "variable_heavy": variable_heavy_programs,
+    "os": os_programs,
+}
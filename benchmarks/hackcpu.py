@@ -0,0 +1,104 @@
+from typing import Sequence
+
+RAM_SIZE = 32768
+WORD_MASK = 0xFFFF
+# The A register addresses the RAM and the ROM with its lower 15 bits
+ADDRESS_MASK = 0x7FFF
+SIGN_BIT = 0x8000
+
+A_BIT = 1 << 12
+DEST_A = 0b100
+DEST_D = 0b010
+DEST_M = 0b001
+JUMP_LT = 0b100
+JUMP_EQ = 0b010
+JUMP_GT = 0b001
+
+
+def _alu(comp: int, x: int, y: int) -> int:
+    if comp & 0b100000:
+        x = 0
+    if comp & 0b010000:
+        x = ~x
+    if comp & 0b001000:
+        y = 0
+    if comp & 0b000100:
+        y = ~y
+    out = x + y if comp & 0b10 else x & y
+    if comp & 1:
+        out = ~out
+    return out & WORD_MASK
+
+
+def _decode(word: int) -> tuple:
+    if not word & SIGN_BIT:
+        return None
+    return bool(word & A_BIT), (word >> 6) & 0b111111, (word >> 3) & 0b111, word & 0b111
+
+
+class HackCPU(object):
+    """
+    Runs Hack machine code, counting cycles. Every instruction takes one cycle.
+    The run stops when the program reaches an endless loop of the form (L) @L 0;JMP,
+    which is how Hack programs halt.
+
+    :param count_visits: Count how many times every instruction ran, in visits
+    """
+
+    def __init__(self, words: Sequence[int], count_visits=False):
+        self.words = list(words)
+        self.decoded = [_decode(word) for word in self.words]
+        self.ram = [0] * RAM_SIZE
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = False
+        self.visits = [0] * len(self.words) if count_visits else None
+
+    def run(self, max_cycles: int) -> int:
+        """
+        :return: The number of cycles run until the program halted or max_cycles was reached
+        """
+        ram, words, decoded, visits = self.ram, self.words, self.decoded, self.visits
+        a, d, pc = self.a, self.d, self.pc
+        n_words = len(words)
+        start = self.cycles
+        cycles = start
+        end = start + max_cycles
+        while cycles < end:
+            if pc >= n_words:
+                self.halted = True
+                break
+            cycles += 1
+            if visits is not None:
+                visits[pc] += 1
+            instruction = decoded[pc]
+            if instruction is None:
+                a = words[pc]
+                pc += 1
+                continue
+
+            use_memory, comp, dest, jump = instruction
+            # The memory and the jump use the value of A from before the instruction writes it
+            address = a & ADDRESS_MASK
+            out = _alu(comp, d, ram[address] if use_memory else a)
+            if dest & DEST_M:
+                ram[address] = out
+            if dest & DEST_A:
+                a = out
+            if dest & DEST_D:
+                d = out
+
+            if jump and ((jump & JUMP_LT and out & SIGN_BIT) or (jump & JUMP_EQ and out == 0)
+                         or (jump & JUMP_GT and out != 0 and not out & SIGN_BIT)):
+                if address == pc - 1 and words[pc - 1] == pc - 1 and jump == 0b111:
+                    self.halted = True
+                    break
+                pc = address
+            else:
+                pc += 1
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles = cycles
+        return cycles - start
@@ -0,0 +1,56 @@
+import argparse
+import io
+
+from benchmarks.hackcpu import HackCPU
+from hackassembler.assembler import Assembler, AssemblyContext
+from vmtranslator import vmcommands
+from vmtranslator.asmgenerator import AsmGenerator
+from vmtranslator.deadcode import split_functions
+from vmtranslator.layout import ExecutionProfile
+from vmtranslator.vmtranslator import VMFolderTranslator, read_vm_files
+
+
+def profile_folder(folder_path: str, max_cycles: int, shared_routines=True) -> ExecutionProfile:
+    """
+    Runs the program of a folder on the emulator, and counts the visits of the addresses of its functions and labels.
+    """
+    with io.StringIO() as output:
+        VMFolderTranslator(folder_path, AsmGenerator(shared_routines)).translate(output)
+        asm = output.getvalue()
+    context = AssemblyContext()
+    words = Assembler().assemble_to_array(asm.splitlines(), context)
+    symbols = context.symbol_manager.symbol_table
+
+    cpu = HackCPU(words, count_visits=True)
+    cpu.run(max_cycles)
+    if not cpu.halted:
+        print(f"The program didn't halt after {cpu.cycles} cycles, the profile is of the part that ran")
+
+    functions = {}
+    labels = {}
+    for file_name, source in read_vm_files(folder_path).items():
+        for function in split_functions(file_name, source)[1]:
+            functions[function.name] = cpu.visits[symbols[function.name]]
+            for _, command in function.commands:
+                if isinstance(command, vmcommands.Label):
+                    labels[command.label] = cpu.visits[symbols[command.label]]
+    return ExecutionProfile(functions, labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the .vm files of a folder on the emulator, and write how many times every function "
+                    "and label was reached, for the --profile option of the VM translator.")
+    parser.add_argument("folder", help="A directory containing .vm files, with a Sys.init that halts")
+    parser.add_argument("output", help="The profile .json file to write")
+    parser.add_argument("--max-cycles", type=int, default=50_000_000,
+                        help="Stop a run that didn't halt after this many cycles")
+    args = parser.parse_args()
+
+    profile = profile_folder(args.folder, args.max_cycles)
+    with open(args.output, 'w') as f:
+        profile.write(f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.generators import GENERATORS
+from hackassembler import cparser, romio
+from hackassembler.assembler import Assembler, AssemblyContext
+from hackassembler.symbolmanager import SymbolManager
+
+RESULTS_VERSION = 1
+# A phase that got slower by more than this ratio is reported as a regression
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+
+def best_time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_phases(programs: list[list[str]], repeat: int) -> dict[str, float]:
+    """
+    Times every phase of Assembler.assemble_to_array followed by romio.write_hack, summed over the programs.
+    """
+    phases = {"parse": 0.0, "resolve": 0.0, "write": 0.0}
+    for lines in programs:
+        asm = Assembler()
+        phases["parse"] += best_time(lambda: asm._parse(lines, AssemblyContext()), repeat)
+
+        def resolve():
+            # Resolving patches the commands, so it needs a fresh parse every time
+            context = AssemblyContext()
+            commands = asm._parse(lines, context)
+            start = time.perf_counter()
+            context.symbol_manager.resolve_all_symbols(commands)
+            return time.perf_counter() - start
+
+        phases["resolve"] += min(resolve() for _ in range(repeat))
+
+        commands = asm.assemble_to_array(lines)
+        phases["write"] += best_time(lambda: romio.write_hack(commands, io.StringIO()), repeat)
+
+    phases["total"] = sum(phases.values())
+    return phases
+
+
+def peak_memory(programs: list[list[str]]) -> int:
+    peak = 0
+    for lines in programs:
+        tracemalloc.start()
+        commands = Assembler().assemble_to_array(lines)
+        romio.write_hack(commands, io.StringIO())
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak
+
+
+def time_cparser(programs: list[list[str]], repeat: int) -> dict:
+    lines = [Assembler.strip_line(line) for program in programs for line in program]
+    c_lines = [line for line in lines if line and not line.startswith(("@", "("))]
+
+    def parse_all():
+        for line in c_lines:
+            cparser.parse_c_instruction(line)
+
+    seconds = best_time(parse_all, repeat)
+    return {"lines": len(c_lines), "seconds": seconds, "lines_per_second": len(c_lines) / seconds}
+
+
+def time_symbol_manager(programs: list[list[str]], repeat: int) -> dict:
+    lines = [Assembler.strip_line(line) for program in programs for line in program]
+    symbols = [line[1:] for line in lines if line.startswith("@") and not line[1:].isnumeric()]
+
+    def resolve_all():
+        symbol_manager = SymbolManager()
+        for index, symbol in enumerate(symbols):
+            symbol_manager.try_resolve_symbol(symbol, index)
+
+    seconds = best_time(resolve_all, repeat)
+    return {"symbols": len(symbols), "seconds": seconds, "symbols_per_second": len(symbols) / seconds}
+
+
+def run_suite(generator_names: list[str], repeat: int) -> dict:
+    results = {}
+    for name in generator_names:
+        programs = GENERATORS[name]()
+        n_lines = sum(len(lines) for lines in programs)
+        phases = time_phases(programs, repeat)
+        results[name] = {
+            "programs": len(programs),
+            "lines": n_lines,
+            "bytes": sum(len(line) for lines in programs for line in lines),
+            "phases": phases,
+            "lines_per_second": n_lines / phases["total"],
+            "peak_memory_bytes": peak_memory(programs),
+            "cparser": time_cparser(programs, repeat),
+            "symbol_manager": time_symbol_manager(programs, repeat),
+        }
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def print_results(report: dict):
+    print(f"{'generator':<16}{'lines':>9}{'parse':>9}{'resolve':>9}{'write':>9}{'total':>9}"
+          f"{'lines/s':>12}{'peak MiB':>10}")
+    for name, result in report["results"].items():
+        phases = result["phases"]
+        print(f"{name:<16}{result['lines']:>9}{phases['parse']:>9.4f}{phases['resolve']:>9.4f}"
+              f"{phases['write']:>9.4f}{phases['total']:>9.4f}{result['lines_per_second']:>12,.0f}"
+              f"{result['peak_memory_bytes'] / 2 ** 20:>10.2f}")
+
+
+def compare_results(previous: dict, current: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, result in current["results"].items():
+        old_result = previous["results"].get(name)
+        if old_result is None:
+            continue
+        for phase, seconds in result["phases"].items():
+            old_seconds = old_result["phases"].get(phase)
+            if old_seconds and seconds > old_seconds * (1 + threshold):
+                regressions.append(f"{name}/{phase}: {old_seconds:.4f}s -> {seconds:.4f}s "
+                                   f"(+{(seconds / old_seconds - 1) * 100:.0f}%)")
+        old_peak = old_result["peak_memory_bytes"]
+        if result["peak_memory_bytes"] > old_peak * (1 + threshold):
+            regressions.append(f"{name}/peak memory: {old_peak} -> {result['peak_memory_bytes']} bytes")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assembler throughput benchmarks.")
+    parser.add_argument("generators", nargs="*",
+                        help=f"Programs to benchmark, out of {', '.join(GENERATORS)}. All of them by default")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs, the best one is reported")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run, to report regressions against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    unknown = set(args.generators) - set(GENERATORS)
+    if unknown:
+        parser.error(f"Unknown generators {', '.join(sorted(unknown))}")
+
+    report = run_suite(args.generators or list(GENERATORS), args.repeat)
+    print_results(report)
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+        regressions = compare_results(previous, report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
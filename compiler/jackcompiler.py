@@ -26,7 +26,11 @@ OS_ALLOC = "Memory.alloc"
 
 
 class JackCompiler:
-    def __init__(self, input_stream: IO[str], output_stream: IO[str]):
+    """
+    :param binary: Write the VM code as the bytecode of a .vmb file, to a binary output stream
+    """
+
+    def __init__(self, input_stream: IO[str], output_stream: IO, binary=False):
         tokenizer = jacktokenizer.JackTokenizer(input_stream)
         parser = jackparser.JackParser(tokenizer)
 
@@ -40,11 +44,15 @@ class JackCompiler:
         self.class_name = self.class_.class_name
         self._func_name = ""
         self.symbol_table = symboltable.SymbolTable()
-        self.vmwriter = vmwriter.VMWriter(output_stream)
+        if binary:
+            self.vmwriter = vmwriter.BinaryVMWriter(output_stream)
+        else:
+            self.vmwriter = vmwriter.VMWriter(output_stream)
         self._label_index = 0
 
     def compile(self):
         self.compile_class(self.class_)
+        self.vmwriter.flush()
 
     def compile_class(self, class_: jackgrammar.Class):
         self._define_class_var_dec(class_.class_var_dec_list)
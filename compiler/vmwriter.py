@@ -1,6 +1,6 @@
 from typing import IO
 
-from vmtranslator import vmcommands
+from vmtranslator import vmbinary, vmcommands
 from vmtranslator.vmcommands import ArithmeticCommand
 
 ARITHMETIC_TO_COMMAND_STR = {
@@ -48,3 +48,49 @@ class VMWriter:
 
     def write_return(self):
         self.output.write(f"return\n")
+
+    def flush(self):
+        pass
+
+
+class BinaryVMWriter:
+    """
+    Writes the same commands as VMWriter, as the bytecode of a .vmb file.
+    The bytecode is written to the output when flush is called, after the whole class was compiled.
+    """
+
+    def __init__(self, output_stream: IO[bytes]):
+        self.output = output_stream
+        self.encoder = vmbinary.BytecodeEncoder()
+
+    # The compiler also passes the kinds of variables as segments, which have the same values
+    def write_push(self, segment: vmcommands.Segment, index: int):
+        self.encoder.add(vmcommands.Push.create(vmcommands.SEGMENTS[segment.value], index))
+
+    def write_pop(self, segment: vmcommands.Segment, index: int):
+        self.encoder.add(vmcommands.Pop.create(vmcommands.SEGMENTS[segment.value], index))
+
+    def write_arithmetic(self, command):
+        self.encoder.add(command([]))
+
+    def write_label(self, label: str):
+        self.encoder.add(vmcommands.Label.create(label))
+
+    def write_goto(self, label: str):
+        self.encoder.add(vmcommands.Goto.create(label))
+
+    def write_if_goto(self, label: str):
+        self.encoder.add(vmcommands.IfGoto.create(label))
+
+    def write_call(self, name: str, n_args: int):
+        self.encoder.add(vmcommands.Call.create(name, n_args))
+
+    def write_function(self, name: str, n_locals: int):
+        self.encoder.add(vmcommands.Function.create(name, n_locals))
+
+    def write_return(self):
+        self.encoder.add(vmcommands.Return([]))
+
+    def flush(self):
+        self.output.write(self.encoder.getvalue())
+        self.encoder = vmbinary.BytecodeEncoder()
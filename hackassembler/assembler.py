@@ -1,51 +1,139 @@
+from array import array
+from typing import Iterable, Optional
+
 from hackassembler import cparser
 from hackassembler.errors import AssemblerError
+from hackassembler.instructions import AInstruction, CInstruction, Instruction, Label
+from hackassembler.objectfile import ObjectFile
 from hackassembler.symbolmanager import SymbolManager
 
 INLINE_COMMENT_SEP = "//"
 
+# Raw lines whose meaning doesn't depend on the symbols, mapped to their C-instruction or to EMPTY_LINE
+LINE_CACHE_MAX_SIZE = 4096
+EMPTY_LINE = -1
 
-class Assembler(object):
 
-    def __init__(self):
-        self.cur_command = -1
-        self.symbol_manager = None
+class AssemblyContext(object):
+    """
+    The state of a single assembly: its symbols, and the number of commands that were assembled so far.
+    A context is only used by one call.
+    """
 
-    def _reset(self):
+    def __init__(self):
         self.cur_command = 0
         self.symbol_manager = SymbolManager()
 
-    def assemble(self, input_stream):
-        self._reset()
 
+class Assembler(object):
+    """
+    Every call keeps its state in its own AssemblyContext, and the encoding tables are immutable,
+    so one assembler can assemble many programs at once from different threads.
+    A caller that needs the symbols of its program gives its own context.
+    """
+
+    @staticmethod
+    def _new_context(context: Optional[AssemblyContext]) -> AssemblyContext:
+        return AssemblyContext() if context is None else context
+
+    def assemble(self, input_stream: Iterable[str], context: Optional[AssemblyContext] = None) -> str:
+        commands = self.assemble_to_array(input_stream, context)
+        return "\n".join(f"{command:016b}" for command in commands)
+
+    def assemble_to_array(self, input_stream: Iterable[str], context: Optional[AssemblyContext] = None) -> array:
+        """
+        Streaming mode, the lines are consumed lazily and every command is kept as a packed
+        16-bit word. Only the slots of forward references are patched after the first pass.
+        """
+        context = self._new_context(context)
+        commands = self._parse(input_stream, context)
+        context.symbol_manager.resolve_all_symbols(commands)
+        return commands
+
+    def assemble_instructions(self, instructions: Iterable[Instruction],
+                              context: Optional[AssemblyContext] = None) -> array:
+        """
+        Assembles instruction records, as made by hackassembler.instructions or the VM translator,
+        without formatting and parsing them as text.
+        """
+        context = self._new_context(context)
+        symbol_manager = context.symbol_manager
+        commands = array("H")
+        # The records are immutable, so every distinct C-instruction is encoded once
+        c_instructions = {}
+
+        for index, instruction in enumerate(instructions):
+            try:
+                if type(instruction) is CInstruction:
+                    command = c_instructions.get(instruction)
+                    if command is None:
+                        command = cparser.parse_c_instruction(str(instruction))
+                        c_instructions[instruction] = command
+                    commands.append(command)
+                    context.cur_command += 1
+                elif type(instruction) is AInstruction:
+                    commands.append(self.parse_a_value(instruction.value, context))
+                    context.cur_command += 1
+                elif type(instruction) is Label:
+                    symbol_manager.create_new_label_symbol(instruction.name, context.cur_command)
+                else:
+                    raise AssemblerError(f"Got an unknown instruction {instruction!r}")
+            except AssemblerError as e:
+                e.line = str(instruction)
+                e.lineno = index + 1
+                raise
+
+        symbol_manager.resolve_all_symbols(commands)
+        return commands
+
+    def assemble_object(self, input_stream: Iterable[str], context: Optional[AssemblyContext] = None) -> ObjectFile:
+        context = self._new_context(context)
+        symbol_manager = context.symbol_manager
+        commands = self._parse(input_stream, context)
+        external_references = symbol_manager.resolve_local_symbols(commands)
+        symbol_table = symbol_manager.symbol_table
+        labels = {symbol: symbol_table[symbol] for symbol in symbol_manager.label_symbols}
+        return ObjectFile(commands, labels, symbol_manager.label_references, external_references)
+
+    def _parse(self, input_stream: Iterable[str], context: AssemblyContext) -> array:
         cur_line = 0
-        commands = []
+        commands = array("H")
+        line_cache = {}
 
         for original_line in input_stream:
             cur_line += 1
+            cached = line_cache.get(original_line)
+            if cached is not None:
+                if cached != EMPTY_LINE:
+                    commands.append(cached)
+                    context.cur_command += 1
+                continue
+
             line = self.strip_line(original_line)
             if line == "":
+                if len(line_cache) < LINE_CACHE_MAX_SIZE:
+                    line_cache[original_line] = EMPTY_LINE
                 continue
 
             try:
                 if line.startswith("@"):
-                    command = self.parse_a_instruction(line)
+                    command = self.parse_a_instruction(line, context)
                     commands.append(command)
-                    self.cur_command += 1
+                    context.cur_command += 1
                 elif line.startswith("("):
-                    self.parse_label_symbol(line)
+                    self.parse_label_symbol(line, context)
                 else:
                     command = cparser.parse_c_instruction(line)
                     commands.append(command)
-                    self.cur_command += 1
+                    context.cur_command += 1
+                    if len(line_cache) < LINE_CACHE_MAX_SIZE:
+                        line_cache[original_line] = command
             except AssemblerError as e:
                 e.line = original_line
                 e.lineno = cur_line
                 raise
 
-        self.symbol_manager.resolve_all_symbols(commands)
-
-        return "\n".join(f"{command:016b}" for command in commands)
+        return commands
 
     @staticmethod
     def strip_line(line: str) -> str:
@@ -53,19 +141,26 @@ class Assembler(object):
         line = line.strip()
         return line
 
-    def parse_a_instruction(self, line) -> int:
+    def parse_a_instruction(self, line, context: AssemblyContext) -> int:
         line = line[1:]
         if line.isnumeric():
-            val = int(line)
-            if val >= 2 ** 15:
-                raise AssemblerError(f"Got an A-instruction with number larger then 2^15")
-            return val
+            return self.parse_a_value(int(line), context)
         else:
-            return self.symbol_manager.try_resolve_symbol(line, self.cur_command)
+            return context.symbol_manager.try_resolve_symbol(line, context.cur_command)
 
-    def parse_label_symbol(self, line):
+    @staticmethod
+    def parse_a_value(value, context: AssemblyContext) -> int:
+        if isinstance(value, int):
+            if value >= 2 ** 15 or value < 0:
+                raise AssemblerError(f"Got an A-instruction with number larger then 2^15")
+            return value
+        return context.symbol_manager.try_resolve_symbol(value, context.cur_command)
+
+    @staticmethod
+    def parse_label_symbol(line, context: AssemblyContext):
         if not line.endswith(")"):
             raise AssemblerError("No ending ')'")
 
         line = line[1:-1]
-        self.symbol_manager.create_new_label_symbol(line, self.cur_command)
+        context.symbol_manager.create_new_label_symbol(line, context.cur_command)
+
@@ -0,0 +1,221 @@
+from collections import Counter
+from typing import Iterable, Optional
+
+from hackassembler.instructions import AInstruction, CInstruction, Instruction, Label
+from hackassembler.symbolmanager import SymbolManager
+
+UNCONDITIONAL_JUMP = "JMP"
+
+
+class BasicBlock(object):
+    def __init__(self, labels: list[str], code: list[Instruction]):
+        self.labels = labels
+        # Only A and C-instructions, and only the last one may jump
+        self.code = code
+
+    def ends_with_jump(self) -> bool:
+        return bool(self.code) and _is_jump(self.code[-1])
+
+    def falls_through(self) -> bool:
+        return not self.ends_with_jump() or self.code[-1].jump != UNCONDITIONAL_JUMP
+
+    def jump_target(self) -> Optional[str]:
+        # The target is known only for "@LABEL" right before the jump
+        if self.ends_with_jump() and len(self.code) >= 2:
+            load = self.code[-2]
+            if isinstance(load, AInstruction) and isinstance(load.value, str):
+                return load.value
+        return None
+
+    def trampoline_target(self) -> Optional[str]:
+        # A block that does nothing but jump elsewhere
+        if len(self.code) == 2 and self.code[-1] == CInstruction(None, self.code[-1].comp, UNCONDITIONAL_JUMP):
+            return self.jump_target()
+        return None
+
+
+class ControlFlowOptimizer(object):
+    """
+    Splits the program into basic blocks and repeats until nothing changes:
+    threading jumps through blocks that only jump elsewhere, removing jumps to the code right after them,
+    removing blocks that can't be reached and removing labels nobody references.
+
+    Code addresses must only be taken through labels, and the code after a label must not use
+    the value of A it was entered with, which holds for the VM translator output.
+    """
+
+    def __init__(self):
+        self.stats = Counter()
+
+    def optimize(self, instructions: Iterable[Instruction]) -> list[Instruction]:
+        blocks = build_blocks(instructions)
+        if self._has_numeric_jumps(blocks):
+            self.stats["skipped, jumps to numeric addresses"] += 1
+            return flatten(blocks)
+
+        changed = True
+        while changed:
+            label_table = self._build_label_table(blocks)
+            changed = self._thread_jumps(blocks, label_table)
+            changed |= self._remove_jumps_to_next(blocks)
+            changed |= self._remove_unreachable(blocks, label_table)
+            changed |= self._remove_unused_labels(blocks)
+            blocks = [block for block in blocks if block.labels or block.code]
+
+        return flatten(blocks)
+
+    def report(self) -> str:
+        return "\n".join(f"{name:<36}{count:>8}" for name, count in self.stats.items())
+
+    @staticmethod
+    def _build_label_table(blocks: list[BasicBlock]) -> dict[str, int]:
+        symbol_manager = SymbolManager()
+        for index, block in enumerate(blocks):
+            for label in block.labels:
+                symbol_manager.create_new_label_symbol(label, index)
+        return {label: symbol_manager.symbol_table[label] for label in symbol_manager.label_symbols}
+
+    @staticmethod
+    def _has_numeric_jumps(blocks: list[BasicBlock]) -> bool:
+        for block in blocks:
+            if block.ends_with_jump() and len(block.code) >= 2:
+                load = block.code[-2]
+                if isinstance(load, AInstruction) and isinstance(load.value, int):
+                    return True
+        return False
+
+    def _thread_jumps(self, blocks: list[BasicBlock], label_table: dict[str, int]) -> bool:
+        changed = False
+        for index, block in enumerate(blocks):
+            target = block.jump_target()
+            if target is None or target not in label_table:
+                continue
+
+            final_target = target
+            visited = {target}
+            while True:
+                next_target = blocks[label_table[final_target]].trampoline_target()
+                if next_target is None or next_target in visited or next_target not in label_table:
+                    break
+                visited.add(next_target)
+                final_target = next_target
+
+            if final_target == target:
+                continue
+            # When the jump isn't taken, the code after it sees the new value of A
+            if block.falls_through() and not self._a_is_overwritten_after(blocks, index):
+                continue
+            block.code[-2] = AInstruction(final_target)
+            self.stats["jumps threaded"] += 1
+            changed = True
+        return changed
+
+    def _remove_jumps_to_next(self, blocks: list[BasicBlock]) -> bool:
+        changed = False
+        for index, block in enumerate(blocks):
+            target = block.jump_target()
+            if target is None or block.code[-1].dest is not None:
+                continue
+            if target not in self._labels_after(blocks, index):
+                continue
+            if not self._a_is_overwritten_after(blocks, index):
+                continue
+            del block.code[-2:]
+            self.stats["jumps to the next instruction removed"] += 1
+            changed = True
+        return changed
+
+    def _remove_unreachable(self, blocks: list[BasicBlock], label_table: dict[str, int]) -> bool:
+        reachable = set()
+        to_visit = [0] if blocks else []
+        to_visit.extend(label_table[label] for label in self._address_taken_labels(blocks) if label in label_table)
+        while to_visit:
+            index = to_visit.pop()
+            if index in reachable:
+                continue
+            reachable.add(index)
+            block = blocks[index]
+            if block.falls_through() and index + 1 < len(blocks):
+                to_visit.append(index + 1)
+            target = block.jump_target()
+            if target in label_table:
+                to_visit.append(label_table[target])
+
+        changed = False
+        for index, block in enumerate(blocks):
+            if index not in reachable and (block.labels or block.code):
+                self.stats["unreachable instructions removed"] += len(block.code)
+                self.stats["unreachable labels removed"] += len(block.labels)
+                block.labels = []
+                block.code = []
+                changed = True
+        return changed
+
+    def _remove_unused_labels(self, blocks: list[BasicBlock]) -> bool:
+        referenced = {instruction.value for block in blocks for instruction in block.code
+                      if isinstance(instruction, AInstruction)}
+        changed = False
+        for block in blocks:
+            used_labels = [label for label in block.labels if label in referenced]
+            if len(used_labels) != len(block.labels):
+                self.stats["unused labels removed"] += len(block.labels) - len(used_labels)
+                block.labels = used_labels
+                changed = True
+        return changed
+
+    @staticmethod
+    def _address_taken_labels(blocks: list[BasicBlock]) -> set[str]:
+        # Labels loaded for anything but a direct jump may be jumped to indirectly, like return addresses
+        labels = set()
+        for block in blocks:
+            direct_jump_index = len(block.code) - 2 if block.jump_target() is not None else -1
+            for index, instruction in enumerate(block.code):
+                if isinstance(instruction, AInstruction) and isinstance(instruction.value, str) \
+                        and index != direct_jump_index:
+                    labels.add(instruction.value)
+        return labels
+
+    @staticmethod
+    def _labels_after(blocks: list[BasicBlock], index: int) -> set[str]:
+        labels = set()
+        for block in blocks[index + 1:]:
+            labels.update(block.labels)
+            if block.code:
+                break
+        return labels
+
+    @staticmethod
+    def _a_is_overwritten_after(blocks: list[BasicBlock], index: int) -> bool:
+        for block in blocks[index + 1:]:
+            if block.code:
+                return isinstance(block.code[0], AInstruction)
+        return False
+
+
+def build_blocks(instructions: Iterable[Instruction]) -> list[BasicBlock]:
+    blocks = [BasicBlock([], [])]
+    for instruction in instructions:
+        current = blocks[-1]
+        if isinstance(instruction, Label):
+            if current.code:
+                current = BasicBlock([], [])
+                blocks.append(current)
+            current.labels.append(instruction.name)
+            continue
+
+        current.code.append(instruction)
+        if _is_jump(instruction):
+            blocks.append(BasicBlock([], []))
+    return blocks
+
+
+def flatten(blocks: list[BasicBlock]) -> list[Instruction]:
+    instructions = []
+    for block in blocks:
+        instructions.extend(Label(label) for label in block.labels)
+        instructions.extend(block.code)
+    return instructions
+
+
+def _is_jump(instruction: Instruction) -> bool:
+    return isinstance(instruction, CInstruction) and instruction.jump is not None
@@ -1,8 +1,9 @@
 import re
+from types import MappingProxyType
 
 from hackassembler.errors import AssemblerError
 
-COMP_TABLE_A0 = {
+COMP_TABLE_A0 = MappingProxyType({
     "0": 0b101010,
     "1": 0b111111,
     "-1": 0b111010,
@@ -21,8 +22,8 @@ COMP_TABLE_A0 = {
     "A-D": 0b000111,
     "D&A": 0b000000,
     "D|A": 0b010101
-}
-COMP_TABLE_A1 = {
+})
+COMP_TABLE_A1 = MappingProxyType({
     "M": 0b110000,
     "!M": 0b110001,
     "-M": 0b110011,
@@ -33,8 +34,8 @@ COMP_TABLE_A1 = {
     "M-D": 0b000111,
     "D&M": 0b000000,
     "D|M": 0b010101
-}
-DEST_TABLE = {
+})
+DEST_TABLE = MappingProxyType({
     None: 0b000,
     "M": 0b001,
     "D": 0b010,
@@ -43,8 +44,8 @@ DEST_TABLE = {
     "AM": 0b101,
     "AD": 0b110,
     "AMD": 0b111
-}
-JUMP_TABLE = {
+})
+JUMP_TABLE = MappingProxyType({
     None: 0b000,
     "JGT": 0b001,
     "JEQ": 0b010,
@@ -53,7 +54,7 @@ JUMP_TABLE = {
     "JNE": 0b101,
     "JLE": 0b110,
     "JMP": 0b111
-}
+})
 
 # self.c_regex = re.compile(r"^(([AMD]+)=)?([AMD01\-\+!\&\|]+)(;([A-Z][A-Z][A-Z]))?$")
 # It is better to make the regex more general, so that parsing errors may be clearer
@@ -61,6 +62,14 @@ c_regex = re.compile(r"^(([A-Z]+)=)?([A-Z01\-+!&|]+)(;([A-Z]+))?$")
 
 
 def parse_c_instruction(line: str) -> int:
+    command = C_INSTRUCTION_TABLE.get(line)
+    if command is None:
+        # Not a valid spelling, go through the regex to get a detailed error
+        command = _parse_c_instruction_slow(line)
+    return command
+
+
+def _parse_c_instruction_slow(line: str) -> int:
     dest, comp, jump = extract_fields(line)
 
     a_bit = 1 if "M" in comp else 0
@@ -89,6 +98,10 @@ def parse_c_instruction(line: str) -> int:
                              f"Available jump are {JUMP_TABLE.keys()}\n"
                              f"raised when parsing")
 
+    return encode_c_instruction(a_bit, comp_num, dest_num, jump_num)
+
+
+def encode_c_instruction(a_bit: int, comp_num: int, dest_num: int, jump_num: int) -> int:
     output = jump_num
     output = output ^ (dest_num << 3)
     output = output ^ (comp_num << 6)
@@ -104,3 +117,28 @@ def extract_fields(line):
         raise AssemblerError(f"Could not parse the C-instruction")
     _, dest, comp, _, jump = match.groups()
     return dest, comp, jump
+
+
+def format_c_instruction(dest, comp, jump) -> str:
+    line = comp
+    if dest is not None:
+        line = f"{dest}={line}"
+    if jump is not None:
+        line = f"{line};{jump}"
+    return line
+
+
+def _build_c_instruction_table() -> dict[str, int]:
+    table = {}
+    for a_bit, comp_table in ((0, COMP_TABLE_A0), (1, COMP_TABLE_A1)):
+        for comp, comp_num in comp_table.items():
+            for dest, dest_num in DEST_TABLE.items():
+                for jump, jump_num in JUMP_TABLE.items():
+                    line = format_c_instruction(dest, comp, jump)
+                    table[line] = encode_c_instruction(a_bit, comp_num, dest_num, jump_num)
+    return table
+
+
+# Every valid spelling of "dest=comp;jump", so that parsing a valid C-instruction is a single lookup.
+# Like the other tables it is never changed, so any number of threads can encode with it at once.
+C_INSTRUCTION_TABLE = MappingProxyType(_build_c_instruction_table())
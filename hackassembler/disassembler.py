@@ -0,0 +1,90 @@
+from functools import cache
+from typing import Optional
+
+import numpy as np
+
+from hackassembler import cparser, romio
+
+A_BIT = 1 << 15
+C_FIELDS_MASK = (1 << 13) - 1
+A_VALUE_MASK = (1 << 15) - 1
+JUMP_MASK = 0b111
+WRITES_M = 0b001 << 3
+READS_M = 1 << 12
+
+
+@cache
+def c_instruction_table() -> np.ndarray:
+    """
+    Text of every C-instruction, indexed by its low 13 bits (a, comp, dest and jump).
+    This is the inverse of the tables in cparser.
+    """
+    comp_names = {(0, comp_num): comp for comp, comp_num in cparser.COMP_TABLE_A0.items()}
+    comp_names.update(((1, comp_num), comp) for comp, comp_num in cparser.COMP_TABLE_A1.items())
+    dest_names = {dest_num: dest for dest, dest_num in cparser.DEST_TABLE.items()}
+    jump_names = {jump_num: jump for jump, jump_num in cparser.JUMP_TABLE.items()}
+
+    table = np.empty(C_FIELDS_MASK + 1, dtype=object)
+    for fields in range(C_FIELDS_MASK + 1):
+        comp = comp_names.get((fields >> 12, (fields >> 6) & 0b111111))
+        if comp is None:
+            table[fields] = f"// invalid comp bits in {fields | (0b111 << 13):016b}"
+        else:
+            table[fields] = cparser.format_c_instruction(dest_names[(fields >> 3) & 0b111], comp,
+                                                         jump_names[fields & JUMP_MASK])
+    # The table is shared by every call, which may run in different threads
+    table.flags.writeable = False
+    return table
+
+
+@cache
+def a_instruction_table() -> np.ndarray:
+    table = np.array([f"@{value}" for value in range(A_VALUE_MASK + 1)], dtype=object)
+    table.flags.writeable = False
+    return table
+
+
+def disassemble(words, symbols: Optional[romio.Symbols] = None) -> list[str]:
+    """
+    Decodes all the words at once, by looking up their fields in the inverted encoding tables.
+
+    With symbols, labels are placed back, and A-instructions are named when the naming is unambiguous:
+    a label address right before a jump, or a variable address right before an access to M.
+    Without symbols the output assembles back to the same words. With them, variables may be
+    allocated in a different order.
+    """
+    words = np.asarray(words, dtype=np.uint16)
+    is_c = (words & A_BIT) != 0
+    text = np.where(is_c, c_instruction_table()[words & C_FIELDS_MASK], a_instruction_table()[words & A_VALUE_MASK])
+
+    if symbols:
+        _name_a_instructions(words, is_c, text, symbols)
+        return _insert_labels(text.tolist(), symbols)
+    return text.tolist()
+
+
+def _name_a_instructions(words: np.ndarray, is_c: np.ndarray, text: np.ndarray, symbols: romio.Symbols):
+    next_words = np.append(words[1:], 0).astype(np.uint16)
+    next_is_c = np.append(is_c[1:], False)
+    before_jump = ~is_c & next_is_c & ((next_words & JUMP_MASK) != 0)
+    before_memory_access = ~is_c & next_is_c & ((next_words & (READS_M | WRITES_M)) != 0)
+
+    for kind, candidates in ((romio.SYMBOL_LABEL, before_jump), (romio.SYMBOL_VARIABLE, before_memory_access)):
+        names = {value: name for name, (symbol_kind, value) in symbols.items() if symbol_kind == kind}
+        if not names:
+            continue
+        addresses = np.fromiter(names.keys(), dtype=np.uint16, count=len(names))
+        for index in np.nonzero(candidates & np.isin(words, addresses))[0]:
+            text[index] = f"@{names[int(words[index])]}"
+
+
+def _insert_labels(lines: list[str], symbols: romio.Symbols) -> list[str]:
+    labels = sorted((value, name) for name, (kind, value) in symbols.items() if kind == romio.SYMBOL_LABEL)
+    output = []
+    position = 0
+    for address, name in labels:
+        output.extend(lines[position:address])
+        position = max(position, address)
+        output.append(f"({name})")
+    output.extend(lines[position:])
+    return output
@@ -8,6 +8,10 @@ class AssemblerError(Exception):
     def __str__(self):
         return f"{self.msg}. Raised from command\n{self.line}\nat line {self.lineno}"
 
+    def __reduce__(self):
+        # Keep the line information when the error is sent back from a worker process
+        return type(self), (self.msg, self.line, self.lineno)
+
 
 class MultipleSymbolDefinitionError(AssemblerError):
     pass
@@ -15,3 +19,11 @@ class MultipleSymbolDefinitionError(AssemblerError):
 
 class BadSymbolNameError(AssemblerError):
     pass
+
+
+class RomFormatError(Exception):
+    pass
+
+
+class LinkerError(Exception):
+    pass
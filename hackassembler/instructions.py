@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional, Union
+
+from hackassembler import cparser
+from hackassembler.errors import AssemblerError, BadSymbolNameError
+from hackassembler.symbolmanager import LABEL_SYMBOL_REGEX
+
+INLINE_COMMENT_SEP = "//"
+
+
+@dataclass(frozen=True, slots=True)
+class AInstruction:
+    # A number or a symbol
+    value: Union[int, str]
+
+    def __str__(self):
+        return f"@{self.value}"
+
+
+@dataclass(frozen=True, slots=True)
+class CInstruction:
+    dest: Optional[str]
+    comp: str
+    jump: Optional[str] = None
+
+    def __str__(self):
+        return cparser.format_c_instruction(self.dest, self.comp, self.jump)
+
+    def writes_a(self) -> bool:
+        return self.dest is not None and "A" in self.dest
+
+    def reads_memory(self) -> bool:
+        return "M" in self.comp
+
+
+@dataclass(frozen=True, slots=True)
+class Label:
+    name: str
+
+    def __str__(self):
+        return f"({self.name})"
+
+
+Instruction = Union[AInstruction, CInstruction, Label]
+
+
+def parse_instruction(line: str) -> Optional[Instruction]:
+    line = line.split(INLINE_COMMENT_SEP, 1)[0].strip()
+    if line == "":
+        return None
+
+    if line.startswith("@"):
+        value = line[1:]
+        if value.isnumeric():
+            if int(value) >= 2 ** 15:
+                raise AssemblerError(f"Got an A-instruction with number larger then 2^15")
+            return AInstruction(int(value))
+        return AInstruction(_verify_symbol(value))
+
+    if line.startswith("("):
+        if not line.endswith(")"):
+            raise AssemblerError("No ending ')'")
+        return Label(_verify_symbol(line[1:-1]))
+
+    # Validates the instruction, with the detailed errors of the assembler
+    cparser.parse_c_instruction(line)
+    return CInstruction(*cparser.extract_fields(line))
+
+
+def parse_program(lines: Iterable[str]) -> list[Instruction]:
+    instructions = []
+    for lineno, line in enumerate(lines, 1):
+        try:
+            instruction = parse_instruction(line)
+        except AssemblerError as e:
+            e.line = line
+            e.lineno = lineno
+            raise
+        if instruction is not None:
+            instructions.append(instruction)
+    return instructions
+
+
+def format_program(instructions: Iterable[Instruction]) -> str:
+    return "".join(f"{instruction}\n" for instruction in instructions)
+
+
+def _verify_symbol(symbol: str) -> str:
+    if LABEL_SYMBOL_REGEX.match(symbol) is None:
+        raise BadSymbolNameError("Could not parse the label symbol")
+    return symbol
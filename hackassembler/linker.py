@@ -0,0 +1,58 @@
+from array import array
+
+from hackassembler import romio
+from hackassembler.errors import LinkerError
+from hackassembler.objectfile import ObjectFile
+from hackassembler.symbolmanager import BASE_VARIABLE_SYMBOL_POSITION
+
+MAX_ADDRESS = 2 ** 15
+
+
+class Linker(object):
+    """
+    Combines object files into a single ROM, as if their sources were concatenated in the given order
+    and assembled at once. In particular, variables get exactly the same addresses.
+    """
+
+    def __init__(self):
+        self.symbols: romio.Symbols = {}
+
+    def link(self, objects: list[ObjectFile]) -> array:
+        self.symbols = {}
+        bases = self._place_labels(objects)
+
+        code = array("H")
+        for obj, base in zip(objects, bases):
+            unit_code = array("H", obj.code)
+            for index in obj.relocations:
+                unit_code[index] += base
+            code.extend(unit_code)
+
+        variable_position = BASE_VARIABLE_SYMBOL_POSITION
+        for obj, base in zip(objects, bases):
+            for symbol, index in obj.external_references:
+                resolved = self.symbols.get(symbol)
+                if resolved is None:
+                    if variable_position >= MAX_ADDRESS:
+                        raise LinkerError(f"No room left in the RAM for variable {symbol}")
+                    resolved = (romio.SYMBOL_VARIABLE, variable_position)
+                    variable_position += 1
+                    self.symbols[symbol] = resolved
+                code[base + index] = resolved[1]
+
+        return code
+
+    def _place_labels(self, objects: list[ObjectFile]) -> list[int]:
+        bases = []
+        base = 0
+        for obj in objects:
+            bases.append(base)
+            for label, offset in obj.labels.items():
+                if label in self.symbols:
+                    raise LinkerError(f"Label {label} is defined in more than one object")
+                address = base + offset
+                if address >= MAX_ADDRESS:
+                    raise LinkerError(f"Label {label} is at address {address}, beyond the addressable ROM")
+                self.symbols[label] = (romio.SYMBOL_LABEL, address)
+            base += len(obj.code)
+        return bases
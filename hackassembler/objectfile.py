@@ -0,0 +1,50 @@
+import json
+from array import array
+from typing import IO
+
+from hackassembler.errors import RomFormatError
+
+OBJECT_EXTENSION = ".hobj"
+OBJECT_FORMAT_VERSION = 1
+
+
+class ObjectFile(object):
+    """
+    Relocatable output of a single assembly unit. The code assumes it is loaded at address 0.
+
+    :param code: The encoded commands
+    :param labels: Every label defined in the unit, with its offset from the start of the unit
+    :param relocations: Indices of commands holding a label offset, which the linker shifts
+    :param external_references: (symbol, command index) pairs of symbols that aren't defined in the unit.
+        These are labels of other units or variables, like the static variables of a class.
+    """
+
+    def __init__(self, code: array, labels: dict[str, int], relocations: list[int],
+                 external_references: list[tuple[str, int]]):
+        self.code = code
+        self.labels = labels
+        self.relocations = relocations
+        self.external_references = external_references
+
+    def write(self, output_stream: IO[str]):
+        json.dump({"version": OBJECT_FORMAT_VERSION,
+                   "code": self.code.tolist(),
+                   "labels": self.labels,
+                   "relocations": self.relocations,
+                   "external_references": self.external_references},
+                  output_stream, separators=(",", ":"))
+
+    @classmethod
+    def read(cls, input_stream: IO[str]) -> "ObjectFile":
+        try:
+            content = json.load(input_stream)
+        except json.JSONDecodeError as e:
+            raise RomFormatError(f"Not a valid object file: {e}")
+
+        if content.get("version") != OBJECT_FORMAT_VERSION:
+            raise RomFormatError(f"Unsupported object file version {content.get('version')}")
+
+        return cls(array("H", content["code"]),
+                   content["labels"],
+                   content["relocations"],
+                   [(symbol, index) for symbol, index in content["external_references"]])
@@ -0,0 +1,39 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from hackassembler import romio
+from hackassembler.assembler import Assembler
+from hackassembler.errors import AssemblerError
+from hackassembler.linker import Linker
+from hackassembler.objectfile import ObjectFile
+
+DEFAULT_CHUNK_LINES = 20000
+
+
+def assemble_parallel(lines: list[str], max_workers: Optional[int] = None,
+                      chunk_lines: int = DEFAULT_CHUNK_LINES) -> tuple[array, romio.Symbols]:
+    """
+    Splits the lines into chunks, and assembles every chunk into a relocatable object in a process pool.
+    The objects are then linked in order, which resolves the symbols exactly like a single
+    Assembler.assemble_to_array run, so the output is identical.
+
+    :return: The commands and the symbols of the program
+    """
+    starts = range(0, len(lines), chunk_lines)
+    chunks = [lines[start:start + chunk_lines] for start in starts]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        objects = list(executor.map(_assemble_chunk, chunks, starts))
+
+    linker = Linker()
+    commands = linker.link(objects)
+    return commands, linker.symbols
+
+
+def _assemble_chunk(lines: list[str], first_line_offset: int) -> ObjectFile:
+    try:
+        return Assembler().assemble_object(lines)
+    except AssemblerError as e:
+        e.lineno += first_line_offset
+        raise
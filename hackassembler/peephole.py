@@ -0,0 +1,128 @@
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+from hackassembler.instructions import AInstruction, CInstruction, Instruction, Label
+
+SP = "SP"
+
+
+class PeepholeRule(object):
+    """
+    Replaces a window of consecutive instructions. The window never contains a label or a jump,
+    since a label may be reached from elsewhere and a jump may leave, so the instructions
+    in the window always run one after the other.
+
+    :param apply: Gets the window, returns the replacement or None if the rule doesn't apply
+    """
+
+    def __init__(self, name: str, size: int, apply: Callable[[list[Instruction]], Optional[list[Instruction]]]):
+        self.name = name
+        self.size = size
+        self.apply = apply
+
+
+def _dead_a_load(window):
+    # @X, @Y: X is overwritten before use
+    first, second = window
+    if isinstance(first, AInstruction) and isinstance(second, AInstruction):
+        return [second]
+    return None
+
+
+def _redundant_a_reload(window):
+    # @X, <doesn't change A>, @X
+    first, middle, last = window
+    if isinstance(first, AInstruction) and isinstance(middle, CInstruction) and first == last \
+            and not middle.writes_a():
+        return [first, middle]
+    return None
+
+
+def _increment_decrement(window):
+    # M=M+1, AM=M-1 leaves M as it was, and sets A to it
+    if window == [CInstruction("M", "M+1"), CInstruction("AM", "M-1")]:
+        return [CInstruction("A", "M")]
+    return None
+
+
+def _store_reload(window):
+    # M=D, D=M: D already holds the value
+    if window == [CInstruction("M", "D"), CInstruction("D", "M")]:
+        return [window[0]]
+    return None
+
+
+def _reload_store(window):
+    # D=M, M=D: the memory already holds the value
+    if window == [CInstruction("D", "M"), CInstruction("M", "D")]:
+        return [window[0]]
+    return None
+
+
+def _stack_top_reload(window):
+    # @SP, A=M, <doesn't change A>, @SP, A=M
+    # The middle instruction may only write to RAM[RAM[SP]], and the stack pointer never points to itself,
+    # so SP still holds the same address
+    first, second, middle, fourth, fifth = window
+    if first == fourth == AInstruction(SP) and second == fifth == CInstruction("A", "M") \
+            and isinstance(middle, CInstruction) and not middle.writes_a():
+        return [first, second, middle]
+    return None
+
+
+DEFAULT_RULES = (
+    PeepholeRule("dead-a-load", 2, _dead_a_load),
+    PeepholeRule("redundant-a-reload", 3, _redundant_a_reload),
+    PeepholeRule("increment-decrement", 2, _increment_decrement),
+    PeepholeRule("store-reload", 2, _store_reload),
+    PeepholeRule("reload-store", 2, _reload_store),
+    PeepholeRule("stack-top-reload", 5, _stack_top_reload),
+)
+
+
+class PeepholeOptimizer(object):
+    def __init__(self, rules: Iterable[PeepholeRule] = DEFAULT_RULES):
+        self.rules = tuple(rules)
+        self.hits = Counter()
+        self.removed = Counter()
+
+    def optimize(self, instructions: Iterable[Instruction]) -> list[Instruction]:
+        output = []
+        # Index in the output from which windows may start, i.e. after the last barrier
+        window_start = 0
+        for instruction in instructions:
+            output.append(instruction)
+            if _is_barrier(instruction):
+                window_start = len(output)
+                continue
+
+            # Applying a rule changes the end of the output, which may make another rule match
+            while self._apply_first_rule(output, window_start):
+                pass
+
+        return output
+
+    def _apply_first_rule(self, output: list[Instruction], window_start: int) -> bool:
+        for rule in self.rules:
+            start = len(output) - rule.size
+            if start < window_start:
+                continue
+            window = output[start:]
+            replacement = rule.apply(window)
+            if replacement is not None:
+                output[start:] = replacement
+                self.hits[rule.name] += 1
+                self.removed[rule.name] += rule.size - len(replacement)
+                return True
+        return False
+
+    def report(self) -> str:
+        lines = [f"{'rule':<24}{'hits':>8}{'removed':>10}"]
+        for name, hits in self.hits.most_common():
+            lines.append(f"{name:<24}{hits:>8}{self.removed[name]:>10}")
+        lines.append(f"{'total':<24}{sum(self.hits.values()):>8}{sum(self.removed.values()):>10}")
+        return "\n".join(lines)
+
+
+def _is_barrier(instruction: Instruction) -> bool:
+    return isinstance(instruction, Label) or (isinstance(instruction, CInstruction) and instruction.jump is not None)
@@ -0,0 +1,197 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import IO, Iterable, Optional
+
+from hackassembler.errors import RomFormatError
+from hackassembler.symbolmanager import SymbolManager
+
+HACK_EXTENSION = ".hack"
+HACKBIN_EXTENSION = ".hackbin"
+
+# Number of words formatted and written at once by write_hack
+WRITE_CHUNK_SIZE = 8192
+
+# magic, version, flags, number of words, crc32 of the words.
+# The header is 16 bytes long, so the words that follow it are aligned for a uint16 view
+HACKBIN_HEADER = struct.Struct("<4sHHII")
+HACKBIN_MAGIC = b"HACK"
+HACKBIN_VERSION = 1
+FLAG_SYMBOLS = 0b1
+
+# kind, value, length of the name that follows
+SYMBOL_ENTRY = struct.Struct("<BHH")
+SYMBOL_COUNT = struct.Struct("<I")
+SYMBOL_LABEL = 0
+SYMBOL_VARIABLE = 1
+
+# name -> (kind, value)
+Symbols = dict[str, tuple[int, int]]
+
+
+def write_hack(commands: array, output_stream: IO[str]):
+    for start in range(0, len(commands), WRITE_CHUNK_SIZE):
+        if start > 0:
+            output_stream.write("\n")
+        chunk = commands[start:start + WRITE_CHUNK_SIZE]
+        output_stream.write("\n".join(f"{command:016b}" for command in chunk))
+
+
+def read_hack(input_stream: Iterable[str]) -> array:
+    commands = array("H")
+    for lineno, line in enumerate(input_stream, 1):
+        line = line.strip()
+        if line == "":
+            continue
+        if len(line) != 16 or line.strip("01") != "":
+            raise RomFormatError(f"Line {lineno} is not a 16 bit binary word: '{line}'")
+        commands.append(int(line, 2))
+    return commands
+
+
+def write_hackbin(commands: array, output_stream: IO[bytes], symbols: Optional[Symbols] = None):
+    words = _to_little_endian(commands)
+    flags = FLAG_SYMBOLS if symbols is not None else 0
+    output_stream.write(HACKBIN_HEADER.pack(HACKBIN_MAGIC, HACKBIN_VERSION, flags, len(words), zlib.crc32(words)))
+    output_stream.write(words.tobytes())
+
+    if symbols is not None:
+        output_stream.write(SYMBOL_COUNT.pack(len(symbols)))
+        for name, (kind, value) in symbols.items():
+            encoded_name = name.encode()
+            output_stream.write(SYMBOL_ENTRY.pack(kind, value, len(encoded_name)))
+            output_stream.write(encoded_name)
+
+
+def read_hackbin(input_stream: IO[bytes]) -> tuple[array, Optional[Symbols]]:
+    data = input_stream.read()
+    n_words, flags = _parse_header(data)
+
+    start = HACKBIN_HEADER.size
+    end = start + 2 * n_words
+    commands = array("H")
+    commands.frombytes(data[start:end])
+    if sys.byteorder == "big":
+        commands.byteswap()
+
+    symbols = None
+    if flags & FLAG_SYMBOLS:
+        symbols = _parse_symbols(data, end)
+    return commands, symbols
+
+
+def map_hackbin(file_path: str):
+    """
+    Maps the words of a .hackbin file into memory and returns them as a read-only
+    numpy uint16 array, without copying them.
+    """
+    import numpy as np
+
+    with open(file_path, 'rb') as f:
+        # An empty file can't be mapped
+        if os.fstat(f.fileno()).st_size < HACKBIN_HEADER.size:
+            raise RomFormatError("File is too short to be a .hackbin file")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    n_words, _ = _parse_header(mapped)
+    # The array keeps a reference to the map, so it stays open as long as the array is alive
+    return np.frombuffer(mapped, dtype="<u2", count=n_words, offset=HACKBIN_HEADER.size)
+
+
+def load_rom_array(file_path: str):
+    """
+    Loads a .hack or .hackbin file as a numpy uint16 array.
+    A .hackbin file is memory-mapped, a .hack file is parsed as a whole instead of line by line.
+    """
+    import numpy as np
+
+    if file_path.endswith(HACKBIN_EXTENSION):
+        return map_hackbin(file_path)
+
+    with open(file_path, 'rb') as rom_file:
+        lines = rom_file.read().split()
+    if any(len(line) != 16 for line in lines):
+        raise RomFormatError("Every line of a .hack file must be a 16 bit binary word")
+
+    bits = np.frombuffer(b"".join(lines), dtype=np.uint8).reshape(len(lines), 16) - ord("0")
+    if np.any(bits > 1):
+        raise RomFormatError("A .hack file may only contain 0 and 1")
+    weights = (1 << np.arange(15, -1, -1)).astype(np.uint16)
+    return (bits.astype(np.uint16) * weights).sum(axis=1, dtype=np.uint16)
+
+
+def read_rom(file_path: str) -> array:
+    if file_path.endswith(HACKBIN_EXTENSION):
+        with open(file_path, 'rb') as rom_file:
+            commands, _ = read_hackbin(rom_file)
+        return commands
+
+    with open(file_path, 'r') as rom_file:
+        return read_hack(rom_file)
+
+
+def write_rom(commands: array, file_path: str, symbols: Optional[Symbols] = None):
+    if file_path.endswith(HACKBIN_EXTENSION):
+        with open(file_path, 'wb') as rom_file:
+            write_hackbin(commands, rom_file, symbols)
+    else:
+        with open(file_path, 'w') as rom_file:
+            write_hack(commands, rom_file)
+
+
+def collect_symbols(symbol_manager: SymbolManager) -> Symbols:
+    symbols = {}
+    for kind, names in ((SYMBOL_LABEL, symbol_manager.label_symbols),
+                        (SYMBOL_VARIABLE, symbol_manager.variable_symbols)):
+        for name in names:
+            symbols[name] = (kind, symbol_manager.symbol_table[name])
+    return symbols
+
+
+def _to_little_endian(commands: array) -> array:
+    words = array("H", commands)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words
+
+
+def _parse_header(data) -> tuple[int, int]:
+    if len(data) < HACKBIN_HEADER.size:
+        raise RomFormatError("File is too short to be a .hackbin file")
+
+    magic, version, flags, n_words, checksum = HACKBIN_HEADER.unpack_from(data)
+    if magic != HACKBIN_MAGIC:
+        raise RomFormatError(f"Bad magic {magic!r}, this is not a .hackbin file")
+    if version != HACKBIN_VERSION:
+        raise RomFormatError(f"Unsupported .hackbin version {version}")
+
+    end = HACKBIN_HEADER.size + 2 * n_words
+    if len(data) < end:
+        raise RomFormatError(f"Header declares {n_words} words but the file is truncated")
+    if zlib.crc32(memoryview(data)[HACKBIN_HEADER.size:end]) != checksum:
+        raise RomFormatError("Checksum mismatch, the ROM image is corrupted")
+    return n_words, flags
+
+
+def _parse_symbols(data: bytes, offset: int) -> Symbols:
+    symbols = {}
+    if offset + SYMBOL_COUNT.size > len(data):
+        raise RomFormatError("The symbol table is missing")
+    n_symbols, = SYMBOL_COUNT.unpack_from(data, offset)
+    offset += SYMBOL_COUNT.size
+    for _ in range(n_symbols):
+        if offset + SYMBOL_ENTRY.size > len(data):
+            raise RomFormatError(f"The symbol table declares {n_symbols} symbols but the file is truncated")
+        kind, value, name_len = SYMBOL_ENTRY.unpack_from(data, offset)
+        offset += SYMBOL_ENTRY.size
+        if offset + name_len > len(data):
+            raise RomFormatError(f"The symbol table declares {n_symbols} symbols but the file is truncated")
+        try:
+            name = data[offset:offset + name_len].decode()
+        except UnicodeDecodeError:
+            raise RomFormatError(f"Symbol {len(symbols)} of the symbol table is not valid UTF-8")
+        offset += name_len
+        symbols[name] = (kind, value)
+    return symbols
@@ -1,32 +1,41 @@
 import re
+from types import MappingProxyType
 
-from hackassembler.errors import MultipleSymbolDefinitionError, BadSymbolNameError
+from hackassembler.errors import AssemblerError, MultipleSymbolDefinitionError, BadSymbolNameError
 
-PREDEFINED_SYMBOLS = {
+PREDEFINED_SYMBOLS = MappingProxyType({
     "SCREEN": 0X4000,
     "KBD": 0X6000,
     "SP": 0,
     "LCL": 1,
     "ARG": 2,
     "THIS": 3,
-    "THAT": 4
-}
-PREDEFINED_SYMBOLS.update((f"R{i}", i) for i in range(16))
+    "THAT": 4,
+    **{f"R{i}": i for i in range(16)}
+})
 BASE_VARIABLE_SYMBOL_POSITION = 16
+LABEL_SYMBOL_REGEX = re.compile(r"^([a-zA-Z_.][a-zA-Z_.$0-9]*)$")
 
 
 class SymbolManager(object):
     def __init__(self):
-        self.label_symbol_regex = re.compile(r"^([a-zA-Z_.][a-zA-Z_.$0-9]*)$")
-        self.symbol_table = PREDEFINED_SYMBOLS.copy()
+        self.label_symbol_regex = LABEL_SYMBOL_REGEX
+        self.symbol_table = dict(PREDEFINED_SYMBOLS)
         self.symbols_to_resolve = []
         self.variable_symbol_position = BASE_VARIABLE_SYMBOL_POSITION
+        self.label_symbols: list[str] = []
+        self.variable_symbols: list[str] = []
+        # Commands that got the address of a label, which moves when the code is relocated
+        self.label_references: list[int] = []
 
     def try_resolve_symbol(self, line: str, cur_command: int) -> int:
         symbol = self._verify_symbol(line)
 
         resolved_symbol = self.symbol_table.get(symbol)
         if resolved_symbol is not None:
+            # Variables are only added to the table at the end, so this is either predefined or a label
+            if symbol not in PREDEFINED_SYMBOLS:
+                self.label_references.append(cur_command)
             return resolved_symbol
         else:
             self.symbols_to_resolve.append((symbol, cur_command))
@@ -40,6 +49,7 @@ class SymbolManager(object):
             raise MultipleSymbolDefinitionError(f"Symbol was already defined at command {old_definition}")
 
         self.symbol_table[symbol] = cur_command
+        self.label_symbols.append(symbol)
 
     def resolve_all_symbols(self, commands):
         for symbol, index in self.symbols_to_resolve:
@@ -47,10 +57,30 @@ class SymbolManager(object):
             if resolved_symbol is None:
                 resolved_symbol = self.variable_symbol_position
                 self.variable_symbol_position += 1
-            assert resolved_symbol < 2 ** 15
+                self.variable_symbols.append(symbol)
+            if resolved_symbol >= 2 ** 15:
+                raise AssemblerError(f"Symbol {symbol} is at address {resolved_symbol}, beyond 2^15", f"@{symbol}")
             self.symbol_table[symbol] = resolved_symbol
             commands[index] = resolved_symbol
 
+    def resolve_local_symbols(self, commands) -> list[tuple[str, int]]:
+        """
+        Resolves only the references to labels defined in this unit, for relocatable output.
+        The rest are either labels of other units or variables, which only the linker can tell.
+
+        :return: The unresolved (symbol, command index) pairs, in the order they were referenced
+        """
+        external_references = []
+        for symbol, index in self.symbols_to_resolve:
+            resolved_symbol = self.symbol_table.get(symbol)
+            if resolved_symbol is None:
+                external_references.append((symbol, index))
+            else:
+                commands[index] = resolved_symbol
+                self.label_references.append(index)
+        self.label_references.sort()
+        return external_references
+
     def _verify_symbol(self, line) -> str:
         match = self.label_symbol_regex.match(line)
         if not match:
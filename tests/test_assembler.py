@@ -1,6 +1,12 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from hackassembler.assembler import Assembler
+from benchmarks.suite import time_phases
+from hackassembler import cparser, parallel, romio
+from hackassembler.assembler import Assembler, AssemblyContext
+from hackassembler.instructions import AInstruction, CInstruction, parse_program
 from hackassembler.errors import AssemblerError, MultipleSymbolDefinitionError, BadSymbolNameError
 
 
@@ -80,6 +86,10 @@ def test_a_command_large_number():
     asm.assemble(["@32767"])  # Should pass
     with pytest.raises(AssemblerError):
         asm.assemble(["@32768"])
+    # A label past the end of the ROM
+    with pytest.raises(AssemblerError) as e:
+        asm.assemble(["@END"] + ["D=A"] * 2 ** 15 + ["(END)"])
+    assert e.value.line == "@END"
 
 
 def test_bad_symbol_name():
@@ -97,3 +107,131 @@ def test_bad_symbol_name():
         asm.assemble(["@abcA;BC"])
     with pytest.raises(BadSymbolNameError):
         asm.assemble(["(abc;)"])
+
+
+def test_c_instruction_table_matches_regex_parser():
+    for line, command in cparser.C_INSTRUCTION_TABLE.items():
+        assert cparser._parse_c_instruction_slow(line) == command
+
+    assert cparser.parse_c_instruction("AM=M-1") == 0b1111110010101000
+    assert cparser.parse_c_instruction("0;JMP") == 0b1110101010000111
+
+
+def test_bad_c_instruction_errors():
+    with pytest.raises(AssemblerError, match=r"comp 'D\+D'"):
+        cparser.parse_c_instruction("D=D+D")
+    with pytest.raises(AssemblerError, match="dest 'DM'"):
+        cparser.parse_c_instruction("DM=D")
+    with pytest.raises(AssemblerError, match="jump 'JJJ'"):
+        cparser.parse_c_instruction("0;JJJ")
+
+
+def test_repeated_lines():
+    code = ["M=D // comment\n", "@x\n", "M=D // comment\n", "@x\n", "\n", "D=D+D\n", "D=D+D\n"]
+    asm = Assembler()
+    with pytest.raises(AssemblerError) as e:
+        asm.assemble(code)
+    assert e.value.lineno == 6
+
+    code = asm.assemble(code[:5])
+    assert code.splitlines() == [f"{0b1110001100001000:016b}", f"{16:016b}"] * 2
+
+
+def test_assemble_to_array(monkeypatch):
+    code = """
+    @END_LOOP
+    0;JMP
+    @var
+    M=D
+    (END_LOOP)
+    @var
+    D=M
+    """
+    asm = Assembler()
+    commands = asm.assemble_to_array(iter(code.splitlines()))
+    assert commands.typecode == "H"
+    assert list(commands) == [4, 0b1110101010000111, 16, 0b1110001100001000, 16, 0b1111110000010000]
+
+    monkeypatch.setattr(romio, "WRITE_CHUNK_SIZE", 4)
+    output = io.StringIO()
+    romio.write_hack(commands, output)
+    assert output.getvalue() == asm.assemble(code.splitlines())
+
+
+def test_parallel_assembly_is_identical():
+    code = """
+    @Main.func
+    0;JMP
+    (Main.loop)
+    @counter
+    M=M+1
+    @Main.loop
+    0;JMP
+    @other
+    D=M
+    (Main.func)
+    @other
+    M=D
+    @Main.end
+    0;JMP
+    @counter
+    D=M
+    (Main.end)
+    @Main.loop
+    0;JMP
+    """.splitlines()
+    commands, _ = parallel.assemble_parallel(code, max_workers=2, chunk_lines=5)
+    assert commands == Assembler().assemble_to_array(code)
+
+
+def test_parallel_assembly_error_line():
+    code = ["@a", "M=D", "@b", "D=D+D", "@c"]
+    with pytest.raises(AssemblerError) as e:
+        parallel.assemble_parallel(code, max_workers=2, chunk_lines=2)
+    assert e.value.lineno == 4
+
+
+def test_assemble_instructions():
+    code = """
+    @counter
+    M=0
+    (LOOP)
+    @counter
+    MD=M+1
+    @100
+    D=D-A
+    @LOOP
+    D;JLT
+    """.splitlines()
+    instructions = parse_program(code)
+    assert Assembler().assemble_instructions(instructions) == Assembler().assemble_to_array(code)
+
+    with pytest.raises(AssemblerError) as e:
+        Assembler().assemble_instructions([AInstruction(1), CInstruction("D", "D+D")])
+    assert e.value.lineno == 2
+
+
+def test_shared_assembler_in_threads():
+    programs = [[f"@var{index}", "M=0", f"(LOOP{index})", f"@LOOP{index}", "0;JMP", "@other", "D=M"]
+                for index in range(8)]
+    expected = [Assembler().assemble_to_array(program) for program in programs]
+
+    # A context holds the state of a single call
+    assembler = Assembler()
+    contexts = [AssemblyContext() for _ in range(len(programs) * 20)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(assembler.assemble_to_array, programs * 20, contexts))
+    assert results == expected * 20
+    # Every program got its own symbols
+    assert contexts[3].symbol_manager.variable_symbols == ["var3", "other"]
+    # The assembler itself keeps no state of the calls
+    assert vars(assembler) == {}
+
+    with pytest.raises(TypeError):
+        cparser.C_INSTRUCTION_TABLE["D=D"] = 0
+
+
+def test_benchmark_phases():
+    phases = time_phases([["@2", "D=A", "(LOOP)", "@counter", "M=D", "@LOOP", "0;JMP"]], repeat=1)
+    assert set(phases) == {"parse", "resolve", "write", "total"}
+    assert phases["total"] == pytest.approx(phases["parse"] + phases["resolve"] + phases["write"])
@@ -0,0 +1,78 @@
+from hackassembler import instructions
+from hackassembler.controlflow import ControlFlowOptimizer
+
+
+def _optimize(code: str) -> tuple[list[str], ControlFlowOptimizer]:
+    optimizer = ControlFlowOptimizer()
+    program = optimizer.optimize(instructions.parse_program(code.splitlines()))
+    return [str(instruction) for instruction in program], optimizer
+
+
+def test_thread_jumps():
+    code = """
+    @x
+    D=M
+    @A
+    D;JNE
+    @B
+    0;JMP
+    (A)
+    @C
+    0;JMP
+    (B)
+    @C
+    0;JMP
+    (C)
+    @x
+    M=D
+    (END)
+    @END
+    0;JMP
+    """
+    program, optimizer = _optimize(code)
+    # Both paths lead to C, which becomes the next instruction
+    assert program == ["@x", "D=M", "@x", "M=D", "(END)", "@END", "0;JMP"]
+    assert optimizer.stats["jumps threaded"] == 2
+    assert optimizer.stats["jumps to the next instruction removed"] == 3
+
+
+def test_remove_unreachable():
+    code = """
+    @RET
+    D=A
+    @FUNC
+    0;JMP
+    (RET)
+    @RET
+    0;JMP
+    @dead
+    M=1
+    (UNUSED_FUNC)
+    @FUNC
+    0;JMP
+    (FUNC)
+    @R14
+    M=D
+    A=M
+    0;JMP
+    """
+    program, optimizer = _optimize(code)
+    assert program == ["@RET", "D=A", "@FUNC", "0;JMP", "(RET)", "@RET", "0;JMP",
+                       "(FUNC)", "@R14", "M=D", "A=M", "0;JMP"]
+    assert optimizer.stats["unreachable instructions removed"] == 2
+    assert optimizer.stats["unreachable labels removed"] == 1
+    assert optimizer.stats["jumps to the next instruction removed"] == 1
+
+
+def test_keep_a_when_used_after_label():
+    # The code after LOOP uses A, so the jump to it must stay
+    code = """
+    @LOOP
+    0;JMP
+    (LOOP)
+    M=0
+    @LOOP
+    0;JMP
+    """
+    program, _ = _optimize(code)
+    assert program == ["@LOOP", "0;JMP", "(LOOP)", "M=0", "@LOOP", "0;JMP"]
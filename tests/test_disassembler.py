@@ -0,0 +1,58 @@
+import numpy as np
+
+from hackassembler import cparser, romio
+from hackassembler.assembler import Assembler, AssemblyContext
+from hackassembler.disassembler import disassemble
+
+CODE = """
+    @256
+    D=A
+    @SP
+    M=D
+    (LOOP)
+    @counter
+    M=M+1
+    D=M
+    @LOOP
+    D;JGT
+    @LOOP
+    0;JMP
+"""
+
+
+def test_disassemble_all_c_instructions():
+    lines = list(cparser.C_INSTRUCTION_TABLE)
+    words = np.array([cparser.C_INSTRUCTION_TABLE[line] for line in lines], dtype=np.uint16)
+    assert disassemble(words) == lines
+
+
+def test_disassemble_round_trip():
+    asm = Assembler()
+    commands = asm.assemble_to_array(CODE.splitlines())
+    lines = disassemble(np.frombuffer(commands, dtype=np.uint16))
+    assert lines == ["@256", "D=A", "@0", "M=D", "@16", "M=M+1", "D=M", "@4", "D;JGT", "@4", "0;JMP"]
+    assert asm.assemble_to_array(lines) == commands
+
+
+def test_disassemble_with_symbols(tmp_path):
+    context = AssemblyContext()
+    commands = Assembler().assemble_to_array(CODE.splitlines(), context)
+    file_path = str(tmp_path / "rom.hackbin")
+    romio.write_rom(commands, file_path, romio.collect_symbols(context.symbol_manager))
+
+    with open(file_path, 'rb') as rom_file:
+        _, symbols = romio.read_hackbin(rom_file)
+    lines = disassemble(romio.load_rom_array(file_path), symbols)
+    assert lines == ["@256", "D=A", "@0", "M=D", "(LOOP)", "@counter", "M=M+1", "D=M", "@LOOP", "D;JGT",
+                     "@LOOP", "0;JMP"]
+
+
+def test_invalid_comp():
+    assert disassemble([0b1110000001000000]) == ["// invalid comp bits in 1110000001000000"]
+
+
+def test_load_hack_file(tmp_path):
+    commands = Assembler().assemble_to_array(CODE.splitlines())
+    file_path = str(tmp_path / "rom.hack")
+    romio.write_rom(commands, file_path)
+    assert romio.load_rom_array(file_path).tolist() == commands.tolist()
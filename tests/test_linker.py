@@ -0,0 +1,66 @@
+import io
+
+import pytest
+
+from hackassembler import romio
+from hackassembler.assembler import Assembler, AssemblyContext
+from hackassembler.errors import LinkerError
+from hackassembler.linker import Linker
+from hackassembler.objectfile import ObjectFile
+
+MAIN = """
+    @Lib.func
+    0;JMP
+    (Main.loop)
+    @Lib.counter
+    M=M+1
+    @Main.loop
+    0;JMP
+    @Main.static
+    D=M
+"""
+LIB = """
+    (Lib.func)
+    @Lib.counter
+    M=0
+    @Main.static
+    M=D
+    @Lib.end
+    0;JMP
+    (Lib.end)
+    @Main.loop
+    0;JMP
+"""
+
+
+def _assemble_object(code: str) -> ObjectFile:
+    obj = Assembler().assemble_object(code.splitlines())
+    output = io.StringIO()
+    obj.write(output)
+    output.seek(0)
+    return ObjectFile.read(output)
+
+
+def test_link_matches_monolithic_assembly():
+    objects = [_assemble_object(MAIN), _assemble_object(LIB)]
+    linker = Linker()
+    code = linker.link(objects)
+
+    context = AssemblyContext()
+    assert code == Assembler().assemble_to_array((MAIN + LIB).splitlines(), context)
+    assert linker.symbols == romio.collect_symbols(context.symbol_manager)
+    assert linker.symbols["Lib.counter"] == (romio.SYMBOL_VARIABLE, 16)
+    assert linker.symbols["Main.static"] == (romio.SYMBOL_VARIABLE, 17)
+    assert linker.symbols["Lib.end"] == (romio.SYMBOL_LABEL, 14)
+
+
+def test_object_relocations():
+    obj = _assemble_object(LIB)
+    assert obj.labels == {"Lib.func": 0, "Lib.end": 6}
+    assert obj.relocations == [4]
+    assert obj.external_references == [("Lib.counter", 0), ("Main.static", 2), ("Main.loop", 6)]
+
+
+def test_duplicate_labels():
+    with pytest.raises(LinkerError):
+        Linker().link([_assemble_object(LIB), _assemble_object(LIB)])
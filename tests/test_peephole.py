@@ -0,0 +1,69 @@
+import pytest
+
+from hackassembler import instructions
+from hackassembler.errors import AssemblerError, BadSymbolNameError
+from hackassembler.instructions import AInstruction, CInstruction, Label
+from hackassembler.peephole import PeepholeOptimizer
+
+
+def _optimize(code: str) -> tuple[list[str], PeepholeOptimizer]:
+    optimizer = PeepholeOptimizer()
+    program = optimizer.optimize(instructions.parse_program(code.splitlines()))
+    return [str(instruction) for instruction in program], optimizer
+
+
+def test_parse_program():
+    program = instructions.parse_program(["@SP // comment", "", "AM=M-1", "(LOOP)", "@12", "0;JMP"])
+    assert program == [AInstruction("SP"), CInstruction("AM", "M-1"), Label("LOOP"), AInstruction(12),
+                       CInstruction(None, "0", "JMP")]
+    assert instructions.format_program(program) == "@SP\nAM=M-1\n(LOOP)\n@12\n0;JMP\n"
+
+    with pytest.raises(AssemblerError) as e:
+        instructions.parse_program(["@SP", "D=D+D"])
+    assert e.value.lineno == 2
+    with pytest.raises(BadSymbolNameError):
+        instructions.parse_program(["@1abc"])
+
+
+def test_push_then_pop():
+    code = """
+    // push local 0
+    @LCL
+    A=M
+    D=M
+    @SP
+    A=M
+    M=D
+    @SP
+    M=M+1
+    // pop to R5
+    @SP
+    AM=M-1
+    D=M
+    @R5
+    M=D
+    """
+    program, optimizer = _optimize(code)
+    assert program == ["@LCL", "A=M", "D=M", "@SP", "A=M", "M=D", "@R5", "M=D"]
+    assert optimizer.hits == {"redundant-a-reload": 1, "increment-decrement": 1, "stack-top-reload": 1,
+                              "store-reload": 1}
+    assert sum(optimizer.removed.values()) == 5
+
+
+def test_labels_and_jumps_are_barriers():
+    code = """
+    @SP
+    M=M+1
+    (LOOP)
+    @SP
+    AM=M-1
+    @x
+    D;JEQ
+    @y
+    """
+    program, optimizer = _optimize(code)
+    assert program == ["@SP", "M=M+1", "(LOOP)", "@SP", "AM=M-1", "@x", "D;JEQ", "@y"]
+    assert not optimizer.hits
+
+    program, _ = _optimize("@x\nD=M\n@x\nM=D\n@y\n@z\n")
+    assert program == ["@x", "D=M", "@z"]
@@ -0,0 +1,85 @@
+import io
+from array import array
+
+import numpy as np
+import pytest
+
+from hackassembler import romio
+from hackassembler.assembler import Assembler, AssemblyContext
+from hackassembler.errors import RomFormatError
+
+CODE = """
+    @END_LOOP
+    0;JMP
+    @counter
+    M=D
+    (END_LOOP)
+    @counter
+    D=M
+"""
+
+
+def test_hack_round_trip():
+    commands = Assembler().assemble_to_array(CODE.splitlines())
+    output = io.StringIO()
+    romio.write_hack(commands, output)
+    output.seek(0)
+    assert romio.read_hack(output) == commands
+
+    with pytest.raises(RomFormatError):
+        romio.read_hack(["0101"])
+
+
+def test_hackbin_round_trip():
+    context = AssemblyContext()
+    commands = Assembler().assemble_to_array(CODE.splitlines(), context)
+    symbols = romio.collect_symbols(context.symbol_manager)
+    assert symbols == {"END_LOOP": (romio.SYMBOL_LABEL, 4), "counter": (romio.SYMBOL_VARIABLE, 16)}
+
+    output = io.BytesIO()
+    romio.write_hackbin(commands, output, symbols)
+    assert len(output.getvalue()) > romio.HACKBIN_HEADER.size + 2 * len(commands)
+
+    output.seek(0)
+    assert romio.read_hackbin(output) == (commands, symbols)
+
+    output = io.BytesIO()
+    romio.write_hackbin(commands, output)
+    output.seek(0)
+    assert romio.read_hackbin(output) == (commands, None)
+
+
+def test_hackbin_corrupted():
+    output = io.BytesIO()
+    romio.write_hackbin(array("H", [1, 2, 3]), output)
+    data = bytearray(output.getvalue())
+    data[-1] ^= 0xFF
+    with pytest.raises(RomFormatError):
+        romio.read_hackbin(io.BytesIO(data))
+    with pytest.raises(RomFormatError):
+        romio.read_hackbin(io.BytesIO(b"HACK"))
+
+    # The symbol table is outside of the checksum, so a truncated one is found while parsing it
+    output = io.BytesIO()
+    romio.write_hackbin(array("H", [1, 2, 3]), output, {"LOOP": (romio.SYMBOL_LABEL, 1)})
+    data = output.getvalue()
+    for end in (len(data) - 1, len(data) - len("LOOP") - 1, len(data) - len("LOOP") - romio.SYMBOL_ENTRY.size):
+        with pytest.raises(RomFormatError):
+            romio.read_hackbin(io.BytesIO(data[:end]))
+
+
+def test_map_hackbin(tmp_path):
+    commands = array("H", [0, 0xFFFF, 0x8000, 12345])
+    file_path = str(tmp_path / "rom.hackbin")
+    romio.write_rom(commands, file_path, symbols={})
+
+    words = romio.map_hackbin(file_path)
+    assert words.dtype == np.uint16
+    assert not words.flags.owndata
+    assert words.tolist() == commands.tolist()
+    assert romio.read_rom(file_path) == commands
+
+    empty_path = tmp_path / "empty.hackbin"
+    empty_path.write_bytes(b"")
+    with pytest.raises(RomFormatError):
+        romio.map_hackbin(str(empty_path))
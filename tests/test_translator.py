@@ -1,8 +1,25 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from vmtranslator import parser, vmtranslator
-from vmtranslator.errors import TranslatorError
-from vmtranslator.vmcommands import Push, Pop
+from benchmarks.hackcpu import HackCPU
+from benchmarks.profile_vm import profile_folder
+from compiler.jackcompiler import JackCompiler
+from hackassembler import romio
+from hackassembler.assembler import Assembler
+from hackassembler.instructions import AInstruction, CInstruction, Label, parse_program
+from vmtranslator import asmgenerator, hackbackend, parser, vmbinary, vmtranslator
+from vmtranslator.codesize import CodeSizeStats
+from vmtranslator.deadcode import DeadFunctionEliminator
+from vmtranslator.errors import BytecodeFormatError, TranslatorError
+from vmtranslator.inliner import VMInliner
+from vmtranslator.layout import ExecutionProfile, ProfileLayout
+from vmtranslator.optimizer import VMOptimizer
+from vmtranslator.templateengine import AsmTemplate
+from vmtranslator.translationcache import TranslatedFile, TranslationCache
+from vmtranslator.vmcommands import Push, Pop, Segment
 
 
 def test_push_pop():
@@ -43,6 +60,36 @@ def test_call_arguments():
     parser.parse_line("call .$myfunc 3")
 
 
+def test_parse_text(tmp_path):
+    code = """
+    // A comment
+    function Main.f 0
+    push local 1   // The first local
+    add
+    push local 1
+    add
+    if-goto Main.f$end
+    """
+    commands = list(parser.parse_text(code))
+    assert [line_number for line_number, _ in commands] == [3, 4, 5, 6, 7, 8]
+    assert [str(command) for _, command in commands] == \
+           [str(parser.parse_line(parser.strip_line(line))) for line in code.splitlines() if parser.strip_line(line)]
+    # Repeated lines share their command, which has no __dict__
+    assert commands[2][1] is commands[4][1]
+    assert not hasattr(commands[1][1], "__dict__")
+
+    (tmp_path / "Main.vm").write_text(code)
+    assert [str(command) for _, command in parser.parse_file(str(tmp_path / "Main.vm"))] == \
+           [str(command) for _, command in commands]
+
+    with pytest.raises(TranslatorError) as e:
+        list(parser.parse_text("add\n\npush local -1\n"))
+    assert e.value.lineno == 3
+    assert e.value.line == "push local -1"
+
+    assert Push.create(Segment.local, 2).segment == Push(["local", "2"]).segment
+
+
 def test_translator_sanity():
     code = """
     push constant 17
@@ -141,3 +188,710 @@ def test_branching_sanity():
 
     """
     vmtranslator.translate_text(code)
+
+
+def _optimize(code: str) -> tuple[list[str], VMOptimizer]:
+    optimizer = VMOptimizer()
+    commands = [parser.parse_line(line.strip()) for line in code.strip().splitlines()]
+    optimized = optimizer.optimize(enumerate(commands, 1))
+    return [str(command) for _, command in optimized], optimizer
+
+
+def test_optimizer_constant_folding():
+    optimized, optimizer = _optimize("""
+    push constant 1
+    neg
+    push constant 0
+    not
+    push constant 7
+    push constant 3
+    sub
+    push constant 2
+    push constant 5
+    gt
+    """)
+    assert optimized == ["push value -1", "push value -1", "push value 4", "push value 0"]
+    assert optimizer.removed["fold-binary"] == 4
+
+
+def test_optimizer_folding_wraps_like_the_cpu():
+    optimized, _ = _optimize("""
+    push constant 32767
+    push constant 1
+    add
+    """)
+    # -32768 can't be pushed in one load, so the addition is kept
+    assert optimized == ["push constant 32767", "push constant 1", "add"]
+
+    optimized, _ = _optimize("""
+    push constant 32767
+    neg
+    push constant 2
+    gt
+    """)
+    # -32767 - 2 overflows to a positive number in the CPU
+    assert optimized == ["push value -1"]
+
+
+def test_optimizer_push_pop_move():
+    optimized, _ = _optimize("""
+    push local 0
+    pop local 1
+    push constant 5
+    neg
+    pop this 2
+    """)
+    assert optimized == ["move local 0 to local 1", "move constant -5 to this 2"]
+
+
+def test_optimizer_keeps_labels_as_barriers():
+    optimized, _ = _optimize("""
+    push local 0
+    label LOOP
+    pop local 1
+    """)
+    assert optimized == ["push local 0", "label LOOP", "pop local 1"]
+
+
+def test_optimizer_discards_unused_temp():
+    optimized, optimizer = _optimize("""
+    call Foo.bar 0
+    pop temp 0
+    call Foo.bar 0
+    pop temp 0
+    push temp 0
+    """)
+    assert optimized == ["call Foo.bar 0", "discard", "call Foo.bar 0", "pop temp 0", "push temp 0"]
+    assert optimizer.hits["discard"] == 1
+
+    # The value may be read after a jump, so nothing is discarded
+    optimized, _ = _optimize("""
+    pop temp 0
+    label L
+    push temp 0
+    """)
+    assert optimized == ["pop temp 0", "label L", "push temp 0"]
+
+
+def test_optimized_translation():
+    code = """
+    function Foo.main 2
+    push constant 0
+    not
+    pop local 1
+    push argument 3
+    pop that 4
+    call Foo.main 0
+    pop temp 0
+    push constant 1
+    return
+    """
+    output = vmtranslator.translate_text(code, optimizer=VMOptimizer())
+    assert "// move constant -1 to local 1\n" in output
+    assert "// discard\n" in output
+    assert "@R13\n" in output
+    assert len(output.splitlines()) < len(vmtranslator.translate_text(code).splitlines())
+
+    with pytest.raises(TranslatorError) as e:
+        vmtranslator.translate_text("push constant 1\npop temp 9", optimizer=VMOptimizer())
+    assert e.value.lineno == 2
+
+
+def test_shared_routines():
+    code = """
+    function Foo.main 0
+    push constant 1
+    push constant 2
+    lt
+    call Foo.bar 1
+    return
+    """
+    asm_gen = asmgenerator.AsmGenerator(shared_routines=True)
+    asm_gen.set_source_file("Foo.vm")
+    with io.StringIO(code) as source, io.StringIO() as output:
+        vmtranslator.VMTranslator(asm_gen).translate(source, output)
+        shared = output.getvalue()
+
+    assert "@RUNTIME$CALL\n0;JMP\n" in shared
+    assert "@RUNTIME$RETURN\n0;JMP\n" in shared
+    assert "@RUNTIME$LT\n0;JMP\n" in shared
+    assert len(shared.splitlines()) < len(vmtranslator.translate_text(code, "Foo.vm").splitlines())
+
+    runtime = asm_gen.generate_runtime()
+    for routine in ("CALL", "RETURN", "EQ", "GT", "LT"):
+        assert f"(RUNTIME${routine})\n" in runtime
+    assert asm_gen.generate_init().startswith(asmgenerator.AsmGenerator().generate_init())
+    assert asm_gen.generate_runtime(skip=True).startswith("// Skip over the runtime routines\n@RUNTIME$END\n")
+
+
+def test_optimizer_branch_fusion():
+    optimized, optimizer = _optimize("""
+    push local 0
+    push constant 5
+    lt
+    not
+    if-goto END
+    push local 1
+    push local 2
+    eq
+    if-goto END
+    push local 3
+    not
+    if-goto END
+    push argument 1
+    if-goto END
+    push constant 0
+    if-goto END
+    push constant 0
+    not
+    if-goto END
+    """)
+    assert optimized == ["push local 0", "push constant 5", "if-goto END if not lt",
+                         "push local 1", "push local 2", "if-goto END if eq",
+                         "push local 3", "if-goto END if not",
+                         "if-goto END if argument 1",
+                         "goto END"]
+    assert optimizer.hits["compare-not-goto"] == 1
+    assert optimizer.removed["push-goto"] == 4
+
+
+def test_branch_fusion_translation():
+    code = """
+    push local 1
+    push constant 2
+    gt
+    not
+    if-goto END
+    pop temp 0
+    push that 3
+    if-goto END
+    label END
+    """
+    output = vmtranslator.translate_text(code, optimizer=VMOptimizer())
+    assert "@END\nD;JLE\n" in output
+    assert "@THAT\nA=D+M\nD=M\n@END\nD;JNE\n" in output
+
+
+def _run_translated(code: str, **generator_options) -> HackCPU:
+    asm_gen = asmgenerator.AsmGenerator(**generator_options)
+    asm_gen.set_source_file("Main.vm")
+    with io.StringIO(code) as source, io.StringIO() as output:
+        output.write(asm_gen.generate_init())
+        vmtranslator.VMTranslator(asm_gen).translate(source, output)
+        asm = output.getvalue()
+    cpu = HackCPU(Assembler().assemble_to_array(asm.splitlines()))
+    cpu.run(100000)
+    assert cpu.halted
+    return cpu
+
+
+def test_hack_cpu():
+    # A jump goes to the address that A held before the instruction
+    cpu = HackCPU(Assembler().assemble_to_array(["@4", "A=A+1;JMP", "@1", "D=A", "@2", "D=A", "(END)", "@END",
+                                                 "0;JMP"]))
+    cpu.run(100)
+    assert cpu.halted and cpu.d == 2
+
+    # The memory is addressed by the lower 15 bits of A
+    cpu = HackCPU(Assembler().assemble_to_array(["A=-1", "D=M", "D=D+1", "A=-1", "M=D", "(END)", "@END", "0;JMP"]))
+    cpu.ram[0x7FFF] = 9
+    cpu.run(100)
+    assert cpu.halted and cpu.ram[0x7FFF] == 10
+
+
+def test_cache_top():
+    code = """
+    function Sys.init 1
+    push constant 7
+    push constant 3
+    sub
+    push constant 2
+    neg
+    lt
+    not
+    pop static 0
+    push constant 10
+    pop local 0
+    label LOOP
+    push local 0
+    push constant 1
+    sub
+    pop local 0
+    push static 1
+    push local 0
+    add
+    pop static 1
+    push local 0
+    push constant 0
+    gt
+    if-goto LOOP
+    push constant 300
+    pop pointer 1
+    push static 1
+    pop that 4
+    call Sys.init2 0
+    pop temp 0
+    return
+    function Sys.init2 0
+    push constant 5
+    push constant 5
+    eq
+    return
+    """
+    plain = _run_translated(code)
+    cached = _run_translated(code, cache_top=True)
+    assert cached.ram[16] == plain.ram[16] == 0xFFFF
+    assert cached.ram[17] == plain.ram[17] == 45
+    assert cached.ram[304] == plain.ram[304] == 45
+    assert cached.cycles < plain.cycles
+
+    shared_cached = _run_translated(code, cache_top=True, shared_routines=True)
+    assert shared_cached.ram[16:18] == plain.ram[16:18]
+
+
+def test_compiled_template():
+    template = AsmTemplate("TEST", "// push {segment} {i}\n@{i}\nD=A\n@{segment}_END\nD;{jump}\n({segment}_END)\n")
+    code = template.render(segment="LCL", i=3, jump="JGT")
+    assert code.lines == ("// push LCL 3", AInstruction(3), CInstruction("D", "A"), AInstruction("LCL_END"),
+                          CInstruction(None, "D", "JGT"), Label("LCL_END"))
+    assert str(code) == "// push LCL 3\n@3\nD=A\n@LCL_END\nD;JGT\n(LCL_END)\n"
+    assert code.instructions()[0] == AInstruction(3)
+
+    static = AsmTemplate("STATIC", "@SP\nM=M-1\n")
+    assert static.render() is static.render()
+
+
+def test_generate_instructions():
+    asm_gen = asmgenerator.AsmGenerator()
+    asm_gen.set_source_file("Foo.vm")
+    push = parser.parse_line("push static 2")
+    instructions = asm_gen.generate_instructions(push, 1)
+    assert instructions[0] == AInstruction("Foo.2")
+    assert asm_gen.generate_code(push, 5) is asm_gen.generate_code(push, 1)
+
+    function = parser.parse_line("function Foo.bar 3")
+    code = asm_gen.generate_code(function, 2)
+    assert Label("Foo.bar") in code.instructions()
+    assert "// push 3 locals\n" in str(code)
+
+    # Every comparison needs its own labels
+    eq = parser.parse_line("eq")
+    assert asm_gen.generate_code(eq, 3) != asm_gen.generate_code(eq, 4)
+
+    # The same code is generated from the records and from the text
+    commands = [parser.parse_line(line) for line in ["push constant 7", "pop local 2", "lt", "call Foo.bar 1",
+                                                     "return"]]
+    asm = "".join(asm_gen.generate_asm(command, i) for i, command in enumerate(commands))
+    records = [instruction for i, command in enumerate(commands)
+               for instruction in asm_gen.generate_instructions(command, i)]
+    assert records == parse_program(asm.splitlines())
+
+
+def test_hack_backend(tmp_path):
+    for file_name, code in (("Main.vm", "function Main.main 1\npush constant 3\npop local 0\ncall Main.f 0\nreturn\n"),
+                            ("Other.vm", "function Main.f 0\npush static 1\npush constant 2\nlt\nreturn\n")):
+        (tmp_path / file_name).write_text(code)
+
+    asm_file = vmtranslator.translate_folder(str(tmp_path), str(tmp_path / "text.asm"), shared_routines=True)
+    with open(asm_file) as f:
+        expected = Assembler().assemble_to_array(f)
+
+    hackbackend.build_folder(str(tmp_path), str(tmp_path / "fused.hackbin"), shared_routines=True,
+                             asm_file=str(tmp_path / "fused.asm"))
+    assert romio.read_rom(str(tmp_path / "fused.hackbin")) == expected
+    assert (tmp_path / "fused.asm").read_text() == (tmp_path / "text.asm").read_text()
+
+    output_file = hackbackend.build_file(str(tmp_path / "Main.vm"))
+    assert output_file == str(tmp_path / "Main.hack")
+
+
+def test_vm_bytecode(tmp_path):
+    code = "function Main.f 2\npush argument 0\npop local 1\nlabel Main.f$loop\npush local 1\npush constant 1\n" \
+           "sub\npop local 1\npush local 1\nif-goto Main.f$loop\ncall Math.abs 1\nreturn\n"
+    data = vmbinary.vm_to_vmb("// A comment\n" + code.replace("sub\n", "   sub   // Subtract\n"))
+    assert vmbinary.vmb_to_vm(data) == code
+    assert vmbinary.vm_to_vmb(code) == data
+    # Every name is kept once in the string table
+    assert data.count(b"Main.f$loop") == 1
+
+    with pytest.raises(BytecodeFormatError):
+        vmbinary.vmb_to_vm(data[:-1] + bytes([data[-1] ^ 1]))
+
+    text_folder = tmp_path / "text"
+    binary_folder = tmp_path / "binary"
+    for folder in (text_folder, binary_folder):
+        folder.mkdir()
+    (text_folder / "Main.vm").write_text(code)
+    (binary_folder / "Main.vmb").write_bytes(data)
+    vmtranslator.translate_folder(str(text_folder), str(tmp_path / "text.asm"), optimizer=VMOptimizer())
+    vmtranslator.translate_folder(str(binary_folder), str(tmp_path / "binary.asm"), optimizer=VMOptimizer())
+    # Only the file headers differ
+    text_lines, binary_lines = ((tmp_path / name).read_text().replace("Main.vmb", "Main.vm").splitlines()
+                                for name in ("text.asm", "binary.asm"))
+    assert [line for line in binary_lines if not line.startswith("///")] == \
+           [line for line in text_lines if not line.startswith("///")]
+
+    output_file = vmtranslator.translate_file(str(binary_folder / "Main.vmb"))
+    assert output_file == str(binary_folder / "Main.asm")
+    vmtranslator.translate_file(str(text_folder / "Main.vm"))
+    assert (binary_folder / "Main.asm").read_text() == (text_folder / "Main.asm").read_text()
+
+    (binary_folder / "Main.vm").write_text(code)
+    with pytest.raises(RuntimeError):
+        vmtranslator.read_vm_files(str(binary_folder))
+
+    with open(os.path.join(os.path.dirname(__file__), "..", "OS", "Math.jack")) as f:
+        jack_code = f.read()
+    with io.StringIO(jack_code) as jack_file, io.StringIO() as vm_file:
+        JackCompiler(jack_file, vm_file).compile()
+        expected = vm_file.getvalue()
+    with io.StringIO(jack_code) as jack_file, io.BytesIO() as vmb_file:
+        JackCompiler(jack_file, vmb_file, binary=True).compile()
+        assert vmbinary.vmb_to_vm(vmb_file.getvalue()) == expected
+        assert len(vmb_file.getvalue()) < len(expected)
+
+
+def test_code_size_stats(tmp_path):
+    (tmp_path / "Main.vm").write_text("function Main.main 1\npush constant 3\npop local 0\ncall Main.f 0\nreturn\n"
+                                      "function Main.f 0\npush static 1\npush constant 2\nlt\nreturn\n")
+    (tmp_path / "Sys.vm").write_text("function Sys.init 0\ncall Main.main 0\nlabel Sys.halt\ngoto Sys.halt\n")
+
+    for shared_routines, cache_top in ((False, False), (True, True)):
+        stats = CodeSizeStats()
+        hackbackend.build_folder(str(tmp_path), str(tmp_path / "Main.hack"), shared_routines=shared_routines,
+                                 cache_top=cache_top, stats=stats)
+        assert stats.total == len(romio.read_rom(str(tmp_path / "Main.hack")))
+
+    words, commands = stats.by("function")
+    assert set(words) == {"-", "Main.main", "Main.f", "Sys.init"}
+    assert commands["Main.f"] == 5
+    words, commands = stats.by("kind")
+    assert words["label"] == 0 and commands["label"] == 1
+    assert words["runtime"] > 0 and commands["runtime"] == 0
+    assert stats.report("file").splitlines()[-1].split()[-1] == str(stats.total)
+    assert CodeSizeStats.from_json(stats.to_json()).words == stats.words
+
+    # Translations that come from the cache have the same sizes
+    cache = TranslationCache(str(tmp_path / "cache"))
+    folder_stats = [CodeSizeStats(), CodeSizeStats()]
+    for folder_stat in folder_stats:
+        vmtranslator.translate_folder(str(tmp_path), str(tmp_path / "out.asm"), cache=cache, stats=folder_stat)
+    assert cache.hits == 2
+    assert folder_stats[0].words == folder_stats[1].words
+    with open(tmp_path / "out.asm") as f:
+        assert folder_stats[0].total == len(Assembler().assemble_to_array(f))
+
+    assert stats.warning() is None
+    assert "more than the 100 words" in stats.warning(rom_size=100)
+
+
+def test_parallel_folder_translation(tmp_path):
+    for name in ("Main", "Util", "Other"):
+        (tmp_path / f"{name}.vm").write_text(f"function {name}.f 0\npush static 1\npush constant 2\nlt\n"
+                                            f"pop temp 0\npush constant 0\nreturn\n")
+
+    outputs = []
+    optimizers = []
+    for workers, threads in ((1, False), (3, False), (3, True)):
+        optimizer = VMOptimizer()
+        vmtranslator.translate_folder(str(tmp_path), str(tmp_path / f"out{workers}.asm"),
+                                      optimizer=optimizer, max_workers=workers, threads=threads)
+        outputs.append((tmp_path / f"out{workers}.asm").read_text())
+        optimizers.append(optimizer)
+
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert optimizers[0].hits == optimizers[2].hits
+    assert outputs[0].index("// Main.vm") < outputs[0].index("// Other.vm") < outputs[0].index("// Util.vm")
+    assert optimizers[0].hits == optimizers[1].hits
+    assert optimizers[0].hits["discard"] == 3
+
+
+def test_shared_translation_engine():
+    sources = {f"File{index}.vm": f"function File{index}.f 1\npush constant {index}\npop static 0\npush static 0\n"
+                                  f"push local 0\nlt\nif-goto File{index}.f$end\ncall File{index}.f 0\n"
+                                  f"label File{index}.f$end\npush constant 0\nreturn\n"
+               for index in range(6)}
+    engine = vmtranslator.TranslationEngine(cache_top=True, optimizer_rules=VMOptimizer().rules)
+    expected = [engine.translate(source, file_name) for file_name, source in sources.items()]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(engine.translate, list(sources.values()) * 10, list(sources) * 10))
+    assert [result.code for result in results] == [fragment.code for fragment in expected] * 10
+    assert [result.hits for result in results] == [fragment.hits for fragment in expected] * 10
+
+    with pytest.raises(TypeError):
+        asmgenerator.templates["PUSH_D"] = None
+
+
+def test_translation_cache(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    for name in ("Main", "Util"):
+        (source / f"{name}.vm").write_text(f"function {name}.f 0\npush constant 1\npush constant 2\nadd\n"
+                                           f"pop static 0\npush constant 0\nreturn\n")
+
+    cache = TranslationCache(str(tmp_path / "cache"))
+    optimizer = VMOptimizer()
+    vmtranslator.translate_folder(str(source), str(tmp_path / "first.asm"), optimizer=optimizer, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    cached_optimizer = VMOptimizer()
+    vmtranslator.translate_folder(str(source), str(tmp_path / "second.asm"), optimizer=cached_optimizer, cache=cache)
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert (tmp_path / "first.asm").read_text() == (tmp_path / "second.asm").read_text()
+    assert cached_optimizer.hits == optimizer.hits
+
+    # Only the changed file and the files translated with other options are translated again
+    (source / "Util.vm").write_text("function Util.f 0\npush constant 3\nreturn\n")
+    vmtranslator.translate_folder(str(source), str(tmp_path / "third.asm"), optimizer=VMOptimizer(), cache=cache)
+    assert (cache.hits, cache.misses) == (3, 3)
+    vmtranslator.translate_folder(str(source), str(tmp_path / "plain.asm"), cache=cache)
+    assert (cache.hits, cache.misses) == (3, 5)
+    vmtranslator.translate_folder(str(source), str(tmp_path / "uncached.asm"))
+    assert (tmp_path / "plain.asm").read_text() == (tmp_path / "uncached.asm").read_text()
+
+
+def test_translation_cache_eviction(tmp_path):
+    code = "@0\n" * 50
+    cache = TranslationCache(str(tmp_path), max_size=1000)
+    for index in range(3):
+        cache.put(f"key{index}", TranslatedFile(code))
+        os.utime(tmp_path / f"key{index}.json", (index, index))
+    cache.evict()
+
+    # Using the oldest entry makes the next one the least recently used
+    assert cache.get("key0").code == code
+    cache.put("key3", TranslatedFile(code))
+    assert cache.get("key1") is not None
+    os.utime(tmp_path / "key1.json", (1, 1))
+    cache.evict()
+    assert cache.get("key1") is None
+    assert all(cache.get(key) is not None for key in ("key0", "key2", "key3"))
+
+
+def test_dead_function_elimination(tmp_path):
+    (tmp_path / "Sys.vm").write_text("function Sys.init 0\ncall Main.main 0\nlabel END\ngoto END\n")
+    (tmp_path / "Main.vm").write_text("function Main.main 0\ncall Util.used 0\nreturn\n"
+                                      "function Main.unused 0\ncall Util.unused 0\nreturn\n")
+    (tmp_path / "Util.vm").write_text("function Util.unused 0\npush constant 1\nreturn\n"
+                                      "function Util.used 0\ncall Util.used 0\nreturn\n")
+    (tmp_path / "Dead.vm").write_text("function Dead.f 0\npush constant 1\nreturn\n")
+
+    eliminator = DeadFunctionEliminator()
+    asm_file = vmtranslator.translate_folder(str(tmp_path), str(tmp_path / "out.asm"), eliminator=eliminator)
+    with open(asm_file) as f:
+        code = f.read()
+    assert "(Util.used)" in code and "(Main.main)" in code
+    assert "Main.unused" not in code and "Util.unused" not in code and "Dead" not in code
+    assert [function.name for function in eliminator.dropped] == ["Dead.f", "Main.unused", "Util.unused"]
+
+    full_file = vmtranslator.translate_folder(str(tmp_path), str(tmp_path / "full.asm"))
+    with open(full_file) as f:
+        full_size = len(Assembler().assemble_to_array(f))
+    assert full_size - len(Assembler().assemble_to_array(code.splitlines())) == eliminator.words_saved
+    assert "Removed 3 functions" in eliminator.report()
+
+    # The line numbers of the remaining commands stay the same, for the error messages
+    (tmp_path / "Util.vm").write_text("function Util.unused 0\nreturn\nfunction Util.used 0\npush nothing 0\n")
+    with pytest.raises(TranslatorError) as e:
+        vmtranslator.translate_folder(str(tmp_path), str(tmp_path / "out.asm"), eliminator=DeadFunctionEliminator())
+    assert e.value.lineno == 4
+
+    (tmp_path / "Sys.vm").unlink()
+    with pytest.raises(TranslatorError):
+        vmtranslator.translate_folder(str(tmp_path), str(tmp_path / "out.asm"), eliminator=DeadFunctionEliminator())
+
+
+INLINE_PROGRAM = """
+function Sys.init 0
+push constant 3000
+pop pointer 1
+push constant 5
+neg
+call Main.abs 1
+pop static 0
+push constant 9
+call Main.abs 1
+pop static 1
+push constant 12
+push constant 34
+call Main.poke 2
+pop temp 0
+push constant 12
+call Main.peek 1
+push that 0
+add
+pop static 2
+push constant 4
+call Main.twice 1
+pop static 3
+label END
+goto END
+function Main.abs 0
+push argument 0
+push constant 0
+lt
+not
+if-goto Main.abs$positive
+push argument 0
+neg
+return
+label Main.abs$positive
+push argument 0
+return
+function Main.poke 0
+push argument 0
+pop pointer 1
+push argument 1
+pop that 0
+push constant 0
+return
+function Main.peek 0
+push argument 0
+pop pointer 1
+push that 0
+return
+function Main.twice 1
+push argument 0
+pop local 0
+push local 0
+push local 0
+add
+return
+"""
+
+
+def test_inliner():
+    inliner = VMInliner()
+    inlined = inliner.inline({"Main.vm": INLINE_PROGRAM})["Main.vm"]
+    assert "call" not in inlined
+    assert inliner.inlined == {"Main.abs": 2, "Main.poke": 1, "Main.peek": 1, "Main.twice": 1}
+    assert "label Main.abs$positive$inline_0" in inlined and "label Main.abs$positive$inline_1" in inlined
+
+    # The pointers that the inlined functions change are restored, like a return restores them
+    for code in (INLINE_PROGRAM, inlined):
+        for cache_top in (False, True):
+            cpu = _run_translated(code, cache_top=cache_top)
+            assert cpu.ram[16:20] == [5, 9, 34, 8]
+            assert cpu.ram[12] == 34 and cpu.ram[4] == 3000
+
+    inliner = VMInliner(never=["Main.abs"], max_size=4)
+    inlined = inliner.inline({"Main.vm": INLINE_PROGRAM})["Main.vm"]
+    assert set(inliner.inlined) == {"Main.peek"}
+    inliner = VMInliner(always=["Main.abs"], max_size=0, max_growth=20)
+    inliner.inline({"Main.vm": INLINE_PROGRAM})
+    assert inliner.inlined == {"Main.abs": 1}
+
+    # A function can't use the statics of its own file from another file
+    other = "function Other.f 0\npush constant 1\ncall Main.get 0\nreturn\n"
+    main = "function Main.get 0\npush static 0\nreturn\n"
+    assert VMInliner().inline({"Main.vm": main, "Other.vm": other})["Other.vm"] == other
+
+    # A function that uses more locals than it declares is left to the translator
+    main = "function Main.main 0\ncall Main.f 0\nreturn\nfunction Main.f 0\npush local 0\nreturn\n"
+    assert VMInliner().inline({"Main.vm": main})["Main.vm"] == main
+
+    # A return resets the stack, so only functions that return with a single value on it are inlined
+    for body in ("push constant 1\npush constant 2\nreturn\n", "return\n",
+                 "push constant 1\nif-goto L\npush constant 2\nlabel L\npush constant 3\nreturn\n"):
+        main = f"function Main.main 0\ncall Main.f 0\nreturn\nfunction Main.f 0\n{body}"
+        assert VMInliner().inline({"Main.vm": main})["Main.vm"] == main
+
+
+LAYOUT_SYS = """
+function Sys.init 1
+push constant 0
+pop local 0
+label Sys.init$loop
+push local 0
+push constant 10
+lt
+not
+if-goto Sys.init$done
+push local 0
+push constant 3000
+add
+push local 0
+call Main.check 1
+pop temp 0
+pop pointer 1
+push temp 0
+pop that 0
+push local 0
+push constant 1
+add
+pop local 0
+goto Sys.init$loop
+label Sys.init$done
+goto Sys.init$done
+function Sys.error 1
+push constant 0
+return
+"""
+
+# The error path never runs, and the second if-goto jumps more often than it falls through
+LAYOUT_MAIN = """
+function Main.check 0
+push argument 0
+push constant 100
+gt
+not
+if-goto Main.check$valid
+push constant 1
+call Sys.error 1
+pop temp 0
+label Main.check$valid
+push argument 0
+push constant 8
+lt
+if-goto Main.check$small
+push constant 2
+return
+label Main.check$small
+push argument 0
+push argument 0
+add
+return
+"""
+
+
+def test_profile_layout(tmp_path):
+    (tmp_path / "Sys.vm").write_text(LAYOUT_SYS)
+    (tmp_path / "Main.vm").write_text(LAYOUT_MAIN)
+    profile = profile_folder(str(tmp_path), 100000)
+    assert profile.functions["Main.check"] == 10 and profile.functions["Sys.error"] == 0
+    assert profile.labels["Main.check$small"] == 8
+
+    with io.StringIO() as output:
+        profile.write(output)
+        profile = ExecutionProfile.read(io.StringIO(output.getvalue()))
+    assert profile.labels["Main.check$valid"] == 10
+
+    layout = ProfileLayout(profile)
+    main = layout.apply({"Main.vm": LAYOUT_MAIN})["Main.vm"]
+    assert main.index("push argument 0\npush argument 0\nadd") < main.index("push constant 2") < \
+           main.index("call Sys.error")
+    assert (layout.inverted_branches, layout.added_gotos) == (2, 1)
+
+    # Main.b falls into Main.c, so Main.c stays after it even though it is called more
+    code = ("function Main.a 0\npush constant 1\nreturn\nfunction Main.b 0\npush constant 2\n"
+            "function Main.c 0\npush constant 3\nreturn\n")
+    functions = {"Main.a": 5, "Main.b": 1, "Main.c": 9}
+    reordered = ProfileLayout(ExecutionProfile(functions, {})).apply({"Main.vm": code})["Main.vm"]
+    assert reordered == code
+    functions = {"Main.a": 1, "Main.b": 5, "Main.c": 9}
+    reordered = ProfileLayout(ExecutionProfile(functions, {})).apply({"Main.vm": code})["Main.vm"]
+    assert reordered.split("function ")[1:] == ["Main.b 0\npush constant 2\n", "Main.c 0\npush constant 3\nreturn\n",
+                                                "Main.a 0\npush constant 1\nreturn\n"]
+
+    asm_file = vmtranslator.translate_folder(str(tmp_path), str(tmp_path / "out.asm"),
+                                             layout=ProfileLayout(profile))
+
+    with open(asm_file) as f:
+        cpu = HackCPU(Assembler().assemble_to_array(f))
+    cpu.run(100000)
+    assert cpu.halted
+    assert cpu.ram[3000:3010] == [0, 2, 4, 6, 8, 10, 12, 14, 2, 2]
+
+    with pytest.raises(TranslatorError):
+        ExecutionProfile.read(io.StringIO('{"version": 0, "functions": {}, "labels": {}}'))
@@ -0,0 +1,10 @@
+// SP-=2, D=RAM[SP]-RAM[SP+1]
+@SP
+AM=M-1
+D=M
+A=A-1
+D=M-D
+@SP
+M=M-1
+@{label}
+D;{jump}
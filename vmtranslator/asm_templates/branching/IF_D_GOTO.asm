@@ -0,0 +1,2 @@
+@{label}
+D;JNE
@@ -0,0 +1,6 @@
+// cond=pop+1, which is 0 only for true
+@SP
+AM=M-1
+D=M+1
+@{label}
+D;JNE
@@ -0,0 +1,4 @@
+// D=pop {keyword} D
+@SP
+AM=M-1
+D={comp}
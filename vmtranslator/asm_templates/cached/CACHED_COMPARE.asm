@@ -0,0 +1,12 @@
+// D=pop-D
+@SP
+AM=M-1
+D=M-D
+@IF_{name}_{line_number}
+D;{jump}
+D=0
+@STORE_RESULT_{line_number}
+0;JMP
+(IF_{name}_{line_number})
+D=-1
+(STORE_RESULT_{line_number})
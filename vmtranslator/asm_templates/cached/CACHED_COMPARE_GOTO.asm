@@ -0,0 +1,6 @@
+// D=pop-D
+@SP
+AM=M-1
+D=M-D
+@{label}
+D;{jump}
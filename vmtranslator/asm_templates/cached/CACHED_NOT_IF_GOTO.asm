@@ -0,0 +1,4 @@
+// D+1 is 0 only for true
+D=D+1
+@{label}
+D;JNE
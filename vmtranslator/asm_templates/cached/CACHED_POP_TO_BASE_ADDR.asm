@@ -0,0 +1,16 @@
+// R13=D
+@R13
+M=D
+// R14={segment_pointer}+{i}
+@{i}
+D=A
+@{segment_pointer}
+D=D+M
+@R14
+M=D
+// RAM[R14]=R13
+@R13
+D=M
+@R14
+A=M
+M=D
@@ -0,0 +1 @@
+D={comp}
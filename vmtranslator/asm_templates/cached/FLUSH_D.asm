@@ -0,0 +1,5 @@
+// push D
+@SP
+AM=M+1
+A=A-1
+M=D
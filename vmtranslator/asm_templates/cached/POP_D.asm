@@ -0,0 +1,4 @@
+// D=pop
+@SP
+AM=M-1
+D=M
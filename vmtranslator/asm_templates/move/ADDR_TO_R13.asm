@@ -0,0 +1,7 @@
+// R13 = {segment_pointer} + {i}
+@{i}
+D=A
+@{segment_pointer}
+D=D+M
+@R13
+M=D
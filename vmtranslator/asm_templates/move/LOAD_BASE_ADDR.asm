@@ -0,0 +1,6 @@
+// D = RAM[{segment_pointer} + {i}]
+@{i}
+D=A
+@{segment_pointer}
+A=D+M
+D=M
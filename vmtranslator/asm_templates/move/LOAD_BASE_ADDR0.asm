@@ -0,0 +1,4 @@
+// D = RAM[{segment_pointer}]
+@{segment_pointer}
+A=M
+D=M
@@ -0,0 +1,3 @@
+// D = {i}
+@{i}
+D=A
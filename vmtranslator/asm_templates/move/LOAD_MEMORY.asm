@@ -0,0 +1,3 @@
+// D = RAM[{memory}]
+@{memory}
+D=M
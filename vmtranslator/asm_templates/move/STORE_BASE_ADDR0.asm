@@ -0,0 +1,4 @@
+// RAM[{segment_pointer}] = D
+@{segment_pointer}
+A=M
+M=D
@@ -0,0 +1,3 @@
+// RAM[{memory}] = D
+@{memory}
+M=D
@@ -0,0 +1,4 @@
+// RAM[R13] = D
+@R13
+A=M
+M=D
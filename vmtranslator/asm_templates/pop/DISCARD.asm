@@ -0,0 +1,3 @@
+// SP--
+@SP
+M=M-1
@@ -0,0 +1,7 @@
+// RAM[SP] = D
+@SP
+A=M
+M=D
+// SP++
+@SP
+M=M+1
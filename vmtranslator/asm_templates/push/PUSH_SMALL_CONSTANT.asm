@@ -0,0 +1,7 @@
+// RAM[SP] = {value}
+@SP
+A=M
+M={value}
+// SP++
+@SP
+M=M+1
@@ -0,0 +1,56 @@
+// Expects D=return_address, R13=n_args, R14=function address
+(RUNTIME$CALL)
+// push return_address
+@SP
+A=M
+M=D
+@SP
+M=M+1
+// push LCL
+@LCL
+D=M
+@SP
+A=M
+M=D
+@SP
+M=M+1
+// push ARG
+@ARG
+D=M
+@SP
+A=M
+M=D
+@SP
+M=M+1
+// push THIS
+@THIS
+D=M
+@SP
+A=M
+M=D
+@SP
+M=M+1
+// push THAT
+@THAT
+D=M
+@SP
+A=M
+M=D
+@SP
+MD=M+1
+// LCL=SP
+@LCL
+M=D
+// ARG=SP-5-n_args
+@R13
+D=M
+@5
+D=D+A
+@SP
+D=M-D
+@ARG
+M=D
+// goto function
+@R14
+A=M
+0;JMP
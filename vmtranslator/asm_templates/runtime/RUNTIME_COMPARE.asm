@@ -0,0 +1,22 @@
+// Expects D=return_address
+({routine})
+@R15
+M=D
+// SP--
+@SP
+AM=M-1
+D=M
+// D=RAM[SP-1]-RAM[SP]
+A=A-1
+D=M-D
+// Assume the comparison holds
+M=-1
+@{routine}_RETURN
+D;{jump}
+@SP
+A=M-1
+M=0
+({routine}_RETURN)
+@R15
+A=M
+0;JMP
@@ -0,0 +1 @@
+(RUNTIME$END)
@@ -0,0 +1,3 @@
+// Skip over the runtime routines
+@RUNTIME$END
+0;JMP
@@ -0,0 +1,16 @@
+// R13=n_args
+@{n_args}
+D=A
+@R13
+M=D
+// R14={func_name}
+@{func_name}
+D=A
+@R14
+M=D
+// D={return_label}
+@{return_label}
+D=A
+@RUNTIME$CALL
+0;JMP
+({return_label})
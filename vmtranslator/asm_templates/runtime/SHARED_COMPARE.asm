@@ -0,0 +1,5 @@
+@{return_label}
+D=A
+@{routine}
+0;JMP
+({return_label})
@@ -0,0 +1,2 @@
+@RUNTIME$RETURN
+0;JMP
@@ -1,9 +1,14 @@
 import glob
 import os.path
 from functools import singledispatchmethod
+from types import MappingProxyType
+from typing import Mapping, Optional
 
+from hackassembler.instructions import Instruction
 from vmtranslator import vmcommands
+from vmtranslator.codesize import CodeSizeStats, command_kind
 from vmtranslator.errors import TranslatorError
+from vmtranslator.templateengine import AsmCode, AsmTemplate, EMPTY_CODE
 from vmtranslator.vmcommands import VMCommand, Segment
 
 TEMPLATES_PATH = os.path.abspath(os.path.join(__file__, "..", "asm_templates"))
@@ -15,13 +20,33 @@ SEGMENTS_BASE_ADDRESS = {Segment.local: "LCL",
 
 TEMP_MEMORY_BASE_ADDR = 5
 
-templates: dict[str, str] = {}
+# Comparisons that have a shared routine, and the jump taken when the comparison holds
+COMPARE_JUMPS = {vmcommands.EQ: "JEQ",
+                 vmcommands.GT: "JGT",
+                 vmcommands.LT: "JLT"}
 
+# The jump taken by a fused comparison and if-goto, by whether the comparison is negated
+COMPARE_GOTO_JUMPS = {vmcommands.EQ: ("JEQ", "JNE"),
+                      vmcommands.GT: ("JGT", "JLE"),
+                      vmcommands.LT: ("JLT", "JGE")}
 
-def load_templates():
-    if templates:
-        return
+# Computations of the cached top of the stack, where D holds the top and M the element below it
+CACHED_UNARY_COMPUTATIONS = {vmcommands.Neg: "-D",
+                             vmcommands.Not: "!D"}
+CACHED_BINARY_COMPUTATIONS = {vmcommands.Add: "D+M",
+                              vmcommands.Sub: "M-D",
+                              vmcommands.And: "D&M",
+                              vmcommands.Or: "D|M"}
 
+# Commands whose code contains labels made from their line number, so it is different for every use
+LINE_NUMBER_COMMANDS = (vmcommands.EQ, vmcommands.GT, vmcommands.LT, vmcommands.Call)
+
+# Values that a C-instruction can produce without loading them into A first
+SMALL_CONSTANTS = (-1, 0, 1)
+
+
+def load_templates() -> dict[str, AsmTemplate]:
+    loaded = {}
     for filename in glob.iglob("**/*.asm", root_dir=TEMPLATES_PATH, recursive=True):
         basename, _ = os.path.splitext(os.path.basename(filename))
         file_path = os.path.join(TEMPLATES_PATH, filename)
@@ -30,34 +55,225 @@ def load_templates():
 
         # Just to ensure convention
         assert content.endswith("\n"), f"Template file {basename} doesn't end with new line"
-        templates[basename] = content
+        loaded[basename] = AsmTemplate(basename, content)
+    return loaded
+
+
+# The templates are compiled once when the module is imported, and are never changed,
+# so any number of generators can render them at once from different threads
+templates: Mapping[str, AsmTemplate] = MappingProxyType(load_templates())
 
 
 class AsmGenerator(object):
-    def __init__(self):
-        load_templates()
+    """
+    The state of the translation of a file or a program: the current file and function, whether the top of the
+    stack is cached and the code that was already generated. A generator is cheap to create, so every translation
+    that may run at the same time as another one should have its own.
+
+    :param shared_routines: Translate calls, returns and comparisons to jumps into routines that are
+        generated once, instead of repeating their code at every use. This saves ROM at the cost of
+        a few more cycles per use.
+    :param cache_top: Keep the top of the stack in D between commands where possible. It is written to
+        memory before labels, jumps, calls and returns, and before any command without a cached form.
+    :param stats: Record the size of the code generated for every command in it
+    """
+
+    def __init__(self, shared_routines=False, cache_top=False, stats: Optional[CodeSizeStats] = None):
         self.source_file_name = None
+        self.shared_routines = shared_routines
+        self.cache_top = cache_top
+        self.stats = stats
+        # The function of the commands that are generated, for the stats
+        self.function_name = ""
+        # Whether the top of the stack is in D instead of memory. It is only set when cache_top is used.
+        self.top_in_d = False
+        # The generated code by the command, its source file and the cache state before and after it
+        self._code_cache: dict[tuple, tuple[AsmCode, bool]] = {}
 
     def set_source_file(self, source_file: str):
         source_file_name = os.path.basename(source_file)
         self.source_file_name, _ = os.path.splitext(source_file_name)
+        self.function_name = ""
 
     def generate_init(self) -> str:
-        return templates["INIT"]
+        return str(self.generate_init_code())
+
+    def generate_init_code(self) -> AsmCode:
+        code = templates["INIT"].render()
+        self._record_other("bootstrap", code)
+        if self.shared_routines:
+            # The init code ends with an endless loop, so the routines are never reached by falling through
+            runtime = self._runtime()
+            self._record_other("runtime", runtime)
+            return code + runtime
+        return code
+
+    def generate_runtime(self, skip=False) -> str:
+        return str(self.generate_runtime_code(skip))
+
+    def generate_runtime_code(self, skip=False) -> AsmCode:
+        """
+        Generates the shared routines.
+
+        :param skip: Start with a jump over the routines, for code that would otherwise run into them
+        """
+        code = self._runtime()
+        if skip:
+            code = templates["RUNTIME_SKIP"].render() + code + templates["RUNTIME_END"].render()
+        self._record_other("runtime", code)
+        return code
+
+    def _runtime(self) -> AsmCode:
+        code = templates["RUNTIME_CALL"].render() + templates["RUNTIME_RETURN"].render() + templates["RETURN"].render()
+        for command_type, jump in COMPARE_JUMPS.items():
+            code += templates["RUNTIME_COMPARE"].render(routine=_compare_routine(command_type), jump=jump)
+        return code
 
     def generate_asm(self, command: VMCommand, line_number: int) -> str:
+        return str(self.generate_code(command, line_number))
+
+    def generate_instructions(self, command: VMCommand, line_number: int) -> list[Instruction]:
+        return self.generate_code(command, line_number).instructions()
+
+    def generate_code(self, command: VMCommand, line_number: int) -> AsmCode:
+        if isinstance(command, LINE_NUMBER_COMMANDS):
+            code = self._generate_code(command, line_number)
+        else:
+            key = (type(command), str(command), self.source_file_name, self.top_in_d)
+            cached = self._code_cache.get(key)
+            if cached is None:
+                cached = (self._generate_code(command, line_number), self.top_in_d)
+                self._code_cache[key] = cached
+            code, self.top_in_d = cached
+
+        if self.stats is not None:
+            if isinstance(command, vmcommands.Function):
+                self.function_name = command.func_name
+            self.stats.record(self.source_file_name, self.function_name, command_kind(command), code.word_count())
+        return code
+
+    def _generate_code(self, command: VMCommand, line_number: int) -> AsmCode:
+        if self.cache_top:
+            return self.handle_cached_command(command, line_number)
         return self.handle_command(command, line_number)
 
+    def generate_flush(self) -> str:
+        """
+        Generates the code that writes the cached top of the stack to memory, if it is cached.
+        Must be used at the end of the translated code.
+        """
+        return str(self.generate_flush_code())
+
+    def generate_flush_code(self) -> AsmCode:
+        code = self._flush_code()
+        if self.stats is not None and code is not EMPTY_CODE:
+            self.stats.record(self.source_file_name, self.function_name, "flush", code.word_count(), commands=0)
+        return code
+
+    def _flush_code(self) -> AsmCode:
+        if not self.top_in_d:
+            return EMPTY_CODE
+        self.top_in_d = False
+        return templates["FLUSH_D"].render()
+
+    def _record_other(self, kind: str, code: AsmCode):
+        # Code that isn't a part of any file
+        if self.stats is not None:
+            self.stats.record(None, "", kind, code.word_count(), commands=0)
+
+    def _top_to_d(self) -> AsmCode:
+        if self.top_in_d:
+            return EMPTY_CODE
+        self.top_in_d = True
+        return templates["POP_D"].render()
+
     @singledispatchmethod
-    def handle_command(self, command, line_number) -> str:
+    def handle_cached_command(self, command, line_number) -> AsmCode:
+        # The regular code expects the whole stack in memory, and leaves it there
+        return self._flush_code() + self.handle_command(command, line_number)
+
+    @handle_cached_command.register
+    def handle_cached_push(self, command: vmcommands.Push, _: int) -> AsmCode:
+        code = self._flush_code()
+        if command.segment == Segment.constant:
+            code += self._load_constant(command.i)
+        else:
+            code += self._access_segment("LOAD", command.segment, command.i)
+        self.top_in_d = True
+        return code
+
+    @handle_cached_command.register
+    def handle_cached_push_value(self, command: vmcommands.PushValue, _: int) -> AsmCode:
+        code = self._flush_code() + self._load_constant(command.value)
+        self.top_in_d = True
+        return code
+
+    @handle_cached_command.register
+    def handle_cached_pop(self, command: vmcommands.Pop, _: int) -> AsmCode:
+        if command.segment == Segment.constant:
+            raise TranslatorError("Cannot pop a constant")
+
+        code = self._top_to_d()
+        self.top_in_d = False
+        if command.segment in SEGMENTS_BASE_ADDRESS and command.i != 0:
+            base_addr = SEGMENTS_BASE_ADDRESS[command.segment]
+            return code + templates["CACHED_POP_TO_BASE_ADDR"].render(i=command.i, segment_pointer=base_addr)
+        return code + self._access_segment("STORE", command.segment, command.i)
+
+    @handle_cached_command.register
+    def handle_cached_discard(self, command: vmcommands.Discard, _: int) -> AsmCode:
+        if self.top_in_d:
+            self.top_in_d = False
+            return EMPTY_CODE
+        return templates["DISCARD"].render()
+
+    @handle_cached_command.register
+    def handle_cached_arithmetic(self, command: vmcommands.ArithmeticCommand, line_number: int) -> AsmCode:
+        command_type = type(command)
+        if command_type in CACHED_UNARY_COMPUTATIONS:
+            comp = CACHED_UNARY_COMPUTATIONS[command_type]
+            return self._top_to_d() + templates["CACHED_UNARY"].render(comp=comp)
+
+        if command_type in CACHED_BINARY_COMPUTATIONS:
+            comp = CACHED_BINARY_COMPUTATIONS[command_type]
+            return self._top_to_d() + templates["CACHED_BINARY"].render(keyword=command.keyword, comp=comp)
+
+        if self.shared_routines:
+            return self._flush_code() + self.handle_command(command, line_number)
+
+        return self._top_to_d() + templates["CACHED_COMPARE"].render(
+            name=command_type.__name__.upper(), jump=COMPARE_JUMPS[command_type],
+            line_number=f"{self.source_file_name}_{line_number}")
+
+    @handle_cached_command.register
+    def handle_cached_if_goto(self, command: vmcommands.IfGoto, _: int) -> AsmCode:
+        code = self._top_to_d() + templates["IF_D_GOTO"].render(label=command.label)
+        self.top_in_d = False
+        return code
+
+    @handle_cached_command.register
+    def handle_cached_compare_goto(self, command: vmcommands.CompareGoto, _: int) -> AsmCode:
+        jump = COMPARE_GOTO_JUMPS[command.comparison][command.negated]
+        code = self._top_to_d() + templates["CACHED_COMPARE_GOTO"].render(label=command.label, jump=jump)
+        self.top_in_d = False
+        return code
+
+    @handle_cached_command.register
+    def handle_cached_not_if_goto(self, command: vmcommands.NotIfGoto, _: int) -> AsmCode:
+        code = self._top_to_d() + templates["CACHED_NOT_IF_GOTO"].render(label=command.label)
+        self.top_in_d = False
+        return code
+
+    @singledispatchmethod
+    def handle_command(self, command, line_number) -> AsmCode:
         raise TranslatorError(f"Bad command handling for command {command}")
 
     @handle_command.register
-    def handle_push_pop(self, command: vmcommands.PushPopCommand, _: int) -> str:
+    def handle_push_pop(self, command: vmcommands.PushPopCommand, _: int) -> AsmCode:
         if command.segment == Segment.constant:
             if isinstance(command, vmcommands.Pop):
                 raise TranslatorError("Cannot pop a constant")
-            return templates["PUSH_CONSTANT"].format(i=command.i)
+            return templates["PUSH_CONSTANT"].render(i=command.i)
 
         if isinstance(command, vmcommands.Push):
             command_type = "PUSH"
@@ -70,64 +286,136 @@ class AsmGenerator(object):
             base_addr = SEGMENTS_BASE_ADDRESS[command.segment]
             if command.i == 0:
                 template_name = command_type + "_BASE_ADDR0"
-                return templates[template_name].format(segment_pointer=base_addr)
+                return templates[template_name].render(segment_pointer=base_addr)
             else:
                 template_name = command_type + "_BASE_ADDR"
-                return templates[template_name].format(i=command.i, segment_pointer=base_addr)
+                return templates[template_name].render(i=command.i, segment_pointer=base_addr)
 
         template_name = command_type + "_MEMORY"
         template = templates[template_name]
         memory = self._extract_memory(command)
-        return template.format(memory=memory)
+        return template.render(memory=memory)
 
     def _extract_memory(self, command: vmcommands.PushPopCommand):
-        if command.segment == Segment.static:
+        return self._segment_memory(command.segment, command.i)
+
+    def _segment_memory(self, segment: Segment, i: int):
+        if segment == Segment.static:
             basename = self.source_file_name
-            return f"{basename}.{command.i}"
+            return f"{basename}.{i}"
+
+        if segment == Segment.temp:
+            if i < 0 or i >= 8:
+                raise TranslatorError(f"Argument i={i} must be between 0 to 7")
+
+            return TEMP_MEMORY_BASE_ADDR + i
+
+        if segment == Segment.pointer:
+            if i < 0 or i >= 2:
+                raise TranslatorError(f"Argument i={i} must be between 0 to 1")
+            return "THIS" if i == 0 else "THAT"
+
+        raise TranslatorError(f"Got an unexpected segment {segment}")
 
-        if command.segment == Segment.temp:
-            if command.i < 0 or command.i >= 8:
-                raise TranslatorError(f"Argument i={command.i} must be between 0 to 7")
+    @handle_command.register
+    def handle_push_value(self, command: vmcommands.PushValue, _: int) -> AsmCode:
+        if command.value in SMALL_CONSTANTS:
+            return templates["PUSH_SMALL_CONSTANT"].render(value=command.value)
+        return self._load_constant(command.value) + templates["PUSH_D"].render()
+
+    @handle_command.register
+    def handle_move(self, command: vmcommands.Move, _: int) -> AsmCode:
+        if command.dest_segment == Segment.constant:
+            raise TranslatorError("Cannot pop a constant")
+
+        if command.source_segment == Segment.constant:
+            load = self._load_constant(command.source_i)
+        else:
+            load = self._access_segment("LOAD", command.source_segment, command.source_i)
+
+        if command.dest_segment in SEGMENTS_BASE_ADDRESS and command.dest_i != 0:
+            # Loading the value overwrites D, so the destination address is kept in R13
+            base_addr = SEGMENTS_BASE_ADDRESS[command.dest_segment]
+            dest_addr = templates["ADDR_TO_R13"].render(i=command.dest_i, segment_pointer=base_addr)
+            return dest_addr + load + templates["STORE_R13"].render()
+
+        return load + self._access_segment("STORE", command.dest_segment, command.dest_i)
+
+    @handle_command.register
+    def handle_discard(self, command: vmcommands.Discard, _: int) -> AsmCode:
+        return templates["DISCARD"].render()
 
-            return TEMP_MEMORY_BASE_ADDR + command.i
+    def _load_constant(self, value: int) -> AsmCode:
+        if value in SMALL_CONSTANTS:
+            return templates["LOAD_SMALL_CONSTANT"].render(value=value)
+        if value < 0:
+            return templates["LOAD_NEGATIVE_CONSTANT"].render(i=-value)
+        return templates["LOAD_CONSTANT"].render(i=value)
 
-        if command.segment == Segment.pointer:
-            if command.i < 0 or command.i >= 2:
-                raise TranslatorError(f"Argument i={command.i} must be between 0 to 1")
-            return "THIS" if command.i == 0 else "THAT"
+    def _access_segment(self, access: str, segment: Segment, i: int) -> AsmCode:
+        if segment in SEGMENTS_BASE_ADDRESS:
+            base_addr = SEGMENTS_BASE_ADDRESS[segment]
+            if i == 0:
+                return templates[access + "_BASE_ADDR0"].render(segment_pointer=base_addr)
+            return templates[access + "_BASE_ADDR"].render(i=i, segment_pointer=base_addr)
 
-        raise TranslatorError(f"Got an unexpected command {command}")
+        return templates[access + "_MEMORY"].render(memory=self._segment_memory(segment, i))
 
     @handle_command.register
-    def handle_arithmetic(self, command: vmcommands.ArithmeticCommand, line_number: int) -> str:
+    def handle_compare_goto(self, command: vmcommands.CompareGoto, _: int) -> AsmCode:
+        jump = COMPARE_GOTO_JUMPS[command.comparison][command.negated]
+        return templates["COMPARE_GOTO"].render(label=command.label, jump=jump)
+
+    @handle_command.register
+    def handle_not_if_goto(self, command: vmcommands.NotIfGoto, _: int) -> AsmCode:
+        return templates["NOT_IF_GOTO"].render(label=command.label)
+
+    @handle_command.register
+    def handle_push_if_goto(self, command: vmcommands.PushIfGoto, _: int) -> AsmCode:
+        load = self._access_segment("LOAD", command.segment, command.i)
+        return load + templates["IF_D_GOTO"].render(label=command.label)
+
+    @handle_command.register
+    def handle_arithmetic(self, command: vmcommands.ArithmeticCommand, line_number: int) -> AsmCode:
+        if self.shared_routines and type(command) in COMPARE_JUMPS:
+            return_label = f"COMPARE_RETURN_{self.source_file_name}_{line_number}"
+            return templates["SHARED_COMPARE"].render(routine=_compare_routine(type(command)),
+                                                      return_label=return_label)
+
         name = type(command).__name__.upper()
-        return templates[name].format(line_number=f"{self.source_file_name}_{line_number}")
+        return templates[name].render(line_number=f"{self.source_file_name}_{line_number}")
 
     @handle_command.register
-    def handle_call(self, command: vmcommands.Call, line_number: int) -> str:
+    def handle_call(self, command: vmcommands.Call, line_number: int) -> AsmCode:
         return_label = f"RETURN_FROM_{self.source_file_name}${command.func_name}$line_{line_number}"
-        template = templates["CALL"]
-        return template.format(func_name=command.func_name, return_label=return_label, n_args=command.n_args)
+        template = templates["SHARED_CALL"] if self.shared_routines else templates["CALL"]
+        return template.render(func_name=command.func_name, return_label=return_label, n_args=command.n_args)
 
     @handle_command.register
-    def handle_function(self, command: vmcommands.Function, _: int) -> str:
+    def handle_function(self, command: vmcommands.Function, _: int) -> AsmCode:
         template = templates["FUNCTION"]
-        code = template.format(function_name=command.func_name, n_vars=command.n_vars)
+        code = template.render(function_name=command.func_name, n_vars=command.n_vars)
         if command.n_vars >= 1:
-            push_local_header = templates["PUSH_LOCAL_HEADER"]
-            push_local = templates["PUSH_LOCAL"]
+            push_local_header = templates["PUSH_LOCAL_HEADER"].render(n_vars=command.n_vars)
+            push_local = templates["PUSH_LOCAL"].render()
             code = code + push_local_header + push_local * command.n_vars
         return code
 
     @handle_command.register
-    def handle_return(self, command: vmcommands.Return, _: int) -> str:
-        return templates["RETURN"]
+    def handle_return(self, command: vmcommands.Return, _: int) -> AsmCode:
+        if self.shared_routines:
+            return templates["SHARED_RETURN"].render()
+        return templates["RETURN"].render()
 
     @handle_command.register
-    def handle_branching(self, command: vmcommands.BranchingCommand, _: int) -> str:
+    def handle_branching(self, command: vmcommands.BranchingCommand, _: int) -> AsmCode:
         template_to_name = {vmcommands.Goto: "GOTO",
                             vmcommands.IfGoto: "IF_GOTO",
                             vmcommands.Label: "LABEL", }
         template_name = template_to_name[type(command)]
         template = templates[template_name]
-        return template.format(label=command.label)
+        return template.render(label=command.label)
+
+
+def _compare_routine(command_type: type) -> str:
+    return f"RUNTIME${command_type.__name__.upper()}"
@@ -0,0 +1,100 @@
+from collections import Counter
+from typing import Optional
+
+# The number of words in the ROM of the Hack computer
+ROM_SIZE = 2 ** 15
+# Warn when the code takes at least this share of the ROM
+DEFAULT_WARN_SHARE = 0.9
+
+# The fields that the counts can be grouped by, in the order of the keys of the counters
+GROUPS = ("file", "function", "kind")
+SORT_KEYS = ("words", "commands", "name")
+
+# Code that isn't generated for a VM command, like the bootstrap code, has no file or function
+NO_NAME = "-"
+
+
+class CodeSizeStats(object):
+    """
+    The number of words of ROM that the generated code takes, and the number of VM commands it was generated for,
+    by the source file, the function and the kind of command. The AsmGenerator records every command it translates.
+    """
+
+    def __init__(self):
+        # (file, function, kind) -> count
+        self.words = Counter()
+        self.commands = Counter()
+
+    def record(self, file_name: Optional[str], function_name: str, kind: str, words: int, commands=1):
+        key = (file_name or NO_NAME, function_name or NO_NAME, kind)
+        self.words[key] += words
+        self.commands[key] += commands
+
+    def update(self, other: "CodeSizeStats"):
+        self.words.update(other.words)
+        self.commands.update(other.commands)
+
+    @property
+    def total(self) -> int:
+        return sum(self.words.values())
+
+    def by(self, group: str) -> tuple[Counter, Counter]:
+        """
+        :param group: One of GROUPS
+        :return: The words and the commands of every file, function or kind
+        """
+        index = GROUPS.index(group)
+        words = Counter()
+        commands = Counter()
+        for key, count in self.words.items():
+            words[key[index]] += count
+            commands[key[index]] += self.commands[key]
+        return words, commands
+
+    def warning(self, rom_size=ROM_SIZE, share=DEFAULT_WARN_SHARE) -> Optional[str]:
+        total = self.total
+        if total < share * rom_size:
+            return None
+        if total > rom_size:
+            return f"Warning: the code takes {total} words, which is more than the {rom_size} words of ROM"
+        return f"Warning: the code takes {total} words, {total / rom_size:.1%} of the {rom_size} words of ROM"
+
+    def report(self, group="function", sort="words") -> str:
+        """
+        :param group: One of GROUPS
+        :param sort: One of SORT_KEYS. Words and commands are sorted from the largest.
+        """
+        words, commands = self.by(group)
+        if sort == "name":
+            names = sorted(words)
+        else:
+            counter = words if sort == "words" else commands
+            names = sorted(words, key=lambda name: (-counter[name], name))
+
+        total = self.total
+        lines = [f"{group:<48}{'commands':>10}{'words':>8}{'share':>8}"]
+        for name in names:
+            share = words[name] / total if total else 0
+            lines.append(f"{name:<48}{commands[name]:>10}{words[name]:>8}{share:>8.1%}")
+        lines.append(f"{'total':<48}{sum(commands.values()):>10}{total:>8}")
+        return "\n".join(lines)
+
+    def to_json(self) -> dict:
+        rows = [{"file": file_name, "function": function_name, "kind": kind,
+                 "commands": self.commands[file_name, function_name, kind], "words": words}
+                for (file_name, function_name, kind), words in self.words.items()]
+        return {"rom_size": ROM_SIZE, "total": self.total, "rows": rows}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "CodeSizeStats":
+        stats = cls()
+        for row in data["rows"]:
+            key = (row["file"], row["function"], row["kind"])
+            stats.words[key] += row["words"]
+            stats.commands[key] += row["commands"]
+        return stats
+
+
+def command_kind(command) -> str:
+    # The commands that the optimizer creates have no keyword
+    return command.keyword or type(command).__name__
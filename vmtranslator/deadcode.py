@@ -0,0 +1,125 @@
+from vmtranslator import asmgenerator, parser, vmcommands
+from vmtranslator.errors import TranslatorError
+from vmtranslator.optimizer import NumberedCommand
+
+# The bootstrap code jumps to this function, so it is the root of the call graph
+ENTRY_FUNCTION = "Sys.init"
+
+
+class VMFunction(object):
+    """
+    A function of a .vm file, with the numbers of its lines in the file and its parsed commands.
+    """
+
+    def __init__(self, name: str, file_name: str):
+        self.name = name
+        self.file_name = file_name
+        self.line_numbers: list[int] = []
+        self.commands: list[NumberedCommand] = []
+        self.calls: set[str] = set()
+
+
+def split_functions(file_name: str, source: str) -> tuple[list[int], list[VMFunction]]:
+    """
+    Parses a .vm file into its functions.
+
+    :return: The numbers of the lines before the first function, and the functions
+    """
+    prologue = []
+    functions = []
+    function = None
+    for line_number, command in parser.parse_text(source):
+        if isinstance(command, vmcommands.Function):
+            function = VMFunction(command.func_name, file_name)
+            functions.append(function)
+        if function is None:
+            prologue.append(line_number)
+            continue
+        function.line_numbers.append(line_number)
+        function.commands.append((line_number, command))
+        if isinstance(command, vmcommands.Call):
+            function.calls.add(command.func_name)
+    return prologue, functions
+
+
+class DeadFunctionEliminator(object):
+    """
+    Removes the functions that can't be reached from the entry function, in a program made of all the .vm files
+    of a folder. Jack has no function pointers, so every reachable function is named by a call command.
+    """
+
+    def __init__(self, entry: str = ENTRY_FUNCTION):
+        self.entry = entry
+        self.dropped: list[VMFunction] = []
+        # The number of words that the code of every removed function would take
+        self.sizes: dict[str, int] = {}
+
+    def eliminate(self, sources: dict[str, str], generator_options: tuple = ()) -> dict[str, str]:
+        """
+        :param sources: The code of every file of the program, by the file name
+        :param generator_options: The options of the AsmGenerator, to count the words the removed code would take
+        :return: The code of the files that still have code in them. The removed lines are left empty,
+            so the line numbers of the rest stay the same.
+        """
+        files = {file_name: split_functions(file_name, source) for file_name, source in sources.items()}
+        functions = {}
+        for _, file_functions in files.values():
+            for function in file_functions:
+                functions[function.name] = function
+        if self.entry not in functions:
+            raise TranslatorError(f"The program has no function {self.entry} to start from")
+
+        reachable = self._reachable(functions)
+        self.dropped = []
+        result = {}
+        for file_name, (prologue, file_functions) in files.items():
+            kept_lines = set(prologue)
+            for function in file_functions:
+                if function.name in reachable:
+                    kept_lines.update(function.line_numbers)
+                else:
+                    self.dropped.append(function)
+            if not kept_lines:
+                continue
+
+            lines = sources[file_name].splitlines()
+            result[file_name] = "".join(f"{line}\n" if line_number in kept_lines else "\n"
+                                        for line_number, line in enumerate(lines, 1))
+
+        self.sizes = {function.name: function_size(function, generator_options) for function in self.dropped}
+        return result
+
+    @property
+    def words_saved(self) -> int:
+        return sum(self.sizes.values())
+
+    def _reachable(self, functions: dict[str, VMFunction]) -> set[str]:
+        reachable = {self.entry}
+        pending = [self.entry]
+        while pending:
+            function = functions.get(pending.pop())
+            if function is None:
+                # A call to a function that isn't in the program, which the assembler reports
+                continue
+            for callee in function.calls - reachable:
+                reachable.add(callee)
+                pending.append(callee)
+        return reachable
+
+    def report(self) -> str:
+        lines = [f"{'removed function':<40}{'words':>8}"]
+        for function in self.dropped:
+            lines.append(f"{function.name:<40}{self.sizes[function.name]:>8}")
+        lines.append(f"Removed {len(self.dropped)} functions, saving {self.words_saved} words of ROM")
+        return "\n".join(lines)
+
+
+def function_size(function: VMFunction, generator_options: tuple = ()) -> int:
+    """
+    Counts the instructions that the translation of the function takes in the ROM.
+    """
+    asm_generator = asmgenerator.AsmGenerator(*generator_options)
+    asm_generator.set_source_file(function.file_name)
+    code = [asm_generator.generate_code(command, line_number) for line_number, command in function.commands]
+    code.append(asm_generator.generate_flush_code())
+    return sum(part.word_count() for part in code)
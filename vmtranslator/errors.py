@@ -5,5 +5,13 @@ class TranslatorError(Exception):
         self.line = line
         self.lineno = lineno
 
+    def __reduce__(self):
+        # Keep the line information when the error is sent back from a worker process
+        return type(self), (self.msg, self.line, self.lineno)
+
     def __str__(self):
         return f"{self.msg}. Raised from command\n{self.line}\nat line {self.lineno}"
+
+
+class BytecodeFormatError(TranslatorError):
+    pass
@@ -0,0 +1,135 @@
+import contextlib
+import io
+import os.path
+from array import array
+from typing import IO, Optional
+
+from hackassembler import romio
+from hackassembler.assembler import Assembler
+from hackassembler.instructions import Instruction
+from vmtranslator import asmgenerator, vmbinary
+from vmtranslator.codesize import CodeSizeStats
+from vmtranslator.deadcode import DeadFunctionEliminator
+from vmtranslator.inliner import VMInliner
+from vmtranslator.layout import ProfileLayout
+from vmtranslator.optimizer import VMOptimizer
+from vmtranslator.templateengine import AsmCode
+from vmtranslator.vmtranslator import VMTranslator, read_vm_files, write_file_header
+
+
+class HackBackend(object):
+    """
+    Translates VM code into instruction records and assembles them in memory,
+    so the assembly is never written and parsed again as text.
+
+    :param asm_output: Also write the assembly to this stream, the same as VMTranslator writes it
+    """
+
+    def __init__(self, asm_generator: asmgenerator.AsmGenerator, optimizer: Optional[VMOptimizer] = None,
+                 asm_output: Optional[IO[str]] = None):
+        self.asm_generator = asm_generator
+        self.optimizer = optimizer
+        self.asm_output = asm_output
+        self.instructions: list[Instruction] = []
+        self.assembler = Assembler()
+
+    def add_code(self, code: AsmCode):
+        self.instructions += code.instructions()
+        if self.asm_output is not None:
+            self.asm_output.write(str(code))
+            self.asm_output.write("\n")
+
+    def add_file(self, source_file: str, input_stream: IO, binary=False):
+        """
+        :param binary: The input is the bytecode of a .vmb file
+        """
+        self.asm_generator.set_source_file(source_file)
+        translator = VMTranslator(self.asm_generator, self.optimizer)
+        generated = translator.generate_binary(input_stream) if binary else translator.generate(input_stream)
+        for line, code in generated:
+            if self.asm_output is not None:
+                self.asm_output.write(f"// {line}\n")
+            self.add_code(code)
+
+        flush = self.asm_generator.generate_flush_code()
+        self.instructions += flush.instructions()
+        if self.asm_output is not None:
+            self.asm_output.write(str(flush))
+
+    def assemble(self) -> array:
+        return self.assembler.assemble_instructions(self.instructions)
+
+
+def build_file(input_file: str, output_file: Optional[str] = None, optimizer: Optional[VMOptimizer] = None,
+               shared_routines=False, cache_top=False, asm_file: Optional[str] = None,
+               stats: Optional[CodeSizeStats] = None) -> str:
+    """
+    Translates a .vm or .vmb file straight to a .hack or .hackbin file, chosen by the extension of output_file.
+
+    :param asm_file: Also write the assembly to this file
+    :param stats: Record the sizes of the generated code in it
+    """
+    if output_file is None:
+        output_file = os.path.splitext(input_file)[0] + romio.HACK_EXTENSION
+
+    asm_generator = asmgenerator.AsmGenerator(shared_routines, cache_top, stats)
+    with _open_asm(asm_file) as asm_output:
+        backend = HackBackend(asm_generator, optimizer, asm_output)
+        if shared_routines:
+            backend.add_code(asm_generator.generate_runtime_code(skip=True))
+        binary = input_file.endswith(vmbinary.VMB_EXTENSION)
+        with open(input_file, 'rb' if binary else 'r') as vm_file:
+            backend.add_file(input_file, vm_file, binary)
+    romio.write_rom(backend.assemble(), output_file)
+    return output_file
+
+
+def build_folder(folder_path: str, output_file: Optional[str] = None, optimizer: Optional[VMOptimizer] = None,
+                 shared_routines=False, cache_top=False, asm_file: Optional[str] = None,
+                 eliminator: Optional[DeadFunctionEliminator] = None, inliner: Optional[VMInliner] = None,
+                 layout: Optional[ProfileLayout] = None, stats: Optional[CodeSizeStats] = None) -> str:
+    """
+    Translates all the .vm and .vmb files in a folder, along with the bootstrap code,
+    straight to a .hack or .hackbin file.
+
+    :param asm_file: Also write the assembly to this file
+    :param eliminator: Translate only the functions that the program can reach
+    :param inliner: Inline calls to small functions, before removing the functions that can't be reached
+    :param layout: Reorder the functions and blocks of the files by an execution profile
+    :param stats: Record the sizes of the generated code in it
+    """
+    if output_file is None:
+        folder_path = os.path.normpath(folder_path)
+        basename = os.path.basename(folder_path) + romio.HACK_EXTENSION
+        output_file = os.path.join(folder_path, basename)
+
+    asm_generator = asmgenerator.AsmGenerator(shared_routines, cache_top, stats)
+    with _open_asm(asm_file) as asm_output:
+        backend = HackBackend(asm_generator, optimizer, asm_output)
+        backend.add_code(asm_generator.generate_init_code())
+        whole_program = layout is not None or inliner is not None or eliminator is not None
+        sources = read_vm_files(folder_path, keep_binary=not whole_program)
+        if layout is not None:
+            sources = layout.apply(sources)
+        if inliner is not None:
+            sources = inliner.inline(sources)
+        if eliminator is not None:
+            sources = eliminator.eliminate(sources, (shared_routines, cache_top))
+        for file_name, source in sources.items():
+            print(f"Translating {file_name}")
+            if asm_output is not None:
+                write_file_header(file_name, asm_output)
+            if isinstance(source, bytes):
+                with io.BytesIO(source) as vm_file:
+                    backend.add_file(file_name, vm_file, binary=True)
+            else:
+                with io.StringIO(source) as vm_file:
+                    backend.add_file(file_name, vm_file)
+    romio.write_rom(backend.assemble(), output_file)
+    return output_file
+
+
+def _open_asm(asm_file: Optional[str]):
+    if asm_file is None:
+        return contextlib.nullcontext()
+    return open(asm_file, 'w')
@@ -0,0 +1,216 @@
+from collections import Counter
+from typing import Iterable, Optional
+
+from vmtranslator import vmcommands
+from vmtranslator.deadcode import VMFunction, split_functions
+from vmtranslator.layout import ExecutionProfile
+from vmtranslator.optimizer import DISCARD_INDEX
+from vmtranslator.vmcommands import Segment, VMCommand
+
+# The arguments and locals of an inlined function are kept in temp. The optimizer treats temp 0 as local
+# to a block, so it is never used for them.
+INLINE_SLOTS = tuple(i for i in range(8) if i != DISCARD_INDEX)
+
+DEFAULT_MAX_SIZE = 16
+
+UNARY_COMMANDS = (vmcommands.Neg, vmcommands.Not)
+DEFAULT_MAX_GROWTH = 500
+
+
+class VMInliner(object):
+    """
+    Replaces calls to small leaf functions with their bodies, in a program made of all the .vm files of a folder.
+    The arguments, locals and the pointers the function changes are kept in temp slots that the caller doesn't use,
+    and the labels get a suffix that is unique for every inlined call.
+
+    :param max_size: Only inline functions with at most this many commands
+    :param max_growth: Stop inlining when the program grew by this many commands
+    :param always: Functions to inline whatever their size
+    :param never: Functions to never inline
+    :param profile: Only inline calls that ran, the most called functions first, and inline the hot functions
+        whatever their size
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, max_growth=DEFAULT_MAX_GROWTH,
+                 always: Iterable[str] = (), never: Iterable[str] = (),
+                 profile: Optional[ExecutionProfile] = None):
+        self.max_size = max_size
+        self.max_growth = max_growth
+        self.always = frozenset(always)
+        self.never = frozenset(never)
+        self.profile = profile
+        self.hot = frozenset() if profile is None else frozenset(profile.hot_functions())
+        self.inlined = Counter()
+        self.growth = 0
+
+    def inline(self, sources: dict[str, str]) -> dict[str, str]:
+        """
+        :param sources: The code of every file of the program, by the file name
+        :return: The code of the files, where every inlined call is replaced by the lines of the function
+        """
+        files = {file_name: split_functions(file_name, source) for file_name, source in sources.items()}
+        candidates = {}
+        for _, functions in files.values():
+            for function in functions:
+                if self._is_candidate(function):
+                    candidates[function.name] = function
+
+        sites = []
+        for file_name, (_, functions) in files.items():
+            for function in functions:
+                for line_number, command in function.commands:
+                    if isinstance(command, vmcommands.Call) and command.func_name in candidates:
+                        sites.append((file_name, line_number, command, function))
+        if self.profile is not None:
+            # Calls that never ran gain nothing, and the budget goes to the most called functions first
+            calls = self.profile.functions
+            sites = [site for site in sites if calls[site[3].name] and calls[site[2].func_name]]
+            sites.sort(key=lambda site: -calls[site[2].func_name])
+
+        replacements = {file_name: {} for file_name in files}
+        for file_name, line_number, call, caller in sites:
+            code = self._expand(candidates[call.func_name], call, caller, _free_slots(caller, INLINE_SLOTS))
+            if code is not None:
+                replacements[file_name][line_number] = code
+
+        result = {}
+        for file_name, source in sources.items():
+            file_replacements = replacements[file_name]
+            result[file_name] = "".join(
+                "".join(f"{command}\n" for command in file_replacements[line_number])
+                if line_number in file_replacements else f"{line}\n"
+                for line_number, line in enumerate(source.splitlines(), 1))
+        return result
+
+    def _is_candidate(self, function: VMFunction) -> bool:
+        body = [command for _, command in function.commands[1:]]
+        if function.name in self.never or not body:
+            return False
+        if function.name not in self.always and function.name not in self.hot and len(body) > self.max_size:
+            return False
+        # A leaf function that ends with a return or a goto, so nothing falls through past the inlined code
+        if any(isinstance(command, vmcommands.Call) for command in body) or \
+                not isinstance(body[-1], (vmcommands.Return, vmcommands.Goto)):
+            return False
+        # The inlined returns leave the stack as it is, which is only the same as a return with a single value
+        return _returns_one_value(body)
+
+    def _expand(self, callee: VMFunction, call: vmcommands.Call, caller: VMFunction,
+                free_slots: tuple[int, ...]) -> Optional[list[VMCommand]]:
+        body = [command for _, command in callee.commands[1:]]
+        accesses = [command for command in body if isinstance(command, vmcommands.PushPopCommand)]
+        # The statics of another file can't be named from the caller's file
+        if callee.file_name != caller.file_name and any(access.segment == Segment.static for access in accesses):
+            return None
+        n_vars = callee.commands[0][1].n_vars
+        if any(access.segment == Segment.argument and access.i >= call.n_args for access in accesses):
+            return None
+        if any(access.segment == Segment.local and access.i >= n_vars for access in accesses):
+            return None
+
+        pointers = sorted({access.i for access in accesses
+                           if isinstance(access, vmcommands.Pop) and access.segment == Segment.pointer})
+        slots = _free_slots(callee, free_slots)
+        if len(slots) < call.n_args + n_vars + len(pointers):
+            return None
+        arg_slots = slots[:call.n_args]
+        local_slots = slots[call.n_args:call.n_args + n_vars]
+        pointer_slots = slots[call.n_args + n_vars:]
+
+        suffix = f"$inline_{sum(self.inlined.values())}"
+        return_label = f"{callee.name}{suffix}$return"
+        code = []
+        for pointer, slot in zip(pointers, pointer_slots):
+            code += [_push(Segment.pointer, pointer), _pop(Segment.temp, slot)]
+        for slot in reversed(arg_slots):
+            code.append(_pop(Segment.temp, slot))
+        for slot in local_slots:
+            code += [_push(Segment.constant, 0), _pop(Segment.temp, slot)]
+
+        returns_early = False
+        for index, command in enumerate(body):
+            if isinstance(command, vmcommands.Return):
+                if index != len(body) - 1:
+                    code.append(vmcommands.Goto.create(return_label))
+                    returns_early = True
+            elif isinstance(command, vmcommands.PushPopCommand) and command.segment == Segment.argument:
+                code.append(type(command).create(Segment.temp, arg_slots[command.i]))
+            elif isinstance(command, vmcommands.PushPopCommand) and command.segment == Segment.local:
+                code.append(type(command).create(Segment.temp, local_slots[command.i]))
+            elif isinstance(command, vmcommands.BranchingCommand):
+                code.append(type(command).create(command.label + suffix))
+            else:
+                code.append(command)
+        if returns_early:
+            code.append(vmcommands.Label.create(return_label))
+
+        # The return value is on the top of the stack, and restoring the pointers doesn't move it
+        for pointer, slot in zip(pointers, pointer_slots):
+            code += [_push(Segment.temp, slot), _pop(Segment.pointer, pointer)]
+
+        if self.growth + len(code) - 1 > self.max_growth:
+            return None
+        self.growth += len(code) - 1
+        self.inlined[callee.name] += 1
+        return code
+
+    def report(self) -> str:
+        lines = [f"{'inlined function':<40}{'calls':>8}"]
+        for name, calls in self.inlined.most_common():
+            lines.append(f"{name:<40}{calls:>8}")
+        lines.append(f"Inlined {sum(self.inlined.values())} calls, adding {self.growth} commands")
+        return "\n".join(lines)
+
+
+def _returns_one_value(body: list[VMCommand]) -> bool:
+    """
+    Follows the depth of the stack through the body, and checks that it is the same at every jump to a label
+    and that it is 1 at every return. A label whose depth can't be known, because it is only jumped to
+    from after it, is rejected.
+    """
+    depth = 0
+    label_depths = {}
+    for command in body:
+        if isinstance(command, vmcommands.Label):
+            known = label_depths.setdefault(command.label, depth)
+            if known is None or (depth is not None and known != depth):
+                return False
+            depth = known
+            continue
+        if depth is None:
+            # After a goto or a return, the commands until the next label never run, like the goto that
+            # the compiler adds after a return in an if
+            continue
+
+        if isinstance(command, vmcommands.Push):
+            depth += 1
+        elif isinstance(command, (vmcommands.Pop, vmcommands.IfGoto)) or \
+                (isinstance(command, vmcommands.ArithmeticCommand) and not isinstance(command, UNARY_COMMANDS)):
+            depth -= 1
+        if depth < 0:
+            return False
+
+        if isinstance(command, vmcommands.BranchingCommand):
+            if label_depths.setdefault(command.label, depth) != depth:
+                return False
+            if isinstance(command, vmcommands.Goto):
+                depth = None
+        elif isinstance(command, vmcommands.Return):
+            if depth != 1:
+                return False
+            depth = None
+    return True
+
+
+def _free_slots(function: VMFunction, slots: tuple[int, ...]) -> tuple[int, ...]:
+    used = {command.i for _, command in function.commands
+            if isinstance(command, vmcommands.PushPopCommand) and command.segment == Segment.temp}
+    return tuple(slot for slot in slots if slot not in used)
+
+
+def _push(segment: Segment, i: int) -> vmcommands.Push:
+    return vmcommands.Push.create(segment, i)
+
+
+def _pop(segment: Segment, i: int) -> vmcommands.Pop:
+    return vmcommands.Pop.create(segment, i)
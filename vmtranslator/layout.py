@@ -0,0 +1,254 @@
+import json
+from collections import Counter
+from typing import IO, Iterable, Optional
+
+from vmtranslator import vmcommands
+from vmtranslator.deadcode import VMFunction, split_functions
+from vmtranslator.errors import TranslatorError
+from vmtranslator.vmcommands import VMCommand
+
+PROFILE_FORMAT_VERSION = 1
+
+# Calls to these functions only happen on error paths, so the code that makes them is moved out of line
+COLD_FUNCTIONS = frozenset({"Sys.error", "Sys.halt"})
+
+# A function that takes at least this share of all the function entries is hot
+DEFAULT_HOT_SHARE = 0.05
+
+COMPARISONS = (vmcommands.EQ, vmcommands.GT, vmcommands.LT)
+
+
+class ExecutionProfile(object):
+    """
+    How many times every function was entered and every label was reached, while running a program.
+
+    :param functions: The number of calls of every function
+    :param labels: The number of times the code of every label ran, whether it was jumped to or fallen into
+    """
+
+    def __init__(self, functions: dict[str, int], labels: dict[str, int]):
+        self.functions = Counter(functions)
+        self.labels = Counter(labels)
+
+    def hot_functions(self, share=DEFAULT_HOT_SHARE) -> set[str]:
+        total = sum(self.functions.values())
+        return {name for name, count in self.functions.items() if count and count >= share * total}
+
+    def write(self, output_stream: IO[str]):
+        json.dump({"version": PROFILE_FORMAT_VERSION, "functions": self.functions, "labels": self.labels},
+                  output_stream, indent=1, sort_keys=True)
+
+    @classmethod
+    def read(cls, input_stream: IO[str]) -> "ExecutionProfile":
+        try:
+            content = json.load(input_stream)
+        except json.JSONDecodeError as e:
+            raise TranslatorError(f"Not a valid profile: {e}")
+
+        if content.get("version") != PROFILE_FORMAT_VERSION:
+            raise TranslatorError(f"Unsupported profile version {content.get('version')}")
+        return cls(content["functions"], content["labels"])
+
+
+class _Block(object):
+    """
+    A run of commands that is only entered at its start, and only left at its end.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.commands: list[VMCommand] = []
+        self.count = 0
+        self.cold = False
+
+    @property
+    def label(self) -> Optional[str]:
+        first = self.commands[0]
+        return first.label if isinstance(first, vmcommands.Label) else None
+
+    @property
+    def last(self) -> VMCommand:
+        return self.commands[-1]
+
+    def falls_through(self) -> bool:
+        return _falls_through(self.last)
+
+    def jump_target(self) -> Optional[str]:
+        if isinstance(self.last, (vmcommands.Goto, vmcommands.IfGoto)):
+            return self.last.label
+        return None
+
+
+class ProfileLayout(object):
+    """
+    Orders the functions of every file from the most called, keeping a function that falls into the next
+    one right before it, and the blocks of every function so that the hot successor of a block follows it.
+    Blocks that never ran, or that call a cold function, are moved to the end of the function.
+    Jumps are added where a block no longer falls into its successor, and removed where a goto now jumps
+    to the next block.
+
+    :param cold_functions: Functions whose calls mark the blocks that make them as cold
+    """
+
+    def __init__(self, profile: ExecutionProfile, cold_functions: Iterable[str] = COLD_FUNCTIONS):
+        self.profile = profile
+        self.cold_functions = frozenset(cold_functions)
+        self.moved_blocks = 0
+        self.inverted_branches = 0
+        self.removed_gotos = 0
+        self.added_gotos = 0
+
+    def apply(self, sources: dict[str, str]) -> dict[str, str]:
+        """
+        :param sources: The code of every file of the program, by the file name
+        :return: The code of the files, with their functions and blocks reordered
+        """
+        result = {}
+        for file_name, source in sources.items():
+            prologue, functions = split_functions(file_name, source)
+            lines = source.splitlines()
+            code = [f"{lines[line_number - 1]}\n" for line_number in prologue]
+            chains = sorted(_chain_functions(functions), key=lambda chain: -self.profile.functions[chain[0].name])
+            for chain in chains:
+                for function in chain:
+                    code += [f"{command}\n" for command in self._layout_function(function)]
+            result[file_name] = "".join(code)
+        return result
+
+    def _layout_function(self, function: VMFunction) -> list[VMCommand]:
+        commands = [command for _, command in function.commands]
+        blocks = _split_blocks(commands[1:])
+        if not self.profile.functions[function.name] or not blocks or blocks[-1].falls_through():
+            # Nothing is known about a function that never ran, and one that falls into the next function
+            # has to stay in order
+            return commands
+
+        self._count_blocks(function, blocks)
+        order = self._order_blocks(blocks)
+        self.moved_blocks += sum(1 for position, block in enumerate(order) if block.index != position)
+        return commands[:1] + self._link_blocks(function, blocks, order)
+
+    def _count_blocks(self, function: VMFunction, blocks: list[_Block]):
+        labels = {}
+        for block in blocks:
+            if block.index == 0:
+                # The first block may also be the head of a loop
+                block.count = max(self.profile.functions[function.name], self.profile.labels[block.label])
+            elif block.label is not None:
+                block.count = self.profile.labels[block.label]
+                labels[block.label] = block
+
+        for block in blocks[1:]:
+            previous = blocks[block.index - 1]
+            if block.label is None and previous.falls_through():
+                # Only reached by falling through an if-goto, when it didn't jump. A label after the if-goto
+                # is only reached by its jumps or through this block, so its count bounds the jumps.
+                target = labels.get(previous.jump_target())
+                jumps = target.count if target is not None and target.index > previous.index else 0
+                block.count = max(previous.count - jumps, 0)
+            block.cold = block.count == 0 or any(
+                isinstance(command, vmcommands.Call) and command.func_name in self.cold_functions
+                for command in block.commands)
+
+    @staticmethod
+    def _order_blocks(blocks: list[_Block]) -> list[_Block]:
+        labels = {block.label: block for block in blocks if block.label is not None}
+        order = [blocks[0]]
+        placed = {0}
+        while True:
+            current = order[-1]
+            successors = []
+            if current.falls_through() and current.index + 1 < len(blocks):
+                successors.append(blocks[current.index + 1])
+            target = labels.get(current.jump_target())
+            if target is not None:
+                successors.append(target)
+            # On a tie the block that already followed stays next
+            candidates = [block for block in successors if block.index not in placed and not block.cold]
+            if not candidates:
+                candidates = [block for block in blocks if block.index not in placed and not block.cold]
+            if not candidates:
+                break
+            next_block = max(candidates, key=lambda block: (block.count, block.index == current.index + 1,
+                                                            -block.index))
+            order.append(next_block)
+            placed.add(next_block.index)
+
+        order += [block for block in blocks if block.cold]
+        return order
+
+    def _link_blocks(self, function: VMFunction, blocks: list[_Block], order: list[_Block]) -> list[VMCommand]:
+        # Blocks that are jumped to after the reordering, but were only fallen into before, get a label
+        def label_of(block: _Block) -> str:
+            if block.label is None:
+                block.commands.insert(0, vmcommands.Label.create(f"{function.name}$layout_{block.index}"))
+            return block.label
+
+        # The ends of the blocks are decided first, since deciding them adds labels at the starts of blocks.
+        # Every end is the number of commands removed from the block and the commands added instead.
+        endings = {}
+        for position, block in enumerate(order):
+            next_block = order[position + 1] if position + 1 < len(order) else None
+            successor = blocks[block.index + 1] if block.falls_through() else None
+            if isinstance(block.last, vmcommands.Goto) and next_block is not None and \
+                    next_block.label == block.last.label:
+                endings[block.index] = (1, [])
+                self.removed_gotos += 1
+            elif successor is not None and successor is not next_block:
+                if isinstance(block.last, vmcommands.IfGoto) and next_block is not None and \
+                        next_block.label == block.last.label and _can_invert(block.commands):
+                    endings[block.index] = _invert_branch(block.commands, label_of(successor))
+                    self.inverted_branches += 1
+                else:
+                    endings[block.index] = (0, [vmcommands.Goto.create(label_of(successor))])
+                    self.added_gotos += 1
+
+        code = []
+        for block in order:
+            removed, added = endings.get(block.index, (0, []))
+            code += block.commands[:len(block.commands) - removed] + added
+        return code
+
+    def report(self) -> str:
+        return (f"Moved {self.moved_blocks} blocks, inverted {self.inverted_branches} branches, "
+                f"removed {self.removed_gotos} gotos and added {self.added_gotos} gotos")
+
+
+def _falls_through(command: VMCommand) -> bool:
+    return not isinstance(command, (vmcommands.Goto, vmcommands.Return))
+
+
+def _chain_functions(functions: list[VMFunction]) -> list[list[VMFunction]]:
+    # A function that falls into the next function stays right before it, so they are moved together
+    chains = []
+    falls_into_next = False
+    for function in functions:
+        if falls_into_next:
+            chains[-1].append(function)
+        else:
+            chains.append([function])
+        falls_into_next = _falls_through(function.commands[-1][1])
+    return chains
+
+
+def _split_blocks(commands: list[VMCommand]) -> list[_Block]:
+    blocks = []
+    for command in commands:
+        if not blocks or isinstance(command, vmcommands.Label) or not blocks[-1].falls_through() or \
+                isinstance(blocks[-1].last, vmcommands.IfGoto):
+            blocks.append(_Block(len(blocks)))
+        blocks[-1].commands.append(command)
+    return blocks
+
+
+def _can_invert(code: list[VMCommand]) -> bool:
+    # Comparisons push exactly 0 or -1, so only a comparison result can be negated by removing or adding a not
+    if len(code) >= 3 and isinstance(code[-2], vmcommands.Not) and isinstance(code[-3], COMPARISONS):
+        return True
+    return len(code) >= 2 and isinstance(code[-2], COMPARISONS)
+
+
+def _invert_branch(code: list[VMCommand], label: str) -> tuple[int, list[VMCommand]]:
+    if isinstance(code[-2], vmcommands.Not):
+        return 2, [vmcommands.IfGoto.create(label)]
+    return 1, [vmcommands.Not([]), vmcommands.IfGoto.create(label)]
@@ -0,0 +1,260 @@
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+from vmtranslator import vmcommands
+from vmtranslator.vmcommands import VMCommand, Segment
+
+# A parsed command along with the line it came from, which the generator uses for unique labels
+NumberedCommand = tuple[int, VMCommand]
+
+WORD_MASK = 0xFFFF
+MIN_PUSH_VALUE = -32767
+
+UNARY_OPERATIONS = {
+    vmcommands.Neg: lambda x: -x,
+    vmcommands.Not: lambda x: ~x,
+}
+
+BINARY_OPERATIONS = {
+    vmcommands.Add: lambda x, y: x + y,
+    vmcommands.Sub: lambda x, y: x - y,
+    vmcommands.And: lambda x, y: x & y,
+    vmcommands.Or: lambda x, y: x | y,
+    # The comparisons are done like the templates do them, by checking the sign of the 16-bit x-y
+    vmcommands.EQ: lambda x, y: -1 if _to_signed(x - y) == 0 else 0,
+    vmcommands.GT: lambda x, y: -1 if _to_signed(x - y) > 0 else 0,
+    vmcommands.LT: lambda x, y: -1 if _to_signed(x - y) < 0 else 0,
+}
+
+COMPARISONS = (vmcommands.EQ, vmcommands.GT, vmcommands.LT)
+
+# Commands that end a straight-line run of code, either by being jumped to or by jumping away
+BLOCK_BOUNDARIES = (vmcommands.Label, vmcommands.Function, vmcommands.Goto, vmcommands.IfGoto,
+                    vmcommands.Call, vmcommands.Return,
+                    vmcommands.CompareGoto, vmcommands.NotIfGoto, vmcommands.PushIfGoto)
+
+DISCARD_SEGMENT = Segment.temp
+DISCARD_INDEX = 0
+
+
+class VMRule(object):
+    """
+    Replaces a window of consecutive commands at the end of the optimized output.
+    The window never contains a label or a function, since those may be reached from elsewhere.
+
+    :param apply: Gets the window, returns the replacement or None if the rule doesn't apply
+    """
+
+    def __init__(self, name: str, size: int, apply: Callable[[list[VMCommand]], Optional[list[VMCommand]]]):
+        self.name = name
+        self.size = size
+        self.apply = apply
+
+
+def _to_signed(value: int) -> int:
+    value &= WORD_MASK
+    return value - (WORD_MASK + 1) if value & 0x8000 else value
+
+
+def _constant_value(command: VMCommand) -> Optional[int]:
+    if isinstance(command, vmcommands.PushValue):
+        return command.value
+    if isinstance(command, vmcommands.Push) and command.segment == Segment.constant:
+        return command.i
+    return None
+
+
+def _push_value(value: int) -> Optional[list[VMCommand]]:
+    value = _to_signed(value)
+    # -32768 can't be loaded with a single A-instruction, so it is better left to the arithmetic
+    if value < MIN_PUSH_VALUE:
+        return None
+    return [vmcommands.PushValue(value)]
+
+
+def _fold_unary(window):
+    push, operation = window
+    value = _constant_value(push)
+    if value is None or type(operation) not in UNARY_OPERATIONS:
+        return None
+    return _push_value(UNARY_OPERATIONS[type(operation)](value))
+
+
+def _fold_binary(window):
+    first, second, operation = window
+    x = _constant_value(first)
+    y = _constant_value(second)
+    if x is None or y is None or type(operation) not in BINARY_OPERATIONS:
+        return None
+    return _push_value(BINARY_OPERATIONS[type(operation)](x, y))
+
+
+def _push_pop_move(window):
+    push, pop = window
+    if not isinstance(pop, vmcommands.Pop):
+        return None
+    value = _constant_value(push)
+    if value is not None:
+        return [vmcommands.Move(Segment.constant, value, pop.segment, pop.i)]
+    if isinstance(push, vmcommands.Push):
+        return [vmcommands.Move(push.segment, push.i, pop.segment, pop.i)]
+    return None
+
+
+def _compare_not_goto(window):
+    comparison, negation, if_goto = window
+    if isinstance(comparison, COMPARISONS) and isinstance(negation, vmcommands.Not) \
+            and isinstance(if_goto, vmcommands.IfGoto):
+        return [vmcommands.CompareGoto(type(comparison), if_goto.label, negated=True)]
+    return None
+
+
+def _compare_goto(window):
+    comparison, if_goto = window
+    if isinstance(comparison, COMPARISONS) and isinstance(if_goto, vmcommands.IfGoto):
+        return [vmcommands.CompareGoto(type(comparison), if_goto.label)]
+    return None
+
+
+def _not_goto(window):
+    negation, if_goto = window
+    if isinstance(negation, vmcommands.Not) and isinstance(if_goto, vmcommands.IfGoto):
+        return [vmcommands.NotIfGoto(if_goto.label)]
+    return None
+
+
+def _push_goto(window):
+    push, if_goto = window
+    if not isinstance(if_goto, vmcommands.IfGoto):
+        return None
+    value = _constant_value(push)
+    if value is not None:
+        # The branch is decided already
+        return [vmcommands.Goto.create(if_goto.label)] if value != 0 else []
+    if isinstance(push, vmcommands.Push):
+        return [vmcommands.PushIfGoto(push.segment, push.i, if_goto.label)]
+    return None
+
+
+DEFAULT_RULES = (
+    VMRule("fold-unary", 2, _fold_unary),
+    VMRule("fold-binary", 3, _fold_binary),
+    VMRule("push-pop-move", 2, _push_pop_move),
+    VMRule("compare-not-goto", 3, _compare_not_goto),
+    VMRule("compare-goto", 2, _compare_goto),
+    VMRule("not-goto", 2, _not_goto),
+    VMRule("push-goto", 2, _push_goto),
+)
+
+
+class VMOptimizer(object):
+    """
+    Rewrites a parsed VM command stream into an equivalent, shorter one before it is translated.
+    Besides the window rules, pops to temp 0 whose value is never read are replaced with a discard,
+    as the Jack compiler does after every "do" statement.
+    The value of temp 0 is assumed to not be passed between functions, which holds for compiled Jack code.
+    """
+
+    def __init__(self, rules: Iterable[VMRule] = DEFAULT_RULES, discard_pops=True):
+        self.rules = tuple(rules)
+        self.discard_pops = discard_pops
+        self.hits = Counter()
+        self.removed = Counter()
+
+    def optimize(self, commands: Iterable[NumberedCommand]) -> list[NumberedCommand]:
+        output = []
+        # Index in the output from which windows may start, i.e. after the last label or function
+        window_start = 0
+        for line_number, command in commands:
+            output.append((line_number, command))
+            if isinstance(command, (vmcommands.Label, vmcommands.Function)):
+                window_start = len(output)
+                continue
+
+            while self._apply_first_rule(output, window_start):
+                pass
+
+        if self.discard_pops and self._is_temp_block_local(output):
+            output = self._discard_unused_pops(output)
+
+        return output
+
+    def _apply_first_rule(self, output: list[NumberedCommand], window_start: int) -> bool:
+        for rule in self.rules:
+            start = len(output) - rule.size
+            if start < window_start:
+                continue
+            window = [command for _, command in output[start:]]
+            replacement = rule.apply(window)
+            if replacement is not None:
+                # The replacement takes the line number of the last command, which the generator hasn't used yet
+                line_number = output[-1][0]
+                output[start:] = [(line_number, command) for command in replacement]
+                self.hits[rule.name] += 1
+                self.removed[rule.name] += rule.size - len(replacement)
+                return True
+        return False
+
+    def _is_temp_block_local(self, commands: list[NumberedCommand]) -> bool:
+        """
+        Checks that temp 0 is always written in a block before it is read there,
+        so no value of it outlives the block that wrote it.
+        """
+        written = False
+        for _, command in commands:
+            if _reads_discard_location(command) and not written:
+                return False
+            if isinstance(command, BLOCK_BOUNDARIES):
+                written = False
+            elif _writes_discard_location(command):
+                written = True
+        return True
+
+    def _discard_unused_pops(self, commands: list[NumberedCommand]) -> list[NumberedCommand]:
+        output = []
+        # Index in the output of the last pop to temp 0, as long as its value wasn't read yet
+        unread_pop = None
+        for line_number, command in commands:
+            if _reads_discard_location(command):
+                unread_pop = None
+            if isinstance(command, BLOCK_BOUNDARIES) or _writes_discard_location(command):
+                if unread_pop is not None:
+                    output[unread_pop] = (output[unread_pop][0], vmcommands.Discard())
+                    self.hits["discard"] += 1
+                unread_pop = None
+
+            output.append((line_number, command))
+            if isinstance(command, vmcommands.Pop) and _is_discard_location(command.segment, command.i):
+                unread_pop = len(output) - 1
+
+        if unread_pop is not None:
+            output[unread_pop] = (output[unread_pop][0], vmcommands.Discard())
+            self.hits["discard"] += 1
+        return output
+
+    def report(self) -> str:
+        lines = [f"{'rule':<24}{'hits':>8}{'removed':>10}"]
+        for name, hits in self.hits.most_common():
+            lines.append(f"{name:<24}{hits:>8}{self.removed[name]:>10}")
+        lines.append(f"{'total':<24}{sum(self.hits.values()):>8}{sum(self.removed.values()):>10}")
+        return "\n".join(lines)
+
+
+def _is_discard_location(segment: Segment, i: int) -> bool:
+    return segment == DISCARD_SEGMENT and i == DISCARD_INDEX
+
+
+def _reads_discard_location(command: VMCommand) -> bool:
+    if isinstance(command, (vmcommands.Push, vmcommands.PushIfGoto)):
+        return _is_discard_location(command.segment, command.i)
+    if isinstance(command, vmcommands.Move):
+        return _is_discard_location(command.source_segment, command.source_i)
+    return False
+
+
+def _writes_discard_location(command: VMCommand) -> bool:
+    if isinstance(command, vmcommands.Pop):
+        return _is_discard_location(command.segment, command.i)
+    if isinstance(command, vmcommands.Move):
+        return _is_discard_location(command.dest_segment, command.dest_i)
+    return False
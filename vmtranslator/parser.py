@@ -1,3 +1,6 @@
+from types import MappingProxyType
+from typing import Iterable, Iterator
+
 from vmtranslator import vmcommands
 from vmtranslator.errors import TranslatorError
 from vmtranslator.vmcommands import VMCommand
@@ -27,13 +30,74 @@ NAME_TO_COMMAND = {
 }
 
 
+# The commands without arguments hold no state, so all their lines share one command
+SHARED_COMMANDS = MappingProxyType({name: command_class([]) for name, command_class in NAME_TO_COMMAND.items()
+                                    if issubclass(command_class, vmcommands.NoArgsCommand)})
+
+# Raw lines that were already parsed in a run of parse_lines, mapped to their text and command
+LINE_CACHE_MAX_SIZE = 4096
+EMPTY_LINE = ("", None)
+
+
 def parse_line(line: str) -> VMCommand:
     parts = line.split()
     command_name = parts[0]
-    if command_name not in NAME_TO_COMMAND:
+    command_class = NAME_TO_COMMAND.get(command_name)
+    if command_class is None:
         raise TranslatorError("Unknown command")
-    command_class = NAME_TO_COMMAND[command_name]
-    return command_class(parts[1:])
+    args = command_class.parse_args(parts[1:])
+    shared = SHARED_COMMANDS.get(command_name)
+    if shared is not None:
+        return shared
+    return command_class.create(*args)
+
+
+def parse_lines(lines: Iterable[str]) -> Iterator[tuple[int, str, VMCommand]]:
+    """
+    Parses VM code lazily. Lines that repeat are parsed once and share their command, since commands are
+    never changed after they are parsed.
+
+    :return: For every line with a command, its number, its text without the comment and the command
+    """
+    line_cache = {}
+    line_number = 0
+    for original_line in lines:
+        line_number += 1
+        cached = line_cache.get(original_line)
+        if cached is None:
+            line = strip_line(original_line)
+            if line == "":
+                cached = EMPTY_LINE
+            else:
+                try:
+                    cached = (line, parse_line(line))
+                except TranslatorError as e:
+                    e.line = line
+                    e.lineno = line_number
+                    raise
+            if len(line_cache) < LINE_CACHE_MAX_SIZE:
+                line_cache[original_line] = cached
+
+        line, command = cached
+        if command is not None:
+            yield line_number, line, command
+
+
+def parse_text(text: str) -> Iterator[tuple[int, VMCommand]]:
+    """
+    :return: The commands of the code with their line numbers
+    """
+    for line_number, _, command in parse_lines(text.splitlines()):
+        yield line_number, command
+
+
+def parse_file(file_path: str) -> Iterator[tuple[int, VMCommand]]:
+    """
+    :return: The commands of the .vm file with their line numbers
+    """
+    with open(file_path) as f:
+        for line_number, _, command in parse_lines(f):
+            yield line_number, command
 
 
 def strip_line(line: str) -> str:
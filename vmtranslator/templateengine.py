@@ -0,0 +1,169 @@
+import re
+from typing import Iterable, Optional, Union
+
+from hackassembler.instructions import AInstruction, CInstruction, Instruction, Label, parse_instruction
+
+COMMENT_PREFIX = "//"
+
+# A parameter that fills a whole field, like @{i}, so its value is used as is
+WHOLE_SLOT_REGEX = re.compile(r"^{(\w+)}$")
+SLOT_REGEX = re.compile(r"{(\w+)}")
+
+# A line of generated code, either a comment or an instruction
+CodeLine = Union[str, Instruction]
+
+
+class AsmCode(object):
+    """
+    Generated code, kept as instruction records along with the comments between them,
+    so it can be given to the assembler or an optimizer without parsing it again.
+    """
+    __slots__ = ("lines", "_text", "_words")
+
+    def __init__(self, lines: Iterable[CodeLine] = (), words: Optional[int] = None):
+        """
+        :param words: The number of words of the code, when it is already known
+        """
+        self.lines = tuple(lines)
+        self._text = None
+        self._words = words
+
+    def __add__(self, other: "AsmCode") -> "AsmCode":
+        words = None if self._words is None or other._words is None else self._words + other._words
+        return AsmCode(self.lines + other.lines, words)
+
+    def __mul__(self, times: int) -> "AsmCode":
+        return AsmCode(self.lines * times, None if self._words is None else self._words * times)
+
+    def __eq__(self, other):
+        return isinstance(other, AsmCode) and self.lines == other.lines
+
+    def __hash__(self):
+        return hash(self.lines)
+
+    def __str__(self):
+        if self._text is None:
+            self._text = "".join(f"{line}\n" for line in self.lines)
+        return self._text
+
+    def instructions(self) -> list[Instruction]:
+        return [line for line in self.lines if not isinstance(line, str)]
+
+    def word_count(self) -> int:
+        """
+        :return: The number of words the code takes in the ROM, which labels don't take
+        """
+        if self._words is None:
+            self._words = sum(1 for line in self.lines if _is_word(line))
+        return self._words
+
+
+EMPTY_CODE = AsmCode(words=0)
+
+
+def _is_word(line: CodeLine) -> bool:
+    return not isinstance(line, (str, Label))
+
+
+class _Slot(object):
+    """
+    A field of a template line that contains parameters.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        whole = WHOLE_SLOT_REGEX.match(text)
+        self.param = whole.group(1) if whole else None
+
+    def fill(self, params: dict):
+        if self.param is not None:
+            return params[self.param]
+        return self.text.format(**params)
+
+
+class _AddressLine(object):
+    def __init__(self, value: str):
+        self.value = _Slot(value)
+
+    def render(self, params: dict) -> AInstruction:
+        value = self.value.fill(params)
+        if isinstance(value, str) and value.isdigit():
+            value = int(value)
+        return AInstruction(value)
+
+
+class _LabelLine(object):
+    def __init__(self, name: str):
+        self.name = _Slot(name)
+
+    def render(self, params: dict) -> Label:
+        return Label(str(self.name.fill(params)))
+
+
+class _ComputeLine(object):
+    def __init__(self, line: str):
+        dest = jump = None
+        if "=" in line:
+            dest, line = line.split("=", 1)
+        if ";" in line:
+            line, jump = line.split(";", 1)
+        self.dest = dest
+        self.comp = _Slot(line)
+        self.jump = None if jump is None else _Slot(jump)
+
+    def render(self, params: dict) -> CInstruction:
+        jump = None if self.jump is None else str(self.jump.fill(params))
+        return CInstruction(self.dest, str(self.comp.fill(params)), jump)
+
+
+class _StaticLine(object):
+    def __init__(self, line: CodeLine):
+        self.line = line
+
+    def render(self, params: dict) -> CodeLine:
+        return self.line
+
+
+class _CommentLine(object):
+    def __init__(self, text: str):
+        self.text = text
+
+    def render(self, params: dict) -> str:
+        return self.text.format(**params)
+
+
+class AsmTemplate(object):
+    """
+    An assembly template compiled into instruction records. Lines without parameters are parsed once,
+    and the rest are parsed into slots that are filled by render.
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.params = frozenset(SLOT_REGEX.findall(text))
+        self.lines = tuple(_compile_line(line) for line in text.splitlines())
+        # Only the address and compute lines, and the static instructions, take a word
+        self.words = sum(1 for line in self.lines if isinstance(line, (_AddressLine, _ComputeLine)) or
+                         isinstance(line, _StaticLine) and _is_word(line.line))
+        self._static_code = None if self.params else AsmCode((line.render({}) for line in self.lines), self.words)
+
+    def render(self, **params) -> AsmCode:
+        if self._static_code is not None:
+            return self._static_code
+        return AsmCode((line.render(params) for line in self.lines), self.words)
+
+    def __str__(self):
+        return self.name
+
+
+def _compile_line(line: str):
+    if line.startswith(COMMENT_PREFIX) or line == "":
+        return _CommentLine(line) if SLOT_REGEX.search(line) else _StaticLine(line)
+    if SLOT_REGEX.search(line) is None:
+        return _StaticLine(parse_instruction(line))
+
+    if line.startswith("@"):
+        return _AddressLine(line[1:])
+    if line.startswith("("):
+        return _LabelLine(line[1:-1])
+    return _ComputeLine(line)
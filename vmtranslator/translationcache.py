@@ -0,0 +1,134 @@
+import glob
+import hashlib
+import json
+import os
+from collections import Counter
+from functools import lru_cache
+from typing import Optional
+
+from vmtranslator.codesize import CodeSizeStats
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "vmtranslator")
+DEFAULT_MAX_SIZE = 64 * 2 ** 20
+ENTRY_EXTENSION = ".json"
+
+PACKAGE_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(PACKAGE_PATH)
+# The translator builds its code out of the instruction records of the assembler, and the hack backend assembles it
+FINGERPRINT_PATTERNS = (
+    os.path.join("vmtranslator", "*.py"),
+    os.path.join("vmtranslator", "asm_templates", "**", "*.asm"),
+    os.path.join("hackassembler", "*.py"),
+)
+
+
+class TranslatedFile(object):
+    """
+    The translation of a single .vm file of a folder, with the statistics of the optimizer that ran on it
+    and the sizes of its code.
+    """
+
+    def __init__(self, code: str, hits: Counter = None, removed: Counter = None, sizes: CodeSizeStats = None):
+        self.code = code
+        self.hits = Counter() if hits is None else hits
+        self.removed = Counter() if removed is None else removed
+        self.sizes = CodeSizeStats() if sizes is None else sizes
+
+    def to_json(self) -> dict:
+        return {"version": CACHE_VERSION, "code": self.code, "hits": self.hits, "removed": self.removed,
+                "sizes": self.sizes.to_json()}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "TranslatedFile":
+        return cls(data["code"], Counter(data["hits"]), Counter(data["removed"]),
+                   CodeSizeStats.from_json(data["sizes"]))
+
+
+@lru_cache(maxsize=None)
+def translator_fingerprint() -> str:
+    """
+    A hash of the code and the templates of the translator and the assembler, so a cached translation is never used
+    after they change.
+    """
+    digest = hashlib.sha256()
+    file_names = [file_name for pattern in FINGERPRINT_PATTERNS
+                  for file_name in glob.glob(pattern, root_dir=ROOT_PATH, recursive=True)]
+    for file_name in sorted(file_names):
+        digest.update(file_name.encode())
+        with open(os.path.join(ROOT_PATH, file_name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class TranslationCache(object):
+    """
+    Keeps the translations of .vm files on disk, by the hash of their content and of everything else that affects
+    the output. When the entries take more than max_size bytes, evict removes the least recently used ones.
+    It scans the whole cache, so it is called once per translation rather than for every entry that was put.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size: int = DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, source: bytes, file_name: str, generator_options: tuple, optimizer_options: tuple) -> str:
+        # The file name is a part of the output, in the header and in the names of the static variables
+        digest = hashlib.sha256()
+        options = (CACHE_VERSION, translator_fingerprint(), file_name, generator_options, optimizer_options)
+        digest.update(repr(options).encode())
+        digest.update(source)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[TranslatedFile]:
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path) as f:
+                data = json.load(f)
+            translated = TranslatedFile.from_json(data)
+        except (OSError, ValueError, KeyError):
+            # Missing, or left corrupted by an interrupted write of another process
+            self.misses += 1
+            return None
+
+        # The modification time is the last use, for the eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            # Evicted by another process after it was read
+            pass
+        self.hits += 1
+        return translated
+
+    def put(self, key: str, translated: TranslatedFile):
+        entry_path = self._entry_path(key)
+        temp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(translated.to_json(), f)
+        os.replace(temp_path, entry_path)
+
+    def evict(self):
+        entries = []
+        for file_name in glob.iglob("*" + ENTRY_EXTENSION, root_dir=self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total_size -= size
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ENTRY_EXTENSION)
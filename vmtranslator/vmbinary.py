@@ -0,0 +1,219 @@
+import struct
+import sys
+import zlib
+from array import array
+from typing import IO, Iterable, Iterator
+
+from vmtranslator import parser, vmcommands
+from vmtranslator.errors import BytecodeFormatError, TranslatorError
+from vmtranslator.vmcommands import Segment, VMCommand
+
+VMB_EXTENSION = ".vmb"
+
+# magic, version, flags, number of names, number of commands, crc32 of everything after the header
+VMB_HEADER = struct.Struct("<4sHHIII")
+VMB_MAGIC = b"HVMB"
+VMB_VERSION = 1
+
+# The string table holds every function and label name once, each as its length and its UTF-8 bytes
+NAME_LENGTH = struct.Struct("<H")
+
+# opcode, segment, operand, index of the name in the string table.
+# The operand is the index of a push or a pop, or the number of arguments or locals of a call or a function.
+# A record is 8 bytes long, so the records are read as one 64 bit integer each, which is cheap to look up.
+COMMAND_RECORD = struct.Struct("<BBHI")
+MAX_OPERAND = 0xFFFF
+
+OPCODE_TO_COMMAND = (
+    vmcommands.Push,
+    vmcommands.Pop,
+    vmcommands.Add,
+    vmcommands.Sub,
+    vmcommands.Neg,
+    vmcommands.EQ,
+    vmcommands.GT,
+    vmcommands.LT,
+    vmcommands.And,
+    vmcommands.Or,
+    vmcommands.Not,
+    vmcommands.Call,
+    vmcommands.Function,
+    vmcommands.Return,
+    vmcommands.Label,
+    vmcommands.Goto,
+    vmcommands.IfGoto,
+)
+COMMAND_TO_OPCODE = {command_class: opcode for opcode, command_class in enumerate(OPCODE_TO_COMMAND)}
+
+SEGMENT_CODES = tuple(Segment)
+SEGMENT_TO_CODE = {segment: code for code, segment in enumerate(SEGMENT_CODES)}
+
+
+class BytecodeEncoder(object):
+    """
+    Collects VM commands as bytecode records, and interns the names they use in the string table.
+    The header counts the names and the commands, so the file is only written once all the commands were added.
+    """
+
+    def __init__(self):
+        self.names: dict[str, int] = {}
+        self.records = bytearray()
+        self.n_commands = 0
+
+    def add(self, command: VMCommand):
+        opcode = COMMAND_TO_OPCODE.get(type(command))
+        if opcode is None:
+            raise TranslatorError(f"{type(command).__name__} has no bytecode", str(command))
+
+        segment = operand = name = 0
+        if isinstance(command, vmcommands.PushPopCommand):
+            segment = SEGMENT_TO_CODE[command.segment]
+            operand = command.i
+        elif isinstance(command, vmcommands.Call):
+            name = self._name_index(command.func_name)
+            operand = command.n_args
+        elif isinstance(command, vmcommands.Function):
+            name = self._name_index(command.func_name)
+            operand = command.n_vars
+        elif isinstance(command, vmcommands.BranchingCommand):
+            name = self._name_index(command.label)
+        if operand > MAX_OPERAND:
+            raise TranslatorError(f"The operand {operand} doesn't fit in 16 bits", str(command))
+
+        self.records += COMMAND_RECORD.pack(opcode, segment, operand, name)
+        self.n_commands += 1
+
+    def _name_index(self, name: str) -> int:
+        index = self.names.get(name)
+        if index is None:
+            index = self.names[name] = len(self.names)
+        return index
+
+    def getvalue(self) -> bytes:
+        body = bytearray()
+        for name in self.names:
+            encoded_name = name.encode()
+            body += NAME_LENGTH.pack(len(encoded_name))
+            body += encoded_name
+        body += self.records
+        header = VMB_HEADER.pack(VMB_MAGIC, VMB_VERSION, 0, len(self.names), self.n_commands, zlib.crc32(body))
+        return header + body
+
+
+def write_vmb(commands: Iterable[VMCommand], output_stream: IO[bytes]):
+    encoder = BytecodeEncoder()
+    for command in commands:
+        encoder.add(command)
+    output_stream.write(encoder.getvalue())
+
+
+def parse_vmb(data: bytes) -> Iterator[tuple[int, str, VMCommand]]:
+    """
+    Decodes bytecode lazily, the same as parser.parse_lines parses text. Records that repeat are decoded once
+    and share their command.
+
+    :return: For every command, its number in the file starting from 1, its text in VM code and the command
+    """
+    n_names, n_commands = _parse_header(data)
+    names, offset = _parse_names(data, n_names)
+    end = offset + n_commands * COMMAND_RECORD.size
+    if len(data) != end:
+        raise BytecodeFormatError(f"Header declares {n_commands} commands but the file has "
+                                  f"{(len(data) - offset) / COMMAND_RECORD.size:g}")
+
+    records = array("Q")
+    records.frombytes(memoryview(data)[offset:end])
+    if sys.byteorder == "big":
+        records.byteswap()
+
+    record_cache = {}
+    for command_number, record in enumerate(records, 1):
+        cached = record_cache.get(record)
+        if cached is None:
+            try:
+                command = _decode_record(COMMAND_RECORD.unpack(record.to_bytes(COMMAND_RECORD.size, "little")), names)
+            except TranslatorError as e:
+                e.lineno = command_number
+                raise
+            cached = (str(command), command)
+            if len(record_cache) < parser.LINE_CACHE_MAX_SIZE:
+                record_cache[record] = cached
+
+        line, command = cached
+        yield command_number, line, command
+
+
+def read_vmb(input_stream: IO[bytes]) -> Iterator[tuple[int, VMCommand]]:
+    """
+    :return: The commands of the .vmb file with their numbers
+    """
+    for command_number, _, command in parse_vmb(input_stream.read()):
+        yield command_number, command
+
+
+def vm_to_vmb(text: str) -> bytes:
+    """
+    Encodes VM code as bytecode. Only the comments and the layout of the lines are lost.
+    """
+    encoder = BytecodeEncoder()
+    for _, _, command in parser.parse_lines(text.splitlines()):
+        encoder.add(command)
+    return encoder.getvalue()
+
+
+def vmb_to_vm(data: bytes) -> str:
+    """
+    Decodes bytecode as VM code, with a command in every line.
+    """
+    return "".join(f"{line}\n" for _, line, _ in parse_vmb(data))
+
+
+def _parse_header(data: bytes) -> tuple[int, int]:
+    if len(data) < VMB_HEADER.size:
+        raise BytecodeFormatError("File is too short to be a .vmb file")
+
+    magic, version, flags, n_names, n_commands, checksum = VMB_HEADER.unpack_from(data)
+    if magic != VMB_MAGIC:
+        raise BytecodeFormatError(f"Bad magic {magic!r}, this is not a .vmb file")
+    if version != VMB_VERSION:
+        raise BytecodeFormatError(f"Unsupported .vmb version {version}")
+    if zlib.crc32(memoryview(data)[VMB_HEADER.size:]) != checksum:
+        raise BytecodeFormatError("Checksum mismatch, the bytecode is corrupted")
+    return n_names, n_commands
+
+
+def _parse_names(data: bytes, n_names: int) -> tuple[list[str], int]:
+    names = []
+    offset = VMB_HEADER.size
+    for _ in range(n_names):
+        if offset + NAME_LENGTH.size > len(data):
+            raise BytecodeFormatError(f"Header declares {n_names} names but the file is truncated")
+        name_length, = NAME_LENGTH.unpack_from(data, offset)
+        offset += NAME_LENGTH.size
+        try:
+            name = data[offset:offset + name_length].decode()
+        except UnicodeDecodeError:
+            raise BytecodeFormatError(f"Name {len(names)} of the string table is not valid UTF-8")
+        offset += name_length
+        names.append(vmcommands.parse_name(name, len(names)))
+    return names, offset
+
+
+def _decode_record(record: tuple[int, int, int, int], names: list[str]) -> VMCommand:
+    opcode, segment, operand, name = record
+    if opcode >= len(OPCODE_TO_COMMAND):
+        raise BytecodeFormatError(f"Unknown opcode {opcode}")
+    command_class = OPCODE_TO_COMMAND[opcode]
+
+    shared = parser.SHARED_COMMANDS.get(command_class.keyword)
+    if shared is not None:
+        return shared
+    if issubclass(command_class, vmcommands.PushPopCommand):
+        if segment >= len(SEGMENT_CODES):
+            raise BytecodeFormatError(f"Unknown segment code {segment}")
+        return command_class.create(SEGMENT_CODES[segment], operand)
+    if name >= len(names):
+        raise BytecodeFormatError(f"Name {name} is not in the string table of {len(names)} names")
+    if issubclass(command_class, vmcommands.BranchingCommand):
+        return command_class.create(names[name])
+    return command_class.create(names[name], operand)
@@ -1,4 +1,5 @@
 import re
+import sys
 from enum import Enum
 
 from vmtranslator.errors import TranslatorError
@@ -17,127 +18,299 @@ class Segment(Enum):
 
 VALID_SYMBOL_REGEX = re.compile(r"^([a-zA-Z_.][a-zA-Z_.$0-9]*)$")
 
+SEGMENTS = {segment.value: segment for segment in Segment}
+
+# Names that were already checked, interned so that every use of a label or a function shares one string
+NAMES_CACHE_MAX_SIZE = 65536
+_checked_names: dict[str, str] = {}
+
+
+def parse_segment(text: str, i: int) -> Segment:
+    segment = SEGMENTS.get(text)
+    if segment is None:
+        raise TranslatorError(f"Got an unknown segment {text}")
+    return segment
+
+
+def parse_index(text: str, i: int) -> int:
+    if not text.isdigit():
+        raise TranslatorError(f"Argument {i} must be numeric, got {text}")
+    return int(text)
 
-class VMCommand(object):
-    def _verify_args(self, args: list[str], expected_types=()):
-        if len(args) != len(expected_types):
-            raise TranslatorError(f"Got {len(args)} arguments but {len(expected_types)} are expected")
 
-        for i, expected_type in enumerate(expected_types):
-            if expected_type == Segment:
-                segment = args[i]
-                if segment not in Segment:
-                    raise TranslatorError(f"Got an unknown segment {segment}")
+def parse_name(text: str, i: int) -> str:
+    name = _checked_names.get(text)
+    if name is None:
+        if VALID_SYMBOL_REGEX.match(text) is None:
+            raise TranslatorError(f"Got an invalid label name {text} at argument {i}")
+        name = sys.intern(text)
+        if len(_checked_names) < NAMES_CACHE_MAX_SIZE:
+            _checked_names[name] = name
+    return name
 
-            elif expected_type == int:
-                num = args[i]
-                if not num.isdigit():
-                    raise TranslatorError(f"Argument {i} must be numeric, got {num}")
 
-            elif expected_type == "Label":
-                name = args[i]
-                if VALID_SYMBOL_REGEX.match(name) is None:
-                    raise TranslatorError(f"Got an invalid label name {name} at argument {i}")
+class VMCommand(object):
+    __slots__ = ()
+    # The command's name in VM code
+    keyword = ""
+    # The functions that parse and check every argument of the command in VM code
+    argument_parsers = ()
 
-            elif expected_type is None:
-                continue  # Ignore type check
+    def __str__(self):
+        return self.keyword
 
-            else:
-                raise TranslatorError(f"Could not handle type check for type {expected_type}")
+    @classmethod
+    def parse_args(cls, args: list[str]) -> list:
+        if len(args) != len(cls.argument_parsers):
+            raise TranslatorError(f"Got {len(args)} arguments but {len(cls.argument_parsers)} are expected")
+        return [parse(arg, i) for i, (parse, arg) in enumerate(zip(cls.argument_parsers, args))]
 
 
 class NoArgsCommand(VMCommand):
+    __slots__ = ()
+
     def __init__(self, args: list[str]):
-        self._verify_args(args, ())
+        self.parse_args(args)
 
 
 class ArithmeticCommand(NoArgsCommand):
-    pass
+    __slots__ = ()
 
 
 class PushPopCommand(VMCommand):
+    __slots__ = ("segment", "i")
+    argument_parsers = (parse_segment, parse_index)
+
     def __init__(self, args: list[str]):
-        self._verify_args(args, (Segment, int))
-        segment, i = args
-        self.segment = Segment[segment]
-        self.i = int(i)
+        self.segment, self.i = self.parse_args(args)
+
+    @classmethod
+    def create(cls, segment: Segment, i: int) -> "PushPopCommand":
+        """
+        Makes the command from arguments that were already checked.
+        """
+        command = cls.__new__(cls)
+        command.segment = segment
+        command.i = i
+        return command
+
+    def __str__(self):
+        return f"{self.keyword} {self.segment.value} {self.i}"
 
 
 class Push(PushPopCommand):
-    pass
+    __slots__ = ()
+    keyword = "push"
 
 
 class Pop(PushPopCommand):
-    pass
+    __slots__ = ()
+    keyword = "pop"
 
 
 class Add(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "add"
 
 
 class Sub(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "sub"
 
 
 class Neg(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "neg"
 
 
 class EQ(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "eq"
 
 
 class GT(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "gt"
 
 
 class LT(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "lt"
 
 
 class And(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "and"
 
 
 class Or(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "or"
 
 
 class Not(ArithmeticCommand):
-    pass
+    __slots__ = ()
+    keyword = "not"
 
 
 class Call(VMCommand):
+    __slots__ = ("func_name", "n_args")
+    keyword = "call"
+    argument_parsers = (parse_name, parse_index)
+
     def __init__(self, args: list[str]):
-        self._verify_args(args, ("Label", int))
-        self.func_name = args[0]
-        self.n_args = int(args[1])
+        self.func_name, self.n_args = self.parse_args(args)
+
+    @classmethod
+    def create(cls, func_name: str, n_args: int) -> "Call":
+        command = cls.__new__(cls)
+        command.func_name = func_name
+        command.n_args = n_args
+        return command
+
+    def __str__(self):
+        return f"{self.keyword} {self.func_name} {self.n_args}"
 
 
 class Function(VMCommand):
+    __slots__ = ("func_name", "n_vars")
+    keyword = "function"
+    argument_parsers = (parse_name, parse_index)
+
     def __init__(self, args: list[str]):
-        self._verify_args(args, ("Label", int))
-        self.func_name = args[0]
-        self.n_vars = int(args[1])
+        self.func_name, self.n_vars = self.parse_args(args)
+
+    @classmethod
+    def create(cls, func_name: str, n_vars: int) -> "Function":
+        command = cls.__new__(cls)
+        command.func_name = func_name
+        command.n_vars = n_vars
+        return command
+
+    def __str__(self):
+        return f"{self.keyword} {self.func_name} {self.n_vars}"
 
 
 class Return(NoArgsCommand):
-    pass
+    __slots__ = ()
+    keyword = "return"
 
 
 class BranchingCommand(VMCommand):
+    __slots__ = ("label",)
+    argument_parsers = (parse_name,)
+
     def __init__(self, args: list[str]):
-        self._verify_args(args, ("Label",))
-        self.label = args[0]
+        self.label, = self.parse_args(args)
+
+    @classmethod
+    def create(cls, label: str) -> "BranchingCommand":
+        command = cls.__new__(cls)
+        command.label = label
+        return command
+
+    def __str__(self):
+        return f"{self.keyword} {self.label}"
 
 
 class Label(BranchingCommand):
-    pass
+    __slots__ = ()
+    keyword = "label"
 
 
 class Goto(BranchingCommand):
-    pass
+    __slots__ = ()
+    keyword = "goto"
 
 
 class IfGoto(BranchingCommand):
-    pass
+    __slots__ = ()
+    keyword = "if-goto"
+
+
+# Commands created by the optimizer. They have no textual VM form, so their str() is only a description.
+
+
+class PushValue(VMCommand):
+    """
+    Pushes any 16-bit value, including negative ones that can't be written as "push constant".
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value: int):
+        self.value = value
+
+    def __str__(self):
+        return f"push value {self.value}"
+
+
+class Move(VMCommand):
+    """
+    A push immediately followed by a pop, which copies the value without going through the stack.
+    The source segment may be constant, in which case source_i is the value and may be negative.
+    """
+    __slots__ = ("source_segment", "source_i", "dest_segment", "dest_i")
+
+    def __init__(self, source_segment: Segment, source_i: int, dest_segment: Segment, dest_i: int):
+        self.source_segment = source_segment
+        self.source_i = source_i
+        self.dest_segment = dest_segment
+        self.dest_i = dest_i
+
+    def __str__(self):
+        return f"move {self.source_segment.value} {self.source_i} to {self.dest_segment.value} {self.dest_i}"
+
+
+class Discard(VMCommand):
+    """
+    Drops the top of the stack, like popping to a location that is never read.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return "discard"
+
+
+class CompareGoto(VMCommand):
+    """
+    A comparison followed by an if-goto, optionally with a "not" between them.
+    Jumps when the comparison holds, or when it doesn't if negated.
+    """
+    __slots__ = ("comparison", "label", "negated")
+
+    def __init__(self, comparison: type, label: str, negated=False):
+        self.comparison = comparison
+        self.label = label
+        self.negated = negated
+
+    def __str__(self):
+        negation = "not " if self.negated else ""
+        return f"if-goto {self.label} if {negation}{self.comparison.keyword}"
+
+
+class NotIfGoto(VMCommand):
+    """
+    A "not" followed by an if-goto, which jumps unless the popped value is true (-1).
+    """
+    __slots__ = ("label",)
+
+    def __init__(self, label: str):
+        self.label = label
+
+    def __str__(self):
+        return f"if-goto {self.label} if not"
+
+
+class PushIfGoto(VMCommand):
+    """
+    A push followed by an if-goto, which tests the value without going through the stack.
+    """
+    __slots__ = ("segment", "i", "label")
+
+    def __init__(self, segment: Segment, i: int, label: str):
+        self.segment = segment
+        self.i = i
+        self.label = label
+
+    def __str__(self):
+        return f"if-goto {self.label} if {self.segment.value} {self.i}"
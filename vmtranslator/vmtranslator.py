@@ -1,75 +1,296 @@
 import glob
 import io
 import os.path
-from typing import IO, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import IO, Iterable, Iterator, Optional, Union
 
-from vmtranslator import parser, asmgenerator
+from vmtranslator import parser, asmgenerator, vmbinary
+from vmtranslator.codesize import CodeSizeStats
+from vmtranslator.deadcode import DeadFunctionEliminator
 from vmtranslator.errors import TranslatorError
-from vmtranslator.parser import strip_line
+from vmtranslator.inliner import VMInliner
+from vmtranslator.layout import ProfileLayout
+from vmtranslator.optimizer import VMOptimizer, VMRule
+from vmtranslator.templateengine import AsmCode
+from vmtranslator.translationcache import TranslatedFile, TranslationCache
+from vmtranslator.vmcommands import VMCommand
+
+VM_EXTENSION = ".vm"
+
+# The text of a .vm file, or the bytecode of a .vmb file
+VMSource = Union[str, bytes]
 
 
 class VMTranslator(object):
 
-    def __init__(self, asm_generator):
+    def __init__(self, asm_generator, optimizer: Optional[VMOptimizer] = None):
         self.asm_generator = asm_generator
+        self.optimizer = optimizer
 
     def translate(self, input_stream: IO[str], output_stream: IO[str]):
-        line_number = 0
-        for original_line in input_stream:
-            line_number += 1
-            line = strip_line(original_line)
-            if line == "":
-                continue
+        self._write(self.generate(input_stream), output_stream)
+
+    def translate_binary(self, input_stream: IO[bytes], output_stream: IO[str]):
+        self._write(self.generate_binary(input_stream), output_stream)
+
+    def _write(self, generated: Iterable[tuple[str, AsmCode]], output_stream: IO[str]):
+        for line, code in generated:
             output_stream.write(f"// {line}\n")
+            output_stream.write(str(code))
+            output_stream.write("\n")
+        output_stream.write(self.asm_generator.generate_flush())
+
+    def generate(self, input_stream: IO[str]) -> Iterator[tuple[str, AsmCode]]:
+        """
+        Translates the input without writing it, and without the code that flushes the cached top of the stack.
+
+        :return: The commands, as they are written in the comments of the output, along with their code
+        """
+        return self.generate_parsed(parser.parse_lines(input_stream))
+
+    def generate_binary(self, input_stream: IO[bytes]) -> Iterator[tuple[str, AsmCode]]:
+        """
+        Translates a .vmb file the same as generate, without parsing any text.
+        """
+        return self.generate_parsed(vmbinary.parse_vmb(input_stream.read()))
+
+    def generate_parsed(self, lines: Iterable[tuple[int, str, VMCommand]]) -> Iterator[tuple[str, AsmCode]]:
+        """
+        :param lines: The number, the text and the command of every line, as parser.parse_lines returns them
+        """
+        if self.optimizer is not None:
+            yield from self._generate_optimized(lines)
+            return
+
+        for line_number, line, command in lines:
             try:
-                command = parser.parse_line(line)
-                asm_code = self.asm_generator.generate_asm(command, line_number)
-                output_stream.write(asm_code)
-                output_stream.write("\n")
+                code = self.asm_generator.generate_code(command, line_number)
             except TranslatorError as e:
                 e.line = line
                 e.lineno = line_number
                 raise
+            yield line, code
+
+    def _generate_optimized(self, lines: Iterable[tuple[int, str, VMCommand]]) -> Iterator[tuple[str, AsmCode]]:
+        # The optimizer works on whole runs of commands, so the input is parsed before anything is generated
+        commands = []
+        texts = {}
+        for line_number, line, command in lines:
+            commands.append((line_number, command))
+            texts[line_number] = line
+
+        for line_number, command in self.optimizer.optimize(commands):
+            try:
+                code = self.asm_generator.generate_code(command, line_number)
+            except TranslatorError as e:
+                e.line = texts[line_number]
+                e.lineno = line_number
+                raise
+            yield str(command), code
+
+
+@dataclass(frozen=True)
+class TranslationEngine(object):
+    """
+    The options of a translation, which never change, so one engine can translate any number of files at once
+    from different threads or processes. Every call gets a fresh generator and optimizer as its context,
+    and the calls only share the templates, which are immutable.
+
+    :param optimizer_rules: Optimize with these rules before translating, or don't optimize when it is None
+    """
+    shared_routines: bool = False
+    cache_top: bool = False
+    optimizer_rules: Optional[tuple[VMRule, ...]] = None
+    discard_pops: bool = True
+
+    @classmethod
+    def from_generator(cls, asm_generator: asmgenerator.AsmGenerator,
+                       optimizer: Optional[VMOptimizer] = None) -> "TranslationEngine":
+        if optimizer is None:
+            return cls(asm_generator.shared_routines, asm_generator.cache_top)
+        return cls(asm_generator.shared_routines, asm_generator.cache_top, optimizer.rules, optimizer.discard_pops)
+
+    @property
+    def generator_options(self) -> tuple:
+        return self.shared_routines, self.cache_top
+
+    def new_optimizer(self) -> Optional[VMOptimizer]:
+        if self.optimizer_rules is None:
+            return None
+        return VMOptimizer(self.optimizer_rules, self.discard_pops)
+
+    def translate(self, source: VMSource, file_name: str) -> TranslatedFile:
+        """
+        Translates the code of one file, with its header, the same as a file of a folder.
+        """
+        return translate_fragment(source, file_name, self.generator_options, self.new_optimizer())
 
 
 class VMFolderTranslator(object):
-    def __init__(self, folder_path, asm_generator: asmgenerator.AsmGenerator):
+    """
+    Translates every file of the folder separately, and concatenates them in sorted order after the bootstrap code.
+    The files only share the code generation options, so they can be translated in parallel,
+    and the output is the same for any number of workers.
+
+    :param threads: Translate the files in threads instead of processes, which only run at once on a free-threaded
+        Python, but don't have to start and to send the code to other processes
+    :param cache: Reuse the translations of files that didn't change since they were kept in this cache
+    :param layout: Reorder the functions and blocks of the files by an execution profile
+    :param inliner: Inline calls to small functions, before removing the functions that can't be reached
+    :param eliminator: Translate only the functions that the program can reach
+    """
+
+    def __init__(self, folder_path, asm_generator: asmgenerator.AsmGenerator,
+                 optimizer: Optional[VMOptimizer] = None, max_workers=1,
+                 cache: Optional[TranslationCache] = None, eliminator: Optional[DeadFunctionEliminator] = None,
+                 inliner: Optional[VMInliner] = None, layout: Optional[ProfileLayout] = None, threads=False):
         self.folder_path = folder_path
         self.asm_generator = asm_generator
+        self.optimizer = optimizer
+        self.max_workers = max_workers
+        self.threads = threads
+        self.cache = cache
+        self.eliminator = eliminator
+        self.inliner = inliner
+        self.layout = layout
 
     def translate(self, output_stream: IO[str]):
         init = self.asm_generator.generate_init()
         output_stream.write(init)
         output_stream.write("\n")
 
-        translated_files = 0
-        for file_name in glob.iglob("**/*.vm", root_dir=self.folder_path, recursive=True):
-            print(f"Translating {file_name}")
-            translated_files += 1
-            self._write_header(file_name, output_stream)
-            self.asm_generator.set_source_file(file_name)
+        # The whole program passes work on text, otherwise the bytecode of .vmb files is translated as it is
+        whole_program = self.layout is not None or self.inliner is not None or self.eliminator is not None
+        sources = read_vm_files(self.folder_path, keep_binary=not whole_program)
+        if self.layout is not None:
+            sources = self.layout.apply(sources)
+        if self.inliner is not None:
+            sources = self.inliner.inline(sources)
+        if self.eliminator is not None:
+            sources = self.eliminator.eliminate(sources, self._generator_options())
+        file_names = list(sources)
+        fragments: list[Optional[TranslatedFile]] = [None] * len(file_names)
+        keys = []
+        if self.cache is not None:
+            keys = [self._cache_key(sources[file_name], file_name) for file_name in file_names]
+            fragments = [self.cache.get(key) for key in keys]
+
+        missing = [index for index, fragment in enumerate(fragments) if fragment is None]
+        missing_names = [file_names[index] for index in missing]
+        translated = self._translate_files([sources[file_name] for file_name in missing_names], missing_names)
+        for index, fragment in zip(missing, translated):
+            print(f"Translating {file_names[index]}")
+            fragments[index] = fragment
+            if self.cache is not None:
+                self.cache.put(keys[index], fragment)
+        if self.cache is not None and missing:
+            self.cache.evict()
+
+        for fragment in fragments:
+            output_stream.write(fragment.code)
+            if self.asm_generator.stats is not None:
+                self.asm_generator.stats.update(fragment.sizes)
+            if self.optimizer is not None:
+                self.optimizer.hits.update(fragment.hits)
+                self.optimizer.removed.update(fragment.removed)
+
+    def _generator_options(self) -> tuple:
+        return self.asm_generator.shared_routines, self.asm_generator.cache_top
+
+    def _cache_key(self, source: VMSource, file_name: str) -> str:
+        optimizer_options = None
+        if self.optimizer is not None:
+            optimizer_options = (tuple(rule.name for rule in self.optimizer.rules), self.optimizer.discard_pops)
+        data = source if isinstance(source, bytes) else source.encode()
+        return self.cache.make_key(data, file_name, self._generator_options(), optimizer_options)
+
+    def _translate_files(self, sources: list[VMSource], file_names: list[str]) -> list[TranslatedFile]:
+        # Every file counts its own statistics, which are added to the optimizer afterwards
+        engine = TranslationEngine.from_generator(self.asm_generator, self.optimizer)
+        if self.max_workers > 1 and len(file_names) > 1:
+            executor_class = ThreadPoolExecutor if self.threads else ProcessPoolExecutor
+            with executor_class(max_workers=self.max_workers) as executor:
+                return list(executor.map(engine.translate, sources, file_names))
+        return list(map(engine.translate, sources, file_names))
+
+
+def translate_fragment(source: VMSource, file_name: str, generator_options: tuple,
+                       optimizer: Optional[VMOptimizer]) -> TranslatedFile:
+    """
+    Translates the code of one file of a folder, with its header, in a fresh generator.
 
-            file_path = os.path.join(self.folder_path, file_name)
+    :return: The code, with the statistics of the optimizer on the file and the sizes of its code
+    """
+    # The sizes are always recorded, so a cached translation has them whenever they are asked for
+    sizes = CodeSizeStats()
+    asm_generator = asmgenerator.AsmGenerator(*generator_options, stats=sizes)
+    asm_generator.set_source_file(file_name)
+    translator = VMTranslator(asm_generator, optimizer)
+    with io.StringIO() as output:
+        write_file_header(file_name, output)
+        if isinstance(source, bytes):
+            with io.BytesIO(source) as f:
+                translator.translate_binary(f, output)
+        else:
+            with io.StringIO(source) as f:
+                translator.translate(f, output)
+        if optimizer is None:
+            return TranslatedFile(output.getvalue(), sizes=sizes)
+        return TranslatedFile(output.getvalue(), optimizer.hits, optimizer.removed, sizes)
+
+
+def list_vm_files(folder_path: str) -> list[str]:
+    """
+    :return: The .vm and .vmb files in the folder, in sorted order
+    """
+    file_names = sorted(glob.glob(f"**/*{VM_EXTENSION}", root_dir=folder_path, recursive=True) +
+                        glob.glob(f"**/*{vmbinary.VMB_EXTENSION}", root_dir=folder_path, recursive=True))
+    if not file_names:
+        raise RuntimeError("There are no .vm files in the given directory")
+
+    # Both would be translated with the same statics
+    modules = set()
+    for file_name in file_names:
+        module = os.path.splitext(file_name)[0]
+        if module in modules:
+            raise RuntimeError(f"{module} is in the directory both as a .vm and as a .vmb file")
+        modules.add(module)
+    return file_names
+
+
+def read_vm_files(folder_path: str, keep_binary=False) -> dict[str, VMSource]:
+    """
+    :param keep_binary: Return the bytecode of .vmb files as it is, instead of decoding it to text
+    :return: The code of every .vm and .vmb file in the folder, by the file name in sorted order
+    """
+    sources = {}
+    for file_name in list_vm_files(folder_path):
+        file_path = os.path.join(folder_path, file_name)
+        if file_name.endswith(vmbinary.VMB_EXTENSION):
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            sources[file_name] = data if keep_binary else vmbinary.vmb_to_vm(data)
+        else:
             with open(file_path) as f:
-                translator = VMTranslator(self.asm_generator)
-                translator.translate(f, output_stream)
-        if translated_files == 0:
-            raise RuntimeError("There are no .vm files in the given directory")
-
-    def _write_header(self, file_path: str, output_stream):
-        header = f"// {file_path}"
-        output_stream.write("/" * len(header))
-        output_stream.write("\n")
-        output_stream.write(header)
-        output_stream.write("\n")
-        output_stream.write("/" * len(header))
-        output_stream.write("\n")
+                sources[file_name] = f.read()
+    return sources
+
+
+def write_file_header(file_path: str, output_stream: IO[str]):
+    header = f"// {file_path}"
+    output_stream.write("/" * len(header))
+    output_stream.write("\n")
+    output_stream.write(header)
+    output_stream.write("\n")
+    output_stream.write("/" * len(header))
+    output_stream.write("\n")
 
 
-def translate_text(code: str, filename="code.vm") -> str:
+def translate_text(code: str, filename="code.vm", optimizer: Optional[VMOptimizer] = None) -> str:
     asm_gen = asmgenerator.AsmGenerator()
     asm_gen.set_source_file(filename)
-    vm_translator = VMTranslator(asm_gen)
+    vm_translator = VMTranslator(asm_gen, optimizer)
     with io.StringIO(code) as source:
         with io.StringIO() as output:
             vm_translator.translate(source, output)
@@ -77,28 +298,43 @@ def translate_text(code: str, filename="code.vm") -> str:
             return output.read()
 
 
-def translate_file(input_file: str, output_file: Optional[str] = None) -> str:
+def translate_file(input_file: str, output_file: Optional[str] = None,
+                   optimizer: Optional[VMOptimizer] = None, shared_routines=False,
+                   cache_top=False, stats: Optional[CodeSizeStats] = None) -> str:
     if output_file is None:
-        output_file = input_file.replace(".vm", ".asm")
+        output_file = os.path.splitext(input_file)[0] + ".asm"
 
-    asm_generator = asmgenerator.AsmGenerator()
+    asm_generator = asmgenerator.AsmGenerator(shared_routines, cache_top, stats)
     asm_generator.set_source_file(output_file)
-    translator = VMTranslator(asm_generator)
-    with open(input_file, 'r') as vm_file:
+    translator = VMTranslator(asm_generator, optimizer)
+    binary = input_file.endswith(vmbinary.VMB_EXTENSION)
+    with open(input_file, 'rb' if binary else 'r') as vm_file:
         with open(output_file, 'w') as asm_file:
-            translator.translate(vm_file, asm_file)
+            if shared_routines:
+                asm_file.write(asm_generator.generate_runtime(skip=True))
+                asm_file.write("\n")
+            if binary:
+                translator.translate_binary(vm_file, asm_file)
+            else:
+                translator.translate(vm_file, asm_file)
 
     return output_file
 
 
-def translate_folder(folder_path: str, output_file: Optional[str] = None) -> str:
+def translate_folder(folder_path: str, output_file: Optional[str] = None,
+                     optimizer: Optional[VMOptimizer] = None, shared_routines=False,
+                     cache_top=False, max_workers=1, cache: Optional[TranslationCache] = None,
+                     eliminator: Optional[DeadFunctionEliminator] = None,
+                     inliner: Optional[VMInliner] = None, layout: Optional[ProfileLayout] = None,
+                     stats: Optional[CodeSizeStats] = None, threads=False) -> str:
     if output_file is None:
         folder_path = os.path.normpath(folder_path)
         basename = os.path.basename(folder_path) + ".asm"
         output_file = os.path.join(folder_path, basename)
 
-    asm_generator = asmgenerator.AsmGenerator()
-    folder_translator = VMFolderTranslator(folder_path, asm_generator)
+    asm_generator = asmgenerator.AsmGenerator(shared_routines, cache_top, stats)
+    folder_translator = VMFolderTranslator(folder_path, asm_generator, optimizer, max_workers, cache,
+                                           eliminator, inliner, layout, threads)
     with open(output_file, 'w') as asm_file:
         folder_translator.translate(asm_file)
 